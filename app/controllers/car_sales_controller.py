@@ -1,10 +1,86 @@
-from typing import List, Optional, Dict, Any
-from fastapi import HTTPException
-from ..models.schemas import CarSale, CarSaleCreate, CarSaleUpdate, TreeStats
-from ..models.binary_tree import BinarySearchTree
+from typing import List, Optional, Dict, Any, Iterable, Iterator
+from datetime import datetime
+from itertools import islice
+from fastapi import HTTPException, Response
+from ..models.schemas import (
+    CarSale, CarSaleCreate, CarSaleUpdate, TreeStats, RankResult, Color,
+    PathQuery, PathResult, BulkItemResult, BulkInsertResult, AggregatesResult,
+    DayCount, SalesHistogram,
+)
+from pydantic import ValidationError
+from ..models.engines import create_tree
+from ..models.loader import TreeLoader
+from ..models.btree_store import BTreeStore
+from ..models.records import CarRecord, sale_micros
+from ..utils.metrics import REGISTRY, profile_span
+from ..utils.fast_json import records_json
+from ..utils.http_cache import (
+    ResponseCache, make_etag, etag_matches, not_modified, json_with_etag, render_json,
+    versioned_response,
+)
 
-# Initialize the binary search tree
-car_sales_tree = BinarySearchTree()
+# Binary search tree (engine chosen by CAR_SALES_TREE_ENGINE), loaded in the background
+# once the app starts: importing this module does not read the snapshot
+car_sales_tree = TreeLoader(create_tree)
+
+
+def _tree_gauge(read):
+    # /metrics no espera a la carga: mientras tanto el valor es 0
+    def value():
+        tree = car_sales_tree.loaded
+        return read(tree) if tree is not None else 0
+    return value
+
+
+# Métricas que se leen del árbol al consultar /metrics
+REGISTRY.gauge("car_sales_tree_ready", "1 once the tree has finished loading", lambda: int(car_sales_tree.ready))
+REGISTRY.gauge("car_sales_tree_height", "Current height of the tree", _tree_gauge(lambda tree: tree.height))
+REGISTRY.gauge("car_sales_tree_nodes", "Car sales stored in the tree", _tree_gauge(len))
+REGISTRY.gauge("car_sales_tree_version", "Writes published since startup", _tree_gauge(lambda tree: tree.version))
+REGISTRY.gauge("car_sales_persistence_pending_writes", "Writes not yet persisted by the background persister",
+               _tree_gauge(lambda tree: tree.pending_writes))
+
+
+def _page_cache_gauge(stat: str):
+    # Solo el motor btree tiene caché de páginas: con los demás el valor es 0
+    return _tree_gauge(lambda tree: tree.cache_stats()[stat] if isinstance(tree, BTreeStore) else 0)
+
+
+REGISTRY.gauge("car_sales_btree_page_cache_hits_total", "B-tree page reads served from the cache",
+               _page_cache_gauge('hits'), kind="counter")
+REGISTRY.gauge("car_sales_btree_page_cache_misses_total", "B-tree page reads that went to disk",
+               _page_cache_gauge('misses'), kind="counter")
+REGISTRY.gauge("car_sales_btree_cached_pages", "B-tree pages held in memory", _page_cache_gauge('cached_pages'))
+REGISTRY.gauge("car_sales_btree_dirty_pages", "B-tree pages waiting for a checkpoint", _page_cache_gauge('dirty_pages'))
+
+# Cantidad de registros agrupados en cada bloque enviado por streaming
+STREAM_BATCH_SIZE = 500
+
+# Máximo de consultas de camino aceptadas en una sola petición
+MAX_PATH_QUERIES = 1000
+
+# Máximo de ventas aceptadas en una carga masiva
+MAX_BULK_ITEMS = 100000
+
+# Respuestas serializadas de los endpoints de todo el árbol, válidas para una versión
+response_cache = ResponseCache()
+
+
+def _ndjson_chunks(sales: Iterable[CarSale]) -> Iterator[str]:
+    """Serialize car sales as NDJSON, grouping lines into chunks"""
+    batch = []
+    for sale in sales:
+        batch.append(sale.json())
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield "\n".join(batch) + "\n"
+            batch = []
+    if batch:
+        yield "\n".join(batch) + "\n"
+
+def _check_date_range(start_date: Optional[datetime], end_date: Optional[datetime]):
+    # Se comparan en UTC: mezclar fechas con y sin zona horaria no es un error
+    if start_date is not None and end_date is not None and sale_micros(start_date) > sale_micros(end_date):
+        raise HTTPException(status_code=400, detail="start_date must not be later than end_date")
 
 class CarSalesController:
     @staticmethod
@@ -27,6 +103,49 @@ class CarSalesController:
             
         return result
 
+    @staticmethod
+    def bulk_create_car_sales(items: List[Any], upsert: bool = True) -> BulkInsertResult:
+        """Validate and insert many car sales with a single persistence flush"""
+        if len(items) > MAX_BULK_ITEMS:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ITEMS} car sales per request")
+
+        results: List[Optional[BulkItemResult]] = [None] * len(items)
+        valid = []
+        positions = []
+        for index, item in enumerate(items):
+            try:
+                if isinstance(item, (str, bytes)):
+                    car_sale = CarSaleCreate.parse_raw(item)
+                else:
+                    car_sale = CarSaleCreate.parse_obj(item)
+            except (ValidationError, ValueError) as e:
+                plate = item.get("license_plate") if isinstance(item, dict) else None
+                results[index] = BulkItemResult(
+                    index=index, license_plate=plate, status="invalid", error=str(e)
+                )
+                continue
+            valid.append(car_sale)
+            positions.append(index)
+
+        inserted = car_sales_tree.bulk_insert(valid, upsert=upsert)
+        for index, (status, record) in zip(positions, inserted):
+            results[index] = BulkItemResult(
+                index=index, license_plate=record.license_plate, status=status, id=record.id
+            )
+
+        return BulkInsertResult(
+            created=sum(1 for r in results if r.status == "created"),
+            updated=sum(1 for r in results if r.status == "updated"),
+            failed=sum(1 for r in results if r.status in ("conflict", "invalid")),
+            results=results
+        )
+
+    @staticmethod
+    def bulk_create_car_sales_ndjson(content: bytes, upsert: bool = True) -> BulkInsertResult:
+        """Insert car sales uploaded as NDJSON (one JSON object per line)"""
+        lines = [line for line in content.splitlines() if line.strip()]
+        return CarSalesController.bulk_create_car_sales(lines, upsert)
+
     @staticmethod
     def get_car_sale(license_plate: str) -> CarSale:
         """Get a car sale by license plate"""
@@ -35,12 +154,31 @@ class CarSalesController:
             raise HTTPException(status_code=404, detail="Car sale not found")
         return sale
 
+    @staticmethod
+    def get_car_sale_response(license_plate: str, if_none_match: Optional[str] = None) -> Response:
+        """Get a car sale with an ETag from its per-plate version (304 if unchanged)"""
+        found = car_sales_tree.find_versioned(license_plate)
+        if not found:
+            raise HTTPException(status_code=404, detail="Car sale not found")
+        sale, version = found
+        etag = make_etag(car_sales_tree.etag_scope, version)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        return json_with_etag(render_json(sale), etag)
+
+    @staticmethod
+    def _tree_response(key, if_none_match: Optional[str], build, render=render_json) -> Response:
+        """Response for a tree-wide endpoint, cached and tagged with the tree version"""
+        return versioned_response(
+            response_cache, key, car_sales_tree.etag_scope, car_sales_tree.etag_version,
+            if_none_match, build, render, cache_version=car_sales_tree.version
+        )
+
     @staticmethod
     def update_car_sale(license_plate: str, update_data: CarSaleUpdate) -> CarSale:
         """Update a car sale"""
         # Get the existing sale to ensure it exists
-        existing = car_sales_tree.find(license_plate)
-        if not existing:
+        if license_plate not in car_sales_tree:
             raise HTTPException(status_code=404, detail="Car sale not found")
             
         # Convert update data to dict and remove None values
@@ -61,21 +199,153 @@ class CarSalesController:
         return True
 
     @staticmethod
-    def get_tree_traversal(order: str) -> List[CarSale]:
-        """Get tree traversal in the specified order"""
+    def _traversal_page(order: str, offset: int = 0, limit: Optional[int] = None,
+                        after: Optional[str] = None) -> Iterator[CarSale]:
+        """Lazily iterate one page of a traversal"""
+        records = CarSalesController._traversal_page_records(order, offset, limit, after)
+        return (record.to_model() for record in records)
+
+    @staticmethod
+    def _check_traversal(order: str, after: Optional[str] = None):
+        if order not in ("inorder", "preorder", "postorder"):
+            raise HTTPException(status_code=400, detail="Invalid traversal order")
+        if after is not None and order != "inorder":
+            raise HTTPException(status_code=400, detail="Cursor pagination is only supported for inorder")
+
+    @staticmethod
+    def _traversal_page_records(order: str, offset: int = 0, limit: Optional[int] = None,
+                                after: Optional[str] = None) -> Iterator[CarRecord]:
+        """Lazily iterate the stored records of one page of a traversal"""
+        CarSalesController._check_traversal(order, after)
         if order == "inorder":
-            return car_sales_tree.in_order_traversal()
-        elif order == "preorder":
-            return car_sales_tree.pre_order_traversal()
-        elif order == "postorder":
-            return car_sales_tree.post_order_traversal()
+            # El árbol guarda tamaños de subárbol: se salta al k-ésimo nodo en O(log n)
+            records = car_sales_tree.iter_records_from(offset, after)
         else:
-            raise HTTPException(status_code=400, detail="Invalid traversal order")
+            records = islice(car_sales_tree.iter_traversal_records(order), offset, None)
+        if limit is not None:
+            records = islice(records, limit)
+        return records
+
+    @staticmethod
+    def get_tree_traversal(order: str, offset: int = 0, limit: Optional[int] = None,
+                           after: Optional[str] = None) -> List[CarSale]:
+        """Get tree traversal in the specified order"""
+        with profile_span("traversal"):
+            return list(CarSalesController._traversal_page(order, offset, limit, after))
 
     @staticmethod
-    def get_tree_statistics() -> TreeStats:
-        """Get tree statistics"""
-        return car_sales_tree.get_tree_stats()
+    def get_tree_traversal_response(order: str, offset: int = 0, limit: Optional[int] = None,
+                                    after: Optional[str] = None,
+                                    if_none_match: Optional[str] = None) -> Response:
+        """Get a tree traversal page with an ETag (304 if the tree has not changed)"""
+        return CarSalesController._tree_response(
+            ("traversal", order, offset, limit, after), if_none_match,
+            lambda: CarSalesController.get_tree_traversal(order, offset, limit, after)
+        )
+
+    @staticmethod
+    def get_tree_traversal_fast(order: str, offset: int = 0, limit: Optional[int] = None,
+                                after: Optional[str] = None,
+                                if_none_match: Optional[str] = None) -> Response:
+        """Traversal page encoded straight from the stored records (no models, no re-validation)"""
+        CarSalesController._check_traversal(order, after)
+        return CarSalesController._tree_response(
+            ("traversal-fast", order, offset, limit, after), if_none_match,
+            lambda: CarSalesController._traversal_page_records(order, offset, limit, after),
+            records_json
+        )
+
+    @staticmethod
+    def stream_tree_traversal(order: str, offset: int = 0, limit: Optional[int] = None,
+                              after: Optional[str] = None) -> Iterator[str]:
+        """Stream the tree traversal in the specified order as NDJSON"""
+        return _ndjson_chunks(CarSalesController._traversal_page(order, offset, limit, after))
+
+    @staticmethod
+    def get_range(start: Optional[str] = None, end: Optional[str] = None,
+                  prefix: Optional[str] = None, limit: int = 100) -> List[CarSale]:
+        """Get car sales whose plate is in [start, end] and/or begins with prefix"""
+        if start is not None and end is not None and start > end:
+            raise HTTPException(status_code=400, detail="start must not be greater than end")
+        return list(islice(car_sales_tree.iter_range(start, end, prefix), limit))
+
+    @staticmethod
+    def filter_car_sales(brand: Optional[str] = None, color: Optional[Color] = None,
+                         min_price: Optional[float] = None, max_price: Optional[float] = None,
+                         start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                         limit: int = 100) -> List[CarSale]:
+        """Get car sales matching brand, color, price range and sale date range"""
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise HTTPException(status_code=400, detail="min_price must not be greater than max_price")
+        _check_date_range(start_date, end_date)
+        sales = car_sales_tree.filter(brand, color, min_price, max_price, start_date, end_date)
+        return sales[:limit]
+
+    @staticmethod
+    def get_sales_by_date(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                          offset: int = 0, limit: int = 100) -> List[CarSale]:
+        """Get car sales in a sale date range, ordered by sale date"""
+        _check_date_range(start_date, end_date)
+        return car_sales_tree.sales_by_date(start_date, end_date, offset, limit)
+
+    @staticmethod
+    def get_sales_histogram(start_date: Optional[datetime] = None,
+                            end_date: Optional[datetime] = None) -> SalesHistogram:
+        """Get the number of sales per UTC day in a sale date range"""
+        _check_date_range(start_date, end_date)
+        days = [DayCount(day=day, count=count)
+                for day, count in car_sales_tree.sales_histogram(start_date, end_date)]
+        return SalesHistogram(total=sum(day.count for day in days), days=days)
+
+    @staticmethod
+    def get_sales_histogram_response(start_date: Optional[datetime] = None,
+                                     end_date: Optional[datetime] = None,
+                                     if_none_match: Optional[str] = None) -> Response:
+        """Get the daily sales histogram with an ETag (304 if the tree has not changed)"""
+        _check_date_range(start_date, end_date)
+        return CarSalesController._tree_response(
+            ("sales-histogram", start_date, end_date), if_none_match,
+            lambda: CarSalesController.get_sales_histogram(start_date, end_date)
+        )
+
+    @staticmethod
+    def get_rank(license_plate: str) -> RankResult:
+        """Get the in-order position of a license plate"""
+        if license_plate not in car_sales_tree:
+            raise HTTPException(status_code=404, detail="Car sale not found")
+        return RankResult(
+            license_plate=license_plate,
+            rank=car_sales_tree.rank(license_plate),
+            total=len(car_sales_tree)
+        )
+
+    @staticmethod
+    def get_aggregates(group_by: Optional[str] = None) -> AggregatesResult:
+        """Get the running price aggregates by brand, color and sale month"""
+        return AggregatesResult(**car_sales_tree.get_aggregates(group_by))
+
+    @staticmethod
+    def get_aggregates_response(group_by: Optional[str] = None,
+                                if_none_match: Optional[str] = None) -> Response:
+        """Get the price aggregates with an ETag (304 if the tree has not changed)"""
+        return CarSalesController._tree_response(
+            ("aggregates", group_by), if_none_match,
+            lambda: CarSalesController.get_aggregates(group_by)
+        )
+
+    @staticmethod
+    def get_tree_statistics(verify: bool = False, levels: bool = False) -> TreeStats:
+        """Get tree statistics (optionally recomputed to verify the cached values)"""
+        if verify:
+            return car_sales_tree.verify_tree_stats()
+        return car_sales_tree.get_tree_stats(levels)
+
+    @staticmethod
+    def get_tree_statistics_response(levels: bool = False, if_none_match: Optional[str] = None) -> Response:
+        """Get tree statistics with an ETag (304 if the tree has not changed)"""
+        return CarSalesController._tree_response(
+            ("stats", levels), if_none_match, lambda: car_sales_tree.get_tree_stats(levels)
+        )
 
     @staticmethod
     def get_path_between_nodes(start_plate: str, end_plate: str) -> List[CarSale]:
@@ -85,6 +355,30 @@ class CarSalesController:
             raise HTTPException(status_code=404, detail="One or both nodes not found")
         return path
 
+    @staticmethod
+    def get_path_between_nodes_fast(start_plate: str, end_plate: str) -> Response:
+        """Path between two nodes encoded straight from the stored records"""
+        path = car_sales_tree.find_path_records(start_plate, end_plate)
+        if not path:
+            raise HTTPException(status_code=404, detail="One or both nodes not found")
+        return Response(content=records_json(path), media_type="application/json")
+
+    @staticmethod
+    def get_paths_between_nodes(queries: List[PathQuery]) -> List[PathResult]:
+        """Get the paths for several pairs of nodes in one request"""
+        if len(queries) > MAX_PATH_QUERIES:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_PATH_QUERIES} path queries per request")
+        results = []
+        for query in queries:
+            path = car_sales_tree.find_path(query.start_plate, query.end_plate)
+            results.append(PathResult(
+                start_plate=query.start_plate,
+                end_plate=query.end_plate,
+                found=path is not None,
+                path=path or []
+            ))
+        return results
+
     @staticmethod
     def get_longest_path() -> List[CarSale]:
         """Get the longest path in the tree"""
@@ -92,3 +386,20 @@ class CarSalesController:
         if not path:
             raise HTTPException(status_code=404, detail="Tree is empty")
         return path
+
+    @staticmethod
+    def get_longest_path_response(if_none_match: Optional[str] = None) -> Response:
+        """Get the longest path with an ETag (304 if the tree has not changed)"""
+        return CarSalesController._tree_response(
+            ("longest-path",), if_none_match, CarSalesController.get_longest_path
+        )
+
+    @staticmethod
+    def get_longest_path_fast(if_none_match: Optional[str] = None) -> Response:
+        """Longest path encoded straight from the stored records, with an ETag"""
+        if len(car_sales_tree) == 0:
+            raise HTTPException(status_code=404, detail="Tree is empty")
+        return CarSalesController._tree_response(
+            ("longest-path-fast",), if_none_match,
+            car_sales_tree.find_longest_path_records, records_json
+        )
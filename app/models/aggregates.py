@@ -0,0 +1,264 @@
+from typing import Optional, List, Dict, Iterable, Callable, Any, Tuple
+from collections import Counter
+from heapq import heappush, heappop, heapify
+from operator import itemgetter
+from .records import CarRecord, COLORS
+from .indexes import DAY_US, brand_key, sale_day, day_date, group_by_code
+from .snapshot import SnapshotColumns
+
+# Mes ("YYYY-MM") de cada día ya visto: strftime una vez por día, no una por registro
+_MONTHS: Dict[int, str] = {}
+
+
+def day_month(day: int) -> str:
+    """Month of a UTC day number as "YYYY-MM" """
+    month = _MONTHS.get(day)
+    if month is None:
+        month = _MONTHS[day] = day_date(day).strftime("%Y-%m")
+    return month
+
+
+def sale_month(record: CarRecord) -> str:
+    """UTC month of the sale as "YYYY-MM" """
+    return day_month(sale_day(record.sale_us))
+
+
+class PriceGroup:
+    """Running count, sum, min and max of the prices in one group
+
+    Min and max come from two lazy-deletion heaps: a removed price is only
+    counted as gone and leaves a heap when it reaches the top, so adding or
+    removing costs O(log n). Without ``removable`` (one pass over the records)
+    no heaps are kept, only the running extremes.
+    """
+    __slots__ = ('count', 'total', 'low', 'high', '_labels', '_lows', '_highs', '_gone_low', '_gone_high')
+
+    def __init__(self, removable: bool = True):
+        self.count = 0
+        self.total = 0.0
+        self.low = float('inf')
+        self.high = float('-inf')
+        # Variantes de la etiqueta (p. ej. "Toyota" y "TOYOTA") con sus filas presentes
+        self._labels: Dict[str, int] = {}
+        # Montículo de mínimos y de máximos (negados), y precios quitados que aún están en ellos
+        self._lows: Optional[List[float]] = [] if removable else None
+        self._highs: Optional[List[float]] = [] if removable else None
+        self._gone_low: Dict[float, int] = {}
+        self._gone_high: Dict[float, int] = {}
+
+    @property
+    def label(self) -> str:
+        """First variant seen among the rows still in the group"""
+        return next(iter(self._labels), '')
+
+    def add(self, price: float, label: str):
+        self.count += 1
+        self.total += price
+        self._labels[label] = self._labels.get(label, 0) + 1
+        self.low = min(self.low, price)
+        self.high = max(self.high, price)
+        if self._lows is not None:
+            heappush(self._lows, price)
+            heappush(self._highs, -price)
+
+    def remove(self, price: float, label: str):
+        if self._lows is None:
+            raise ValueError("Este grupo no admite quitar precios")
+        self.count -= 1
+        self.total -= price
+        remaining = self._labels[label] - 1
+        if remaining:
+            self._labels[label] = remaining
+        else:
+            del self._labels[label]
+        self._gone_low[price] = self._gone_low.get(price, 0) + 1
+        self._gone_high[price] = self._gone_high.get(price, 0) + 1
+        if len(self._lows) > 2 * self.count + 16:
+            self._compact()
+        if price == self.low:
+            self.low = self._top(self._lows, self._gone_low, 1)
+        if price == self.high:
+            self.high = -self._top(self._highs, self._gone_high, -1)
+
+    @staticmethod
+    def _top(heap: List[float], gone: Dict[float, int], sign: int) -> float:
+        """Drop removed prices from the top of a heap; returns the new top (inf if empty)"""
+        while heap:
+            price = heap[0] * sign
+            pending = gone.get(price)
+            if not pending:
+                return heap[0]
+            heappop(heap)
+            if pending == 1:
+                del gone[price]
+            else:
+                gone[price] = pending - 1
+        return float('inf')
+
+    def _compact(self):
+        """Rebuild the heaps without the removed prices (keeps memory O(live prices))"""
+        gone = dict(self._gone_low)
+        live = []
+        for price in self._lows:
+            if gone.get(price):
+                gone[price] -= 1
+            else:
+                live.append(price)
+        self._set_prices(live)
+
+    def _set_prices(self, prices: List[float]):
+        self._lows = list(prices)
+        heapify(self._lows)
+        self._highs = [-price for price in prices]
+        heapify(self._highs)
+        self._gone_low = {}
+        self._gone_high = {}
+
+    def load(self, items: List[Tuple[float, str]]):
+        """Replace the contents with (price, label) pairs, building the heaps in O(n)"""
+        prices = [price for price, _ in items]
+        self.count = len(prices)
+        self.total = sum(prices)
+        self.low = min(prices, default=float('inf'))
+        self.high = max(prices, default=float('-inf'))
+        self._labels = dict(Counter(map(itemgetter(1), items)))
+        if self._lows is not None:
+            self._set_prices(prices)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'key': self.label,
+            'count': self.count,
+            'sum': round(self.total, 2),
+            'min': self.low,
+            'max': self.high,
+            'average': round(self.total / self.count, 2),
+        }
+
+
+# Clave de agrupación y etiqueta mostrada de cada dimensión (None: la etiqueta es la propia clave).
+# Marca sin distinguir mayúsculas (como el filtro); se muestra la primera variante que sigue presente
+DIMENSION_KEYS: Dict[str, Tuple[Callable[[CarRecord], Any], Optional[Callable[[CarRecord], str]]]] = {
+    'brand': (lambda r: brand_key(r.brand), lambda r: r.brand),
+    'color': (lambda r: r.color_code, lambda r: r.color.value),
+    'month': (sale_month, None),
+}
+
+
+def summarize_records(records: Iterable[CarRecord], group_by: Optional[str] = None) -> Dict[str, Any]:
+    """Same result as SalesAggregates.summary computed in one pass over the records (O(groups) memory)"""
+    aggregates = SalesAggregates(removable=False)
+    for record in records:
+        aggregates.add(record)
+    return aggregates.summary(group_by)
+
+
+class GroupedAggregate:
+    """Price aggregates per group of one dimension (brand, color, month...)"""
+
+    def __init__(self, key: Callable[[CarRecord], Any], label: Optional[Callable[[CarRecord], str]] = None,
+                 removable: bool = True):
+        self._key = key
+        self._label = label
+        self._removable = removable
+        self._groups: Dict[Any, PriceGroup] = {}
+
+    def add(self, record: CarRecord):
+        key = self._key(record)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = PriceGroup(self._removable)
+        group.add(record.price, key if self._label is None else self._label(record))
+
+    def remove(self, record: CarRecord):
+        key = self._key(record)
+        group = self._groups.get(key)
+        if group is None:
+            return
+        group.remove(record.price, key if self._label is None else self._label(record))
+        if not group.count:
+            del self._groups[key]
+
+    def load(self, records: Iterable[CarRecord]):
+        """Replace the groups, building each group's heaps once"""
+        items: Dict[Any, List[Tuple[float, str]]] = {}
+        for record in records:
+            key = self._key(record)
+            items.setdefault(key, []).append((record.price, key if self._label is None else self._label(record)))
+        self._load_items(items)
+
+    def load_groups(self, groups: Iterable[Tuple[Any, str, List[float]]]):
+        """Replace the groups from (key, label, prices) triples (a key may come in several)"""
+        items: Dict[Any, List[Tuple[float, str]]] = {}
+        for key, label, prices in groups:
+            if prices:
+                items.setdefault(key, []).extend([(price, label) for price in prices])
+        self._load_items(items)
+
+    def _load_items(self, items: Dict[Any, List[Tuple[float, str]]]):
+        self._groups = {}
+        for key, group_items in items.items():
+            group = self._groups[key] = PriceGroup(self._removable)
+            group.load(group_items)
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        return sorted((group.summary() for group in self._groups.values()), key=lambda g: g['key'])
+
+
+class SalesAggregates:
+    """Price aggregates by brand, color and sale month, kept up to date on every write
+
+    An update is applied as remove(old record) + add(new record), so a record
+    that changes brand, color or month moves to its new group.
+    """
+
+    DIMENSIONS = ('brand', 'color', 'month')
+
+    def __init__(self, removable: bool = True):
+        self.brand = GroupedAggregate(*DIMENSION_KEYS['brand'], removable=removable)
+        self.color = GroupedAggregate(*DIMENSION_KEYS['color'], removable=removable)
+        self.month = GroupedAggregate(*DIMENSION_KEYS['month'], removable=removable)
+        self.overall = PriceGroup(removable)
+
+    def add(self, record: CarRecord):
+        self.overall.add(record.price, 'all')
+        for dimension in self.DIMENSIONS:
+            getattr(self, dimension).add(record)
+
+    def remove(self, record: CarRecord):
+        self.overall.remove(record.price, 'all')
+        for dimension in self.DIMENSIONS:
+            getattr(self, dimension).remove(record)
+
+    def rebuild(self, records: List[CarRecord]):
+        self.overall.load([(record.price, 'all') for record in records])
+        for dimension in self.DIMENSIONS:
+            getattr(self, dimension).load(records)
+
+    def rebuild_columns(self, columns: SnapshotColumns):
+        """Same as rebuild, from the columns of a binary snapshot (prices grouped by code, not per record)"""
+        prices = columns.prices
+        self.overall.load([(price, 'all') for price in prices])
+        brand_prices = group_by_code(prices, columns.brand_ids, len(columns.brands))
+        self.brand.load_groups(
+            (brand_key(brand), brand, group) for brand, group in zip(columns.brands, brand_prices))
+        color_prices = group_by_code(prices, columns.colors, len(COLORS))
+        self.color.load_groups((code, COLORS[code].value, group) for code, group in enumerate(color_prices))
+        # Cada día apunta a la lista de su mes: los precios quedan en el orden de los registros
+        month_prices: Dict[str, List[float]] = {}
+        day_prices: Dict[int, List[float]] = {}
+        for price, micros in zip(prices, columns.sale_us):
+            day = micros // DAY_US
+            group = day_prices.get(day)
+            if group is None:
+                group = day_prices[day] = month_prices.setdefault(day_month(day), [])
+            group.append(price)
+        self.month.load_groups((month, month, group) for month, group in month_prices.items())
+
+    def summary(self, group_by: Optional[str] = None) -> Dict[str, Any]:
+        """Aggregates per group in O(groups); only one dimension if group_by is given"""
+        dimensions = self.DIMENSIONS if group_by is None else (group_by,)
+        return {
+            'total': self.overall.summary() if self.overall.count else None,
+            **{dimension: getattr(self, dimension).summaries() for dimension in dimensions},
+        }
@@ -0,0 +1,43 @@
+from typing import Optional
+from .binary_tree import BinarySearchTree, TreeNode, node_height
+
+
+class AVLTree(BinarySearchTree):
+    """Self-balancing engine: keeps |height(left) - height(right)| <= 1 at every node"""
+
+    @staticmethod
+    def _balance_factor(node: Optional[TreeNode]) -> int:
+        if not node:
+            return 0
+        return node_height(node.left) - node_height(node.right)
+
+    def _rotate_right(self, node: TreeNode) -> TreeNode:
+        node = self._writable(node)
+        pivot = self._writable(node.left)
+        node.left = pivot.right
+        pivot.right = node
+        self._refresh(node)
+        self._refresh(pivot)
+        return pivot
+
+    def _rotate_left(self, node: TreeNode) -> TreeNode:
+        node = self._writable(node)
+        pivot = self._writable(node.right)
+        node.right = pivot.left
+        pivot.left = node
+        self._refresh(node)
+        self._refresh(pivot)
+        return pivot
+
+    def _rebalance(self, node: TreeNode) -> TreeNode:
+        """Restore the AVL invariant at node and return the new subtree root"""
+        balance = self._balance_factor(node)
+        if balance > 1:
+            if self._balance_factor(node.left) < 0:
+                node.left = self._rotate_left(node.left)
+            return self._rotate_right(node)
+        if balance < -1:
+            if self._balance_factor(node.right) > 0:
+                node.right = self._rotate_right(node.right)
+            return self._rotate_left(node)
+        return node
@@ -1,137 +1,702 @@
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Iterator, Callable
 from ..models.schemas import CarSale, TreeStats
+from .indexes import SecondaryIndexes, brand_key, day_date
+from .aggregates import SalesAggregates
+from ..utils.metrics import REGISTRY, profile_span
+from .records import CarRecord, color_code, sale_micros
+from .persistence import (
+    FIELDNAMES, WriteAheadLog, SharedWriteAheadLog, DEFAULT_COMPACTION_THRESHOLD, CsvSnapshot,
+    car_to_row, row_to_record, write_csv_rows, open_snapshot,
+)
+from .snapshot import SnapshotColumns
+from .persister import BackgroundPersister, DURABILITY_MODES, persister_from_env
+from contextlib import contextmanager
 import csv
 import os
-from datetime import datetime
+import threading
+import uuid
+from datetime import datetime, date
+from itertools import islice
 
 class TreeNode:
-    def __init__(self, data: CarSale):
-        self.data = data
+    __slots__ = ('key', 'record', 'left', 'right', 'height', 'size', 'leaves', 'diameter', 'epoch', 'version')
+
+    def __init__(self, record: CarRecord, epoch: int = 0):
+        self.key = record.license_plate
+        self.record = record
         self.left: Optional['TreeNode'] = None
         self.right: Optional['TreeNode'] = None
+        self.height = 1
+        self.size = 1
+        self.leaves = 1
+        # Nodos del camino más largo dentro del subárbol (diámetro)
+        self.diameter = 1
+        # Escritura que creó el nodo: solo esa escritura puede modificarlo
+        self.epoch = epoch
+        # Escritura que guardó el registro actual (versión por placa, para los ETag)
+        self.version = epoch
+
+    def copy(self, epoch: int) -> 'TreeNode':
+        node = TreeNode(self.record, epoch)
+        node.key = self.key
+        node.left = self.left
+        node.right = self.right
+        node.height = self.height
+        node.size = self.size
+        node.leaves = self.leaves
+        node.diameter = self.diameter
+        node.version = self.version
+        return node
+
+    @property
+    def data(self) -> CarSale:
+        return self.record.to_model()
+
+
+def node_height(node: Optional[TreeNode]) -> int:
+    """Height of a subtree (0 for an empty one)"""
+    return node.height if node else 0
+
+
+def node_size(node: Optional[TreeNode]) -> int:
+    """Number of nodes in a subtree"""
+    return node.size if node else 0
+
+
+def node_leaves(node: Optional[TreeNode]) -> int:
+    """Number of leaves in a subtree"""
+    return node.leaves if node else 0
+
+
+def node_diameter(node: Optional[TreeNode]) -> int:
+    """Number of nodes on the longest path inside a subtree"""
+    return node.diameter if node else 0
+
+
+def balanced_shape(count: int, memo: Dict[int, Tuple[int, int, int, int]]) -> Tuple[int, int, int, int]:
+    """Height, size, leaves and diameter of the balanced subtree built from ``count`` records"""
+    if count <= 1:
+        return (count, count, count, count)
+    shape = memo.get(count)
+    if shape is None:
+        left_height, _, left_leaves, left_diameter = balanced_shape((count - 1) // 2, memo)
+        right_height, _, right_leaves, right_diameter = balanced_shape(count // 2, memo)
+        shape = memo[count] = (
+            1 + max(left_height, right_height),
+            count,
+            left_leaves + right_leaves,
+            max(left_diameter, right_diameter, left_height + right_height + 1),
+        )
+    return shape
+
+
+# Un lote con al menos 1/BULK_REBUILD_RATIO de los nodos actuales se fusiona y reconstruye
+BULK_REBUILD_RATIO = 4
+
+# Segundos entre lecturas del log compartido: máximo retraso de un worker respecto a los demás
+DEFAULT_SYNC_INTERVAL = 0.5
+
+FIND_NODES_VISITED = REGISTRY.count_histogram(
+    "car_sales_tree_find_nodes_visited", "Nodes visited per lookup by license plate",
+    buckets=(1, 2, 4, 8, 12, 16, 20, 24, 32, 48, 64, 128, 256)
+)
+PERSISTENCE_SECONDS = REGISTRY.histogram(
+    "car_sales_persistence_seconds", "Time spent persisting writes", labels=("operation",)
+)
+
 
 class BinarySearchTree:
-    def __init__(self):
+    """Binary search tree of car sales keyed by license plate
+
+    Writers are serialized by a lock and never modify a node that a reader may
+    hold: every change copies the root-to-node path and publishes a new root.
+    Readers take ``self.root`` once and walk that immutable snapshot lock-free.
+    ``self.version`` changes after each published write, so it can key caches.
+    """
+
+    def __init__(self, csv_file: str = "car_sales.csv", persistence: Optional[str] = None,
+                 snapshot_format: Optional[str] = None, durability: Optional[str] = None,
+                 progress: Optional[Callable[[str, int], None]] = None):
         self.root: Optional[TreeNode] = None
+        self._write_lock = threading.RLock()
+        self._index_lock = threading.Lock()
+        self._epoch = 0
+        # Última escritura publicada; crece con cada cambio y sirve para invalidar cachés
+        self.version = 0
+        # Distingue versiones de distintos procesos o arranques (los contadores empiezan de nuevo)
+        self.instance_id = uuid.uuid4().hex[:12]
         self._next_id = 1
-        self.csv_file = "car_sales.csv"
-        self._ensure_csv_headers()
-        self._load_from_csv()
+        self.csv_file = csv_file
+        # "csv": reescribe el CSV completo en cada cambio; "wal": log de solo escritura;
+        # "shared": log compartido entre varios procesos (uvicorn --workers N)
+        self.persistence = persistence or os.getenv("CAR_SALES_PERSISTENCE", "csv")
+        # "csv" o "binary" (columnar, se abre con mmap); el CSV sigue sirviendo para importar/exportar
+        self.snapshot_format = snapshot_format or os.getenv("CAR_SALES_SNAPSHOT_FORMAT", "csv")
+        self.snapshot = open_snapshot(self.snapshot_format, csv_file)
+        self.log_file = os.path.splitext(csv_file)[0] + ".log"
+        # "fsync": persiste cada escritura antes de responder; "group": por lotes en segundo
+        # plano, cada escritura espera a su lote; "periodic": por lotes, sin esperar
+        self.durability = durability or os.getenv("CAR_SALES_DURABILITY", "group")
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError(f"Modo de durabilidad no soportado: {self.durability}")
+        self._wal: Optional[WriteAheadLog] = None
+        self._persister: Optional[BackgroundPersister] = None
+        # Ticket de la última escritura de cada hilo, a esperar fuera del lock (modo "group")
+        self._durability_ticket = threading.local()
+        self._syncer: Optional[threading.Thread] = None
+        self._sync_stop = threading.Event()
+        # Modo "shared": posición del log compartido ya aplicada al árbol (la misma en todos los workers)
+        self._log_position: Optional[int] = None
+        self._loading = False
+        # Avisa (fase, registros) mientras se carga, p. ej. para /ready
+        self._progress = progress
+        self.indexes = SecondaryIndexes()
+        self.aggregates = SalesAggregates()
+        # Cachés asociadas a la raíz con la que se calcularon
+        self._levels_cache: Optional[Tuple[TreeNode, Dict[int, int]]] = None
+        self._longest_path_cache: Optional[Tuple[TreeNode, List[CarRecord]]] = None
+        if self.snapshot_format == "csv":
+            self._ensure_csv_headers()
+        if self.persistence == "shared":
+            self._open_shared_log()
+            return
+        self._load_snapshot()
+        if self.persistence == "wal":
+            self._open_wal()
+        if self.durability != "fsync":
+            self._start_persister()
 
     def _ensure_csv_headers(self):
         """Ensure CSV file exists with proper headers"""
         if not os.path.exists(self.csv_file):
             with open(self.csv_file, 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=[
-                    'id', 'license_plate', 'brand', 'color', 'price', 'sale_date'
-                ])
+                writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
                 writer.writeheader()
 
-    def _load_from_csv(self):
-        """Load data from CSV into the tree"""
-        if not os.path.exists(self.csv_file):
+    def _report(self, phase: str, records: int = 0):
+        if self._progress is not None:
+            self._progress(phase, records)
+
+    def _load_snapshot(self):
+        """Load the snapshot into the tree in a single balanced bulk build"""
+        self._report("reading snapshot")
+        if self.snapshot.exists():
+            self._load_stored_snapshot()
             return
-            
-        with open(self.csv_file, 'r') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if not row['id']:  # Skip empty rows
-                    continue
-                    
-                car_sale = CarSale(
-                    id=int(row['id']),
-                    license_plate=row['license_plate'],
-                    brand=row['brand'],
-                    color=row['color'],
-                    price=float(row['price']),
-                    sale_date=datetime.fromisoformat(row['sale_date'])
-                )
-                self.insert(car_sale)
-                self._next_id = max(self._next_id, car_sale.id + 1)
+        # Sin snapshot binario todavía: se importa el CSV de intercambio y se convierte
+        self._load_records(CsvSnapshot(self.csv_file).read())
+        self.snapshot.write(self._iter_in_order(self.root))
+
+    def _load_stored_snapshot(self):
+        """Load the existing snapshot; a binary one is built straight from its columns"""
+        if self.snapshot_format != "binary":
+            self._load_records(self.snapshot.read())
+            return
+        columns = self.snapshot.read_columns()
+        self._report("building tree", len(columns.records))
+        # Ya viene ordenado por placa y sin repetidas: sin comprobar ni reordenar
+        if columns.ids:
+            self._next_id = max(self._next_id, max(columns.ids) + 1)
+        self._rebuild(columns.records, columns)
+
+    def _load_records(self, records: List[CarRecord]):
+        self._report("building tree", len(records))
+        is_sorted = True
+        for i, record in enumerate(records):
+            if i and record.license_plate <= records[i - 1].license_plate:
+                is_sorted = False
+            self._next_id = max(self._next_id, record.id + 1)
+
+        if not is_sorted:
+            # Orden estable: ante placas repetidas gana la última fila
+            records.sort(key=lambda record: record.license_plate)
+            deduped = []
+            for record in records:
+                if deduped and deduped[-1].license_plate == record.license_plate:
+                    deduped[-1] = record
+                else:
+                    deduped.append(record)
+            records = deduped
+
+        self._rebuild(records)
+
+    def _rebuild(self, records: List[CarRecord], columns: Optional[SnapshotColumns] = None):
+        """Replace the whole tree with a balanced one built from sorted, unique records
+
+        With the ``columns`` of a binary snapshot (the same records) the indexes and
+        aggregates are built from them.
+        """
+        self._epoch += 1
+        root = self._build_balanced(records)
+        with self._index_lock:
+            if columns is None:
+                self.indexes.rebuild(records)
+                self.aggregates.rebuild(records)
+            else:
+                self.indexes.rebuild_columns(columns)
+                self.aggregates.rebuild_columns(columns)
+        self._publish(root)
+
+    def _build_balanced(self, records: List[CarRecord]) -> Optional[TreeNode]:
+        """Build a perfectly balanced tree from sorted records (root at the middle of each range)
+
+        Iterative, and the cached fields come from ``balanced_shape`` (they only
+        depend on the length of the range), so no node goes through ``_refresh``.
+        """
+        if not records:
+            return None
+        nodes = [TreeNode(record, self._epoch) for record in records]
+        shapes: Dict[int, Tuple[int, int, int, int]] = {}
+        # Rangos pendientes como (inicio, longitud); la raíz de cada uno está en inicio + (longitud - 1) // 2
+        pending = [(0, len(nodes))]
+        while pending:
+            lo, count = pending.pop()
+            half = (count - 1) // 2
+            node = nodes[lo + half]
+            if count > 1:
+                node.height, node.size, node.leaves, node.diameter = balanced_shape(count, shapes)
+            if half:
+                node.left = nodes[lo + (half - 1) // 2]
+                pending.append((lo, half))
+            rest = count - half - 1
+            if rest:
+                node.right = nodes[lo + half + 1 + (rest - 1) // 2]
+                pending.append((lo + half + 1, rest))
+        return nodes[(len(nodes) - 1) // 2]
+
+    def _refresh(self, node: TreeNode):
+        """Recompute the cached fields of a node from its children"""
+        node.height = 1 + max(node_height(node.left), node_height(node.right))
+        node.size = 1 + node_size(node.left) + node_size(node.right)
+        node.leaves = node_leaves(node.left) + node_leaves(node.right) or 1
+        node.diameter = max(
+            node_diameter(node.left),
+            node_diameter(node.right),
+            node_height(node.left) + node_height(node.right) + 1
+        )
+
+    def _rebalance(self, node: TreeNode) -> TreeNode:
+        """Hook for self-balancing engines; the plain BST keeps its shape"""
+        return node
+
+    def _publish(self, root: Optional[TreeNode]):
+        """Make the result of the current write visible to readers"""
+        self.root = root
+        self.version = self._epoch
+
+    def _writable(self, node: Optional[TreeNode]) -> Optional[TreeNode]:
+        """Node that the current write may modify: itself if it created it, else a copy"""
+        if node is None or node.epoch == self._epoch:
+            return node
+        return node.copy(self._epoch)
+
+    def _retrace(self, path: List[TreeNode]) -> TreeNode:
+        """Refresh and rebalance a copied root-to-node path bottom-up; returns the new root"""
+        subtree = path[0]
+        for i in range(len(path) - 1, -1, -1):
+            node = path[i]
+            self._refresh(node)
+            subtree = self._rebalance(node)
+            if subtree is node or i == 0:
+                continue
+            if path[i - 1].left is node:
+                path[i - 1].left = subtree
+            else:
+                path[i - 1].right = subtree
+        return subtree
+
+    def _open_wal(self):
+        """Open the write-ahead log and replay it on top of the snapshot"""
+        threshold = int(os.getenv("CAR_SALES_WAL_COMPACTION_BYTES", DEFAULT_COMPACTION_THRESHOLD))
+        # fsync en cada escritura al log: una por petición en modo "fsync", una por lote si no
+        self._wal = WriteAheadLog(self.log_file, self.snapshot, threshold, fsync=True)
+        self._report("replaying log", len(self))
+        self._apply_log(self._wal.replay())
+        self._wal.recover()
+
+    def _open_shared_log(self):
+        """Load snapshot + shared log and start tailing what other workers append"""
+        threshold = int(os.getenv("CAR_SALES_WAL_COMPACTION_BYTES", DEFAULT_COMPACTION_THRESHOLD))
+        # Cada escritura debe estar en el log antes de soltar el lock entre procesos:
+        # aquí no hay persistencia en segundo plano, la durabilidad solo decide el fsync
+        self._wal = SharedWriteAheadLog(self.log_file, self.snapshot, threshold,
+                                        fsync=self.durability == "fsync")
+        # Bajo el lock compartido ningún worker puede compactar entre leer el snapshot y el log
+        with self._write_lock, self._wal.shared():
+            self._load_snapshot()
+            self._report("replaying log", len(self))
+            self._apply_log(self._wal.replay())
+            self._wal.mark_synced()
+            self._log_position = self._wal.position
+        self._wal.recover()
+        interval = float(os.getenv("CAR_SALES_SYNC_INTERVAL", DEFAULT_SYNC_INTERVAL))
+        self._syncer = threading.Thread(target=self._sync_loop, args=(interval,), daemon=True)
+        self._syncer.start()
+
+    def _apply_log(self, entries):
+        """Apply logged operations without logging them again"""
+        self._loading = True
+        try:
+            for entry in entries:
+                if entry['op'] == 'upsert':
+                    self._insert_record(row_to_record(entry['data']))
+                elif entry['op'] == 'delete':
+                    self._delete(entry['license_plate'])
+        finally:
+            self._loading = False
+
+    def _sync_locked(self):
+        """Catch up with the shared log (the caller holds the write and file locks)"""
+        entries = self._wal.catch_up()
+        if entries is None:
+            # El log se compactó mientras tanto: recargar desde el snapshot
+            if self.snapshot.exists():
+                self._load_stored_snapshot()
+            else:
+                self._load_records([])
+            entries = self._wal.replay()
+        self._apply_log(entries)
+        self._wal.mark_synced()
+        # Solo después de aplicar: la posición nunca va por delante del árbol publicado
+        self._log_position = self._wal.position
+
+    def sync(self):
+        """Apply the changes logged by other worker processes (shared mode only)"""
+        if not isinstance(self._wal, SharedWriteAheadLog):
+            return
+        with self._write_lock, self._wal.shared():
+            self._sync_locked()
+
+    def _sync_loop(self, interval: float):
+        while not self._sync_stop.wait(interval):
+            try:
+                self.sync()
+            except OSError:
+                # Error transitorio de E/S: se reintenta en la próxima vuelta
+                continue
+
+    def _start_persister(self):
+        """Persist writes in batches on a background thread instead of on each request"""
+        self._persister = persister_from_env(self._flush_batch, self.durability)
+
+    def _flush_batch(self, entries: List[dict]):
+        """Persist a batch of writes (runs on the persister thread, without the tree lock)"""
+        with PERSISTENCE_SECONDS.time("flush"):
+            if self._wal is not None:
+                self._wal.append_entries(entries)
+            else:
+                # La raíz publicada es inmutable e incluye todas las escrituras del lote
+                self.snapshot.write(self._iter_in_order(self.root))
+
+    @contextmanager
+    def _writing(self):
+        """Serialize a write; in shared mode also across processes, after catching up"""
+        with self._write_lock:
+            if not isinstance(self._wal, SharedWriteAheadLog):
+                yield
+            else:
+                with self._wal.exclusive():
+                    self._sync_locked()
+                    try:
+                        yield
+                    finally:
+                        self._log_position = self._wal.position
+        self._await_durability()
+
+    def _await_durability(self):
+        """In group mode, wait (outside the lock) until this thread's last write is on disk"""
+        ticket = getattr(self._durability_ticket, 'value', None)
+        if ticket is None:
+            return
+        self._durability_ticket.value = None
+        if self.durability == "group":
+            with profile_span("persist"):
+                self._persister.wait(ticket)
+
+    def _submit(self, entries: List[dict]):
+        self._durability_ticket.value = self._persister.submit(entries)
+
+    def _track(self, record: CarRecord):
+        """Register a stored record in the secondary structures"""
+        with self._index_lock:
+            self.indexes.add(record)
+            self.aggregates.add(record)
+
+    def _untrack(self, record: CarRecord):
+        """Remove a stored record from the secondary structures"""
+        with self._index_lock:
+            self.indexes.remove(record)
+            self.aggregates.remove(record)
+
+    def _persist_upsert(self, data: CarRecord):
+        """Persist an inserted or updated record"""
+        if self._loading:
+            return
+        if self._persister is not None:
+            self._submit([WriteAheadLog.upsert_entry(data)] if self._wal is not None else [])
+            return
+        with PERSISTENCE_SECONDS.time("upsert"), profile_span("persist"):
+            if self._wal is not None:
+                self._wal.append_upsert(data)
+            else:
+                self.save_tree()
+
+    def _persist_batch(self, records: List[CarRecord]):
+        """Persist many inserted or updated records with a single flush"""
+        if self._loading or not records:
+            return
+        if self._persister is not None:
+            self._submit([WriteAheadLog.upsert_entry(record) for record in records]
+                         if self._wal is not None else [])
+            return
+        with PERSISTENCE_SECONDS.time("batch"), profile_span("persist"):
+            if self._wal is not None:
+                self._wal.append_upserts(records)
+            else:
+                self.save_tree()
+
+    def _persist_delete(self, license_plate: str):
+        """Persist the removal of a record"""
+        if self._loading:
+            return
+        if self._persister is not None:
+            self._submit([WriteAheadLog.delete_entry(license_plate)] if self._wal is not None else [])
+            return
+        with PERSISTENCE_SECONDS.time("delete"), profile_span("persist"):
+            if self._wal is not None:
+                self._wal.append_delete(license_plate)
+            else:
+                self.save_tree()
 
     def _save_to_csv(self, node: Optional[TreeNode]):
         """Save tree data to CSV (in-order traversal)"""
-        if node is None:
-            return []
-        
-        left_data = self._save_to_csv(node.left)
-        current_data = [{
-            'id': str(node.data.id),
-            'license_plate': node.data.license_plate,
-            'brand': node.data.brand,
-            'color': node.data.color,
-            'price': str(node.data.price),
-            'sale_date': node.data.sale_date.isoformat()
-        }]
-        right_data = self._save_to_csv(node.right)
-        
-        return left_data + current_data + right_data
+        return [car_to_row(record) for record in self._iter_in_order(node)]
 
     def save_tree(self):
-        """Save the entire tree to CSV"""
-        if not self.root:
+        """Save the entire tree to the snapshot"""
+        if self._persister is not None and self._wal is None:
+            # El snapshot se escribe desde el persistidor: nunca dos escrituras a la vez
+            self._persister.flush(force=True)
             return
-            
-        data = self._save_to_csv(self.root)
-        with open(self.csv_file, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=[
-                'id', 'license_plate', 'brand', 'color', 'price', 'sale_date'
-            ])
-            writer.writeheader()
-            writer.writerows(data)
+        if self._persister is not None:
+            # Lo pendiente va al log antes de que el checkpoint lo reinicie
+            self._persister.flush()
+        with self._writing(), PERSISTENCE_SECONDS.time("save_tree"):
+            records = list(self._iter_in_order(self.root))
+            if self._wal is not None:
+                # El snapshot completo hace innecesario el log acumulado
+                self._wal.checkpoint(records)
+                return
+            self.snapshot.write(records)
+
+    def export_csv(self, path: str):
+        """Export the current contents as CSV (interchange format)"""
+        write_csv_rows(path, self._save_to_csv(self.root))
+
+    @property
+    def pending_writes(self) -> int:
+        """Writes applied in memory but not yet persisted"""
+        return self._persister.pending if self._persister is not None else 0
+
+    def flush(self):
+        """Persist the writes still queued for the background persister"""
+        if self._persister is not None:
+            self._persister.flush()
+
+    def close(self):
+        """Persist pending writes and release persistence resources"""
+        if self._persister is not None:
+            self._persister.close()
+        if self._syncer is not None:
+            self._sync_stop.set()
+            self._syncer.join()
+        with self._write_lock:
+            if self._wal is not None:
+                self._wal.close()
 
     def insert(self, data) -> CarSale:
         """Insert a new node into the tree"""
-        # Convertir a diccionario si es un modelo Pydantic
-        if hasattr(data, 'dict'):
-            data_dict = data.dict()
-            # Si es un CarSaleCreate, asignar un ID
-            if not data_dict.get('id'):
-                data_dict['id'] = self._next_id
-                self._next_id += 1
-            # Crear un objeto CarSale con los datos
-            from .schemas import CarSale
-            data = CarSale(**data_dict)
-            
+        with self._writing():
+            # Convertir a diccionario si es un modelo Pydantic
+            if hasattr(data, 'dict'):
+                data_dict = data.dict()
+                # Si es un CarSaleCreate, asignar un ID (ya al día con los demás workers)
+                if not data_dict.get('id'):
+                    data_dict['id'] = self._next_id
+                    self._next_id += 1
+                data = CarRecord.from_values(**data_dict)
+            self._insert_record(data)
+        return data.to_model()
+
+    def _insert_record(self, record: CarRecord) -> bool:
+        """Insert or replace a record; True if a new node was created"""
+        self._epoch += 1
+        self._next_id = max(self._next_id, record.id + 1)
+        key = record.license_plate
+
         # Si el árbol está vacío, crear el nodo raíz
         if not self.root:
-            self.root = TreeNode(data)
-            self.save_tree()
-            return data
-            
-        # Si el árbol no está vacío, buscar la posición correcta
-        current = self.root
-        while current:
-            if data.license_plate < current.data.license_plate:
+            self._track(record)
+            self._publish(TreeNode(record, self._epoch))
+            self._persist_upsert(record)
+            return True
+
+        # Si el árbol no está vacío, buscar la posición correcta (copiando el camino)
+        current = self._writable(self.root)
+        path = [current]
+        while True:
+            if key < current.key:
                 if current.left is None:
-                    current.left = TreeNode(data)
-                    self.save_tree()
-                    return data
+                    current.left = TreeNode(record, self._epoch)
+                    break
+                current.left = self._writable(current.left)
                 current = current.left
-            elif data.license_plate > current.data.license_plate:
+            elif key > current.key:
                 if current.right is None:
-                    current.right = TreeNode(data)
-                    self.save_tree()
-                    return data
+                    current.right = TreeNode(record, self._epoch)
+                    break
+                current.right = self._writable(current.right)
                 current = current.right
             else:
                 # Actualizar nodo existente
-                current.data = data
-                self.save_tree()
-                return data
+                self._untrack(current.record)
+                current.record = record
+                current.version = self._epoch
+                self._track(record)
+                self._publish(path[0])
+                self._persist_upsert(record)
+                return False
+            path.append(current)
 
-    def find(self, license_plate: str) -> Optional[CarSale]:
-        """Find a node by license plate"""
+        self._track(record)
+        self._publish(self._retrace(path))
+        self._persist_upsert(record)
+        return True
+
+    def bulk_insert(self, items: List[Any], upsert: bool = True) -> List[Tuple[str, CarRecord]]:
+        """Insert many car sales with a single persistence flush
+
+        Returns ("created" | "updated" | "conflict", record) per item, in order.
+        Large batches (or an empty tree) are merged with the current contents and
+        the tree is rebuilt balanced instead of inserting one by one.
+        """
+        with self._writing():
+            return self._bulk_insert(items, upsert)
+
+    def _bulk_insert(self, items: List[Any], upsert: bool) -> List[Tuple[str, CarRecord]]:
+        pending: Dict[str, CarRecord] = {}
+        results = []
+        for item in items:
+            plate = item.license_plate
+            existing = pending.get(plate)
+            if existing is None:
+                node = self._search(self.root, plate)
+                existing = node.record if node else None
+            if existing is not None and not upsert:
+                results.append(("conflict", existing))
+                continue
+
+            if existing is not None:
+                record_id = existing.id
+            else:
+                record_id = self._next_id
+                self._next_id += 1
+            record = CarRecord.from_values(
+                record_id, plate, item.brand, item.color, item.price, item.sale_date
+            )
+            pending[plate] = record
+            results.append(("updated" if existing is not None else "created", record))
+
+        if len(pending) * BULK_REBUILD_RATIO >= len(self):
+            self._merge_rebuild(pending)
+        else:
+            self._loading = True
+            try:
+                for record in pending.values():
+                    self._insert_record(record)
+            finally:
+                self._loading = False
+
+        self._persist_batch(list(pending.values()))
+        return results
+
+    def _merge_rebuild(self, pending: Dict[str, CarRecord]):
+        """Merge sorted new records with the in-order contents and rebuild in O(n + k log k)"""
+        incoming = [pending[plate] for plate in sorted(pending)]
+        merged = []
+        i = 0
+        for record in self._iter_in_order(self.root):
+            while i < len(incoming) and incoming[i].license_plate < record.license_plate:
+                merged.append(incoming[i])
+                i += 1
+            if i < len(incoming) and incoming[i].license_plate == record.license_plate:
+                merged.append(incoming[i])
+                i += 1
+            else:
+                merged.append(record)
+        merged.extend(incoming[i:])
+        self._rebuild(merged)
+
+    def _find_node(self, license_plate: str) -> Tuple[Optional[TreeNode], int]:
+        """Node with the plate (or None) and how many nodes the lookup visited"""
         current = self.root
+        visited = 0
+        while current:
+            visited += 1
+            if license_plate < current.key:
+                current = current.left
+            elif license_plate > current.key:
+                current = current.right
+            else:
+                break
+        return current, visited
+
+    @staticmethod
+    def _search(current: Optional[TreeNode], license_plate: str) -> Optional[TreeNode]:
         while current:
-            if license_plate < current.data.license_plate:
+            if license_plate < current.key:
                 current = current.left
-            elif license_plate > current.data.license_plate:
+            elif license_plate > current.key:
                 current = current.right
             else:
-                return current.data
+                return current
         return None
 
+    def __contains__(self, license_plate: str) -> bool:
+        return self._search(self.root, license_plate) is not None
+
+    def find(self, license_plate: str) -> Optional[CarSale]:
+        """Find a node by license plate"""
+        node, visited = self._find_node(license_plate)
+        FIND_NODES_VISITED.observe(visited)
+        return node.record.to_model() if node else None
+
+    def find_versioned(self, license_plate: str) -> Optional[Tuple[CarSale, int]]:
+        """Find a car sale together with the version of the write that stored it
+
+        In shared mode each worker numbers its writes differently: the version is
+        then ``etag_version``, the same in every worker that applied the same log.
+        """
+        position = self._log_position
+        node, visited = self._find_node(license_plate)
+        FIND_NODES_VISITED.observe(visited)
+        if node is None:
+            return None
+        return node.record.to_model(), node.version if position is None else position
+
+    @property
+    def etag_scope(self) -> str:
+        """What ETag versions are counted in: this instance, or the shared log in shared mode"""
+        if self._log_position is not None:
+            return self._wal.log_id
+        return self.instance_id
+
+    @property
+    def etag_version(self) -> int:
+        """Version of the whole tree for ETags (the applied shared log position in shared mode)"""
+        position = self._log_position
+        return self.version if position is None else position
+
     def _find_min(self, node: TreeNode) -> TreeNode:
         """Find the node with minimum value in a subtree"""
         current = node
@@ -141,189 +706,483 @@ class BinarySearchTree:
 
     def delete(self, license_plate: str) -> bool:
         """Delete a node by license plate"""
-        def _delete(node: Optional[TreeNode], key: str) -> Optional[TreeNode]:
-            if not node:
-                return None
-                
-            if key < node.data.license_plate:
-                node.left = _delete(node.left, key)
-            elif key > node.data.license_plate:
-                node.right = _delete(node.right, key)
+        with self._writing():
+            return self._delete(license_plate)
+
+    def _delete(self, license_plate: str) -> bool:
+        target = self._search(self.root, license_plate)
+        if target is None:
+            return False
+        self._epoch += 1
+        self._untrack(target.record)
+
+        # Copiar el camino desde la raíz hasta el nodo a eliminar
+        path = []
+        node = self._writable(self.root)
+        while node.key != license_plate:
+            path.append(node)
+            if license_plate < node.key:
+                node.left = self._writable(node.left)
+                node = node.left
             else:
-                if not node.left:
-                    return node.right
-                elif not node.right:
-                    return node.left
-                    
-                temp = self._find_min(node.right)
-                node.data = temp.data
-                node.right = _delete(node.right, temp.data.license_plate)
-                
-            return node
-            
-        self.root = _delete(self.root, license_plate)
-        self.save_tree()
-        return self.root is not None
+                node.right = self._writable(node.right)
+                node = node.right
+
+        if node.left and node.right:
+            # Copiar el sucesor y eliminarlo a él, que tiene a lo sumo un hijo
+            path.append(node)
+            node.right = self._writable(node.right)
+            successor = node.right
+            while successor.left:
+                path.append(successor)
+                successor.left = self._writable(successor.left)
+                successor = successor.left
+            node.key = successor.key
+            node.record = successor.record
+            node.version = successor.version
+            node = successor
+
+        child = node.left or node.right
+        if not path:
+            self._publish(child)
+        else:
+            if path[-1].left is node:
+                path[-1].left = child
+            else:
+                path[-1].right = child
+            self._publish(self._retrace(path))
+
+        self._persist_delete(license_plate)
+        return True
 
     def update(self, license_plate: str, update_data: dict) -> Optional[CarSale]:
         """Update a node's data"""
+        with self._writing():
+            if self._search(self.root, license_plate) is None:
+                return None
+            self._epoch += 1
+            node = self._writable(self.root)
+            root = node
+            while node.key != license_plate:
+                if license_plate < node.key:
+                    node.left = self._writable(node.left)
+                    node = node.left
+                else:
+                    node.right = self._writable(node.right)
+                    node = node.right
+
+            record = node.record.with_changes(update_data)
+            self._untrack(node.record)
+            node.record = record
+            node.version = self._epoch
+            self._track(record)
+            self._publish(root)
+            self._persist_upsert(record)
+            return record.to_model()
+
+    @staticmethod
+    def _iter_in_order(node: Optional[TreeNode]) -> Iterator[CarRecord]:
+        stack = []
+        while node:
+            stack.append(node)
+            node = node.left
+        return BinarySearchTree._iter_stack(stack)
+
+    @staticmethod
+    def _iter_stack(stack: List[TreeNode]) -> Iterator[CarRecord]:
+        """Continue an in-order walk whose pending ancestors are on the stack"""
+        while stack:
+            node = stack.pop()
+            yield node.record
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+
+    def __len__(self) -> int:
+        return node_size(self.root)
+
+    @property
+    def height(self) -> int:
+        return node_height(self.root)
+
+    def select(self, index: int) -> Optional[CarSale]:
+        """Return the car sale at the given in-order position (0-based) in O(log n)"""
         node = self.root
         while node:
-            if license_plate < node.data.license_plate:
+            left_size = node_size(node.left)
+            if index < left_size:
                 node = node.left
-            elif license_plate > node.data.license_plate:
-                node = node.right
+            elif index == left_size:
+                return node.record.to_model()
             else:
-                for key, value in update_data.items():
-                    if value is not None and hasattr(node.data, key):
-                        setattr(node.data, key, value)
-                self.save_tree()
-                return node.data
+                index -= left_size + 1
+                node = node.right
         return None
 
-    def in_order_traversal(self) -> List[CarSale]:
-        """Return nodes in in-order (left, root, right)"""
+    def rank(self, license_plate: str, inclusive: bool = False) -> int:
+        """Number of plates lower than (or equal to, if inclusive) the given one"""
+        return self._rank(self.root, license_plate, inclusive)
+
+    @staticmethod
+    def _rank(node: Optional[TreeNode], license_plate: str, inclusive: bool) -> int:
+        count = 0
+        while node:
+            plate = node.key
+            if license_plate < plate or (license_plate == plate and not inclusive):
+                node = node.left
+            else:
+                count += node_size(node.left) + 1
+                node = node.right
+        return count
+
+    def iter_in_order_from(self, offset: int = 0, after: Optional[str] = None) -> Iterator[CarSale]:
+        """Lazily yield in-order nodes starting at the given position, seeking in O(log n)
+
+        With ``after`` the position counts from the first plate greater than it.
+        """
+        return (record.to_model() for record in self.iter_records_from(offset, after))
+
+    def iter_records_from(self, offset: int = 0, after: Optional[str] = None) -> Iterator[CarRecord]:
+        """Stored records of iter_in_order_from (no model is built)"""
+        node = self.root
+        if after is not None:
+            offset += self._rank(node, after, inclusive=True)
+        stack = []
+        while node:
+            left_size = node_size(node.left)
+            if offset <= left_size:
+                stack.append(node)
+                if offset == left_size:
+                    break
+                node = node.left
+            else:
+                offset -= left_size + 1
+                node = node.right
+        return self._iter_stack(stack)
+
+    def iter_in_order(self) -> Iterator[CarSale]:
+        """Lazily yield nodes in in-order (left, root, right) without recursion"""
+        return (record.to_model() for record in self._iter_in_order(self.root))
+
+    def iter_pre_order(self) -> Iterator[CarSale]:
+        """Lazily yield nodes in pre-order (root, left, right) without recursion"""
+        return (record.to_model() for record in self._iter_pre_order(self.root))
+
+    @staticmethod
+    def _iter_pre_order(root: Optional[TreeNode]) -> Iterator[CarRecord]:
+        stack = [root] if root else []
+        while stack:
+            node = stack.pop()
+            yield node.record
+            if node.right:
+                stack.append(node.right)
+            if node.left:
+                stack.append(node.left)
+
+    @staticmethod
+    def _iter_post_order_nodes(node: Optional[TreeNode]) -> Iterator[TreeNode]:
+        stack = []
+        last_visited = None
+        while stack or node:
+            while node:
+                stack.append(node)
+                node = node.left
+            top = stack[-1]
+            if top.right and top.right is not last_visited:
+                node = top.right
+            else:
+                yield top
+                last_visited = stack.pop()
+
+    def iter_post_order(self) -> Iterator[CarSale]:
+        """Lazily yield nodes in post-order (left, right, root) without recursion"""
+        return (node.record.to_model() for node in self._iter_post_order_nodes(self.root))
+
+    def iter_range(self, start: Optional[str] = None, end: Optional[str] = None,
+                   prefix: Optional[str] = None) -> Iterator[CarSale]:
+        """Lazily yield plates in [start, end] that begin with prefix, in O(log n + k)"""
+        if prefix and (start is None or start < prefix):
+            start = prefix
+
+        # Descender hasta la primera placa >= start, podando subárboles menores
+        stack = []
+        node = self.root
+        while node:
+            if start is None or node.key >= start:
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+
+        for record in self._iter_stack(stack):
+            plate = record.license_plate
+            if end is not None and plate > end:
+                return
+            if prefix and not plate.startswith(prefix):
+                return
+            yield record.to_model()
+
+    def get_aggregates(self, group_by: Optional[str] = None) -> Dict[str, Any]:
+        """Count, sum, min, max and average price by brand, color and sale month (O(groups))"""
+        with self._index_lock:
+            return self.aggregates.summary(group_by)
+
+    def filter(self, brand: Optional[str] = None, color=None,
+               min_price: Optional[float] = None, max_price: Optional[float] = None,
+               start_date: Optional[datetime] = None,
+               end_date: Optional[datetime] = None) -> List[CarSale]:
+        """Car sales matching every given criterion, sorted by license plate"""
+        root = self.root
+        with self._index_lock:
+            plates = self.indexes.candidates(brand, color, min_price, max_price, start_date, end_date)
+        if plates is None:
+            return [record.to_model() for record in self._iter_in_order(root)]
+
+        # Se parte del índice más selectivo y el resto se verifica sobre cada registro
+        brand = brand_key(brand) if brand is not None else None
+        color = color_code(color) if color is not None else None
+        low = sale_micros(start_date) if start_date is not None else None
+        high = sale_micros(end_date) if end_date is not None else None
         result = []
-        def _in_order(node):
-            if node:
-                _in_order(node.left)
-                result.append(node.data)
-                _in_order(node.right)
-        _in_order(self.root)
+        for plate in sorted(plates):
+            node = self._search(root, plate)
+            if node is None:
+                continue
+            record = node.record
+            if brand is not None and brand_key(record.brand) != brand:
+                continue
+            if color is not None and record.color_code != color:
+                continue
+            if min_price is not None and record.price < min_price:
+                continue
+            if max_price is not None and record.price > max_price:
+                continue
+            if low is not None and record.sale_us < low:
+                continue
+            if high is not None and record.sale_us > high:
+                continue
+            result.append(record.to_model())
         return result
 
-    def pre_order_traversal(self) -> List[CarSale]:
-        """Return nodes in pre-order (root, left, right)"""
+    def sales_by_date(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                      offset: int = 0, limit: int = 100) -> List[CarSale]:
+        """Car sales in [start_date, end_date] by sale time (then plate), in O(days + offset + limit)"""
+        low = sale_micros(start_date) if start_date is not None else None
+        high = sale_micros(end_date) if end_date is not None else None
+        root = self.root
+        with self._index_lock:
+            entries = list(islice(self.indexes.sale_date.entries(low, high, offset), limit))
         result = []
-        def _pre_order(node):
-            if node:
-                result.append(node.data)
-                _pre_order(node.left)
-                _pre_order(node.right)
-        _pre_order(self.root)
+        for sale_us, plate in entries:
+            # Una escritura posterior a la copia de la raíz puede haber cambiado el registro
+            node = self._search(root, plate)
+            if node is not None and node.record.sale_us == sale_us:
+                result.append(node.record.to_model())
         return result
 
+    def sales_histogram(self, start_date: Optional[datetime] = None,
+                        end_date: Optional[datetime] = None) -> List[Tuple[date, int]]:
+        """Sales per UTC day in [start_date, end_date], days without sales omitted (O(days))"""
+        low = sale_micros(start_date) if start_date is not None else None
+        high = sale_micros(end_date) if end_date is not None else None
+        with self._index_lock:
+            days = self.indexes.sale_date.histogram(low, high)
+        return [(day_date(day), count) for day, count in days]
+
+    def iter_traversal(self, order: str) -> Iterator[CarSale]:
+        """Lazily yield nodes in the given order (inorder, preorder, postorder)"""
+        if order == "inorder":
+            return self.iter_in_order()
+        if order == "preorder":
+            return self.iter_pre_order()
+        if order == "postorder":
+            return self.iter_post_order()
+        raise ValueError(f"Invalid traversal order: {order}")
+
+    def iter_traversal_records(self, order: str) -> Iterator[CarRecord]:
+        """Stored records of iter_traversal (no model is built)"""
+        root = self.root
+        if order == "inorder":
+            return self._iter_in_order(root)
+        if order == "preorder":
+            return self._iter_pre_order(root)
+        if order == "postorder":
+            return (node.record for node in self._iter_post_order_nodes(root))
+        raise ValueError(f"Invalid traversal order: {order}")
+
+    def in_order_traversal(self) -> List[CarSale]:
+        """Return nodes in in-order (left, root, right)"""
+        return list(self.iter_in_order())
+
+    def pre_order_traversal(self) -> List[CarSale]:
+        """Return nodes in pre-order (root, left, right)"""
+        return list(self.iter_pre_order())
+
     def post_order_traversal(self) -> List[CarSale]:
         """Return nodes in post-order (left, right, root)"""
-        result = []
-        def _post_order(node):
-            if node:
-                _post_order(node.left)
-                _post_order(node.right)
-                result.append(node.data)
-        _post_order(self.root)
-        return result
+        return list(self.iter_post_order())
+
+    @staticmethod
+    def _nodes_per_level(root: Optional[TreeNode]) -> Dict[int, int]:
+        """Count nodes per depth with an iterative breadth-first pass"""
+        levels = {}
+        level = [root] if root else []
+        depth = 0
+        while level:
+            levels[depth] = len(level)
+            level = [child for node in level for child in (node.left, node.right) if child]
+            depth += 1
+        return levels
 
-    def get_tree_stats(self) -> TreeStats:
-        """Get statistics about the tree"""
-        def _height(node):
-            if not node:
-                return 0
-            return 1 + max(_height(node.left), _height(node.right))
-            
-        def _count_nodes(node):
-            if not node:
-                return 0
-            return 1 + _count_nodes(node.left) + _count_nodes(node.right)
-            
-        def _count_leaves(node):
-            if not node:
-                return 0
+    def get_tree_stats(self, levels: bool = False) -> TreeStats:
+        """Height, size and leaves from the values cached on the root, in O(1)
+
+        Nodes per level are not kept on the nodes (a rotation moves a whole
+        subtree one level): with ``levels`` they are counted in O(n), once per
+        published root.
+        """
+        root = self.root
+        nodes_per_level = None
+        if levels:
+            cache = self._levels_cache
+            if cache is None or cache[0] is not root:
+                cache = (root, self._nodes_per_level(root))
+                self._levels_cache = cache
+            nodes_per_level = dict(cache[1])
+
+        return TreeStats(
+            height=node_height(root),
+            total_nodes=node_size(root),
+            leaf_count=node_leaves(root),
+            nodes_per_level=nodes_per_level
+        )
+
+    def verify_tree_stats(self) -> TreeStats:
+        """Recompute the statistics in one pass and repair the cached values if they drifted"""
+        root = self.root
+        height = total = leaves = 0
+        levels = {}
+        stack = [(root, 0)] if root else []
+        while stack:
+            node, depth = stack.pop()
+            total += 1
+            height = max(height, depth + 1)
+            levels[depth] = levels.get(depth, 0) + 1
             if not node.left and not node.right:
-                return 1
-            return _count_leaves(node.left) + _count_leaves(node.right)
-            
-        def _nodes_per_level(node, level, level_dict):
-            if not node:
-                return
-                
-            if level in level_dict:
-                level_dict[level] += 1
-            else:
-                level_dict[level] = 1
-                
-            _nodes_per_level(node.left, level + 1, level_dict)
-            _nodes_per_level(node.right, level + 1, level_dict)
-        
-        level_dict = {}
-        _nodes_per_level(self.root, 0, level_dict)
-        
+                leaves += 1
+            if node.left:
+                stack.append((node.left, depth + 1))
+            if node.right:
+                stack.append((node.right, depth + 1))
+
+        cache = self._levels_cache
+        cached = (node_height(root), node_size(root), node_leaves(root),
+                  cache[1] if cache is not None and cache[0] is root else levels)
+        verified = cached == (height, total, leaves, levels)
+        if not verified:
+            with self._write_lock:
+                # Nueva escritura: los nodos publicados no se tocan, se copian los que derivaron
+                # (y sus ancestros) y se publica la raíz nueva, que invalida las cachés
+                self._epoch += 1
+                self._publish(self._repaired(self.root))
+            self._levels_cache = None
+
         return TreeStats(
-            height=_height(self.root),
-            total_nodes=_count_nodes(self.root),
-            leaf_count=_count_leaves(self.root),
-            nodes_per_level=level_dict
+            height=height,
+            total_nodes=total,
+            leaf_count=leaves,
+            nodes_per_level=levels,
+            verified=verified
         )
 
+    def _repaired(self, root: Optional[TreeNode]) -> Optional[TreeNode]:
+        """Copy of the tree with correct cached fields, sharing every subtree that had none wrong"""
+        fields = ('height', 'size', 'leaves', 'diameter')
+        # Copias ya hechas, por id del nodo original (los hijos se visitan antes que el padre)
+        copies: Dict[int, TreeNode] = {}
+        for node in self._iter_post_order_nodes(root):
+            left = copies.pop(id(node.left), node.left)
+            right = copies.pop(id(node.right), node.right)
+            fixed = node.copy(self._epoch)
+            fixed.left, fixed.right = left, right
+            self._refresh(fixed)
+            if left is not node.left or right is not node.right or any(
+                    getattr(fixed, field) != getattr(node, field) for field in fields):
+                copies[id(node)] = fixed
+        return copies.get(id(root), root)
+
+    @staticmethod
+    def _descend(node: Optional[TreeNode], license_plate: str) -> Optional[List[CarRecord]]:
+        """Records visited from node down to the given plate (None if it is absent)"""
+        path = []
+        while node:
+            path.append(node.record)
+            plate = node.key
+            if license_plate == plate:
+                return path
+            node = node.left if license_plate < plate else node.right
+        return None
+
     def find_path(self, start_plate: str, end_plate: str) -> Optional[List[CarSale]]:
-        """Find the path between two nodes"""
-        def _find_lca(node, p, q):
-            if not node:
-                return None
-                
-            if node.data.license_plate == p or node.data.license_plate == q:
-                return node
-                
-            left = _find_lca(node.left, p, q)
-            right = _find_lca(node.right, p, q)
-            
-            if left and right:
-                return node
-                
-            return left if left else right
-            
-        def _get_path(root, path, k):
-            if not root:
-                return False
-                
-            path.append(root.data)
-            
-            if root.data.license_plate == k:
-                return True
-                
-            if (_get_path(root.left, path, k) or 
-                _get_path(root.right, path, k)):
-                return True
-                
-            path.pop()
-            return False
-            
-        lca = _find_lca(self.root, start_plate, end_plate)
-        if not lca:
+        """Find the path between two nodes through their lowest common ancestor in O(height)"""
+        path = self.find_path_records(start_plate, end_plate)
+        return [record.to_model() for record in path] if path is not None else None
+
+    def find_path_records(self, start_plate: str, end_plate: str) -> Optional[List[CarRecord]]:
+        """Stored records of find_path (no model is built)"""
+        low, high = min(start_plate, end_plate), max(start_plate, end_plate)
+
+        # El ancestro común más bajo es el primer nodo que separa ambas placas
+        lca = self.root
+        while lca:
+            plate = lca.key
+            if high < plate:
+                lca = lca.left
+            elif low > plate:
+                lca = lca.right
+            else:
+                break
+
+        to_start = self._descend(lca, start_plate)
+        to_end = self._descend(lca, end_plate)
+        if to_start is None or to_end is None:
             return None
-            
-        path1 = []
-        path2 = []
-        
-        _get_path(lca, path1, start_plate)
-        _get_path(lca, path2, end_plate)
-        
-        path2 = path2[1:]  # Remove the LCA from the second path
-        path2.reverse()
-        
-        return path1 + path2
+
+        return to_start[::-1] + to_end[1:]
+
+    @staticmethod
+    def _deepest_path(node: Optional[TreeNode]) -> List[CarRecord]:
+        """Records from node down to its deepest leaf, following cached heights"""
+        path = []
+        while node:
+            path.append(node.record)
+            node = node.left if node_height(node.left) > node_height(node.right) else node.right
+        return path
 
     def find_longest_path(self) -> List[CarSale]:
-        """Find the longest path between any two leaf nodes"""
-        def _longest_path(node):
-            if not node:
-                return 0, []
-                
-            left_height, left_path = _longest_path(node.left)
-            right_height, right_path = _longest_path(node.right)
-            
-            if left_height > right_height:
-                return left_height + 1, [node.data] + left_path
+        """Find the longest path between any two nodes (the tree diameter)"""
+        return [record.to_model() for record in self.find_longest_path_records()]
+
+    def find_longest_path_records(self) -> List[CarRecord]:
+        """Stored records of find_longest_path (no model is built)"""
+        root = self.root
+        cache = self._longest_path_cache
+        if cache is None or cache[0] is not root:
+            # Bajar hasta el nodo por el que pasa el diámetro: O(altura + largo del camino)
+            node = root
+            while node:
+                through = node_height(node.left) + node_height(node.right) + 1
+                if node.diameter == through:
+                    break
+                node = node.left if node_diameter(node.left) == node.diameter else node.right
+
+            if node is None:
+                cache = (root, [])
             else:
-                return right_height + 1, [node.data] + right_path
-                
-        if not self.root:
-            return []
-            
-        _, left_path = _longest_path(self.root.left)
-        _, right_path = _longest_path(self.root.right)
-        
-        left_path = left_path[::-1]  # Reverse to get path from leaf to root
-        right_path = right_path  # Already from root to leaf
-        
-        return left_path + [self.root.data] + right_path
+                left_path = self._deepest_path(node.left)[::-1]  # Desde la hoja hasta el nodo
+                right_path = self._deepest_path(node.right)
+                cache = (root, left_path + [node.record] + right_path)
+            self._longest_path_cache = cache
+
+        return cache[1]
@@ -0,0 +1,944 @@
+from typing import Optional, List, Dict, Any, Tuple, Iterator, Iterable, Callable
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+from bisect import bisect_left, bisect_right
+from datetime import datetime, date
+import heapq
+import os
+import struct
+import threading
+import uuid
+
+from .schemas import CarSale, TreeStats
+from .records import CarRecord, color_code, sale_micros
+from .indexes import brand_key, sale_day, day_date
+from .aggregates import summarize_records
+from .persistence import CsvSnapshot, car_to_row, write_csv_rows, open_snapshot
+from .persister import BackgroundPersister, DURABILITY_MODES, persister_from_env
+from .snapshot import NAIVE_OFFSET, BYTES_WRITTEN
+from .binary_tree import PERSISTENCE_SECONDS
+from ..utils.metrics import REGISTRY
+
+# Formato de car_sales.btree (little-endian), en páginas de PAGE_SIZE bytes:
+#   página 0: cabecera | resto: hojas (registros ordenados por placa) o páginas
+#   internas (separadores + hijos con la cantidad de registros de cada subárbol)
+PAGE_SIZE = 4096
+MAGIC = b"CSBTREE1"
+FORMAT_VERSION = 1
+# magic, formato, tamaño de página, raíz, altura, páginas, hojas, registros, próximo id, versión
+HEADER = struct.Struct("<8sIIIIQQQQQ")
+PAGE_HEADER = struct.Struct("<BH")  # tipo (hoja/interna), cantidad de entradas
+LEAF, INTERNAL = 0, 1
+# id, precio, fecha (µs), desfase horario, color, versión, bytes de placa, bytes de marca
+RECORD = struct.Struct("<qdqiBqHH")
+CHILD = struct.Struct("<IQ")  # página hija, registros del subárbol
+KEY_LENGTH = struct.Struct("<H")
+JOURNAL_ENTRY = struct.Struct("<I")
+JOURNAL_TRAILER = struct.Struct("<8sI")
+JOURNAL_MAGIC = b"CSBTJRNL"
+
+# Páginas decodificadas que se mantienen en memoria (4 KB en disco cada una)
+DEFAULT_CACHE_PAGES = 1024
+# Las hojas de una carga masiva se llenan hasta aquí: las altas siguientes no las parten enseguida
+BULK_FILL = 0.9
+# Una entrada nunca ocupa más que esto: una página partida siempre cabe
+MAX_ENTRY_BYTES = PAGE_SIZE // 4
+
+# Sin índices en memoria, filtros, agregados y consultas por fecha leen todas las hojas: O(n)
+FULL_SCANS = REGISTRY.counter(
+    "car_sales_btree_full_scans_total", "Queries the btree engine answered by reading every leaf page",
+    labels=("operation",)
+)
+
+
+class UnsupportedOperation(NotImplementedError):
+    """The storage engine cannot answer this query (e.g. binary-tree paths on a B-tree)"""
+
+
+def record_size(record: CarRecord) -> int:
+    return RECORD.size + len(record.license_plate.encode()) + len(record.brand.encode())
+
+
+def key_size(key: str) -> int:
+    return KEY_LENGTH.size + len(key.encode()) + CHILD.size
+
+
+class Page:
+    """One decoded page: a leaf with records or an internal page with separators
+
+    Child ``i`` of an internal page holds the plates in ``[keys[i-1], keys[i])``
+    and ``counts[i]`` records.
+    """
+    __slots__ = ('page_id', 'leaf', 'keys', 'records', 'versions', 'children', 'counts', 'nbytes')
+
+    def __init__(self, page_id: int, leaf: bool):
+        self.page_id = page_id
+        self.leaf = leaf
+        self.keys: List[str] = []
+        self.records: List[CarRecord] = []
+        self.versions: List[int] = []
+        self.children: List[int] = []
+        self.counts: List[int] = []
+        self.nbytes = PAGE_HEADER.size if leaf else PAGE_HEADER.size + CHILD.size
+
+    def total(self) -> int:
+        return len(self.keys) if self.leaf else sum(self.counts)
+
+    def append_record(self, record: CarRecord, version: int):
+        self.keys.append(record.license_plate)
+        self.records.append(record)
+        self.versions.append(version)
+        self.nbytes += record_size(record)
+
+    def append_child(self, key: Optional[str], child: int, count: int):
+        """Add the next child (key is its lower bound; None for the first child)"""
+        if key is not None:
+            self.keys.append(key)
+            self.nbytes += key_size(key)
+        self.children.append(child)
+        self.counts.append(count)
+
+    def insert_child(self, index: int, separator: str, right: int, left_count: int, right_count: int):
+        """Register that child ``index`` was split at ``separator`` into itself and ``right``"""
+        self.keys.insert(index, separator)
+        self.children.insert(index + 1, right)
+        self.counts[index] = left_count
+        self.counts.insert(index + 1, right_count)
+        self.nbytes += key_size(separator)
+
+    def split(self, page_id: int) -> Tuple['Page', str]:
+        """Move the upper half to a new page; returns it and the separator for the parent"""
+        right = Page(page_id, self.leaf)
+        mid = len(self.keys) // 2
+        if self.leaf:
+            right.keys, self.keys = self.keys[mid:], self.keys[:mid]
+            right.records, self.records = self.records[mid:], self.records[:mid]
+            right.versions, self.versions = self.versions[mid:], self.versions[:mid]
+            separator = right.keys[0]
+            self.nbytes = PAGE_HEADER.size + sum(map(record_size, self.records))
+            right.nbytes = PAGE_HEADER.size + sum(map(record_size, right.records))
+        else:
+            # La clave del medio sube al padre: no queda en ninguna de las dos mitades
+            separator = self.keys[mid]
+            right.keys, self.keys = self.keys[mid + 1:], self.keys[:mid]
+            right.children, self.children = self.children[mid + 1:], self.children[:mid + 1]
+            right.counts, self.counts = self.counts[mid + 1:], self.counts[:mid + 1]
+            self.nbytes = PAGE_HEADER.size + CHILD.size + sum(map(key_size, self.keys))
+            right.nbytes = PAGE_HEADER.size + CHILD.size + sum(map(key_size, right.keys))
+        return right, separator
+
+    def encode(self) -> bytes:
+        parts = [PAGE_HEADER.pack(LEAF if self.leaf else INTERNAL, len(self.keys))]
+        if self.leaf:
+            for record, version in zip(self.records, self.versions):
+                plate = record.license_plate.encode()
+                brand = record.brand.encode()
+                tz_offset = NAIVE_OFFSET if record.tz_offset is None else record.tz_offset
+                parts.append(RECORD.pack(record.id, record.price, record.sale_us, tz_offset,
+                                         record.color_code, version, len(plate), len(brand)))
+                parts.append(plate)
+                parts.append(brand)
+        else:
+            parts.append(CHILD.pack(self.children[0], self.counts[0]))
+            for key, child, count in zip(self.keys, self.children[1:], self.counts[1:]):
+                key = key.encode()
+                parts.append(KEY_LENGTH.pack(len(key)))
+                parts.append(key)
+                parts.append(CHILD.pack(child, count))
+        return b"".join(parts).ljust(PAGE_SIZE, b"\0")
+
+    @classmethod
+    def decode(cls, page_id: int, data: bytes) -> 'Page':
+        kind, count = PAGE_HEADER.unpack_from(data, 0)
+        page = cls(page_id, kind == LEAF)
+        position = PAGE_HEADER.size
+        if page.leaf:
+            for _ in range(count):
+                (record_id, price, sale_us, tz_offset, color,
+                 version, plate_length, brand_length) = RECORD.unpack_from(data, position)
+                position += RECORD.size
+                plate = data[position:position + plate_length].decode()
+                position += plate_length
+                brand = data[position:position + brand_length].decode()
+                position += brand_length
+                page.append_record(CarRecord(
+                    record_id, plate, brand, color, price, sale_us,
+                    None if tz_offset == NAIVE_OFFSET else tz_offset
+                ), version)
+        else:
+            child, subtree = CHILD.unpack_from(data, position)
+            position += CHILD.size
+            page.append_child(None, child, subtree)
+            for _ in range(count):
+                (length,) = KEY_LENGTH.unpack_from(data, position)
+                position += KEY_LENGTH.size
+                key = data[position:position + length].decode()
+                position += length
+                child, subtree = CHILD.unpack_from(data, position)
+                position += CHILD.size
+                page.append_child(key, child, subtree)
+        return page
+
+
+def bulk_load(path: str, entries: Iterable[Tuple[CarRecord, int]], next_id: int, version: int):
+    """Write a new B-tree file from (record, version) pairs sorted by plate, packing the pages"""
+    fill = int(PAGE_SIZE * BULK_FILL)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        next_page = 1
+        written = 0
+
+        def write(page: Page):
+            nonlocal written
+            os.pwrite(fd, page.encode(), page.page_id * PAGE_SIZE)
+            written += PAGE_SIZE
+
+        # Hojas: (primera placa, página, registros) de cada una para armar el nivel de arriba
+        level: List[Tuple[Optional[str], int, int]] = []
+        leaf = Page(next_page, True)
+        for record, record_version in entries:
+            if leaf.keys and leaf.nbytes + record_size(record) > fill:
+                write(leaf)
+                level.append((leaf.keys[0], leaf.page_id, len(leaf.keys)))
+                next_page += 1
+                leaf = Page(next_page, True)
+            leaf.append_record(record, record_version)
+        write(leaf)
+        level.append((leaf.keys[0] if leaf.keys else None, leaf.page_id, len(leaf.keys)))
+        next_page += 1
+        leaf_pages = len(level)
+        total = sum(count for _, _, count in level)
+        height = 1
+
+        while len(level) > 1:
+            upper = []
+            page = None
+            for key, child, count in level:
+                if page is not None and page.nbytes + key_size(key) > fill:
+                    write(page)
+                    upper.append((first_key, page.page_id, page.total()))
+                    page = None
+                if page is None:
+                    page = Page(next_page, False)
+                    next_page += 1
+                    first_key = key
+                    page.append_child(None, child, count)
+                else:
+                    page.append_child(key, child, count)
+            write(page)
+            upper.append((first_key, page.page_id, page.total()))
+            level = upper
+            height += 1
+
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, PAGE_SIZE, level[0][1], height,
+                             next_page, leaf_pages, total, next_id, version)
+        os.pwrite(fd, header.ljust(PAGE_SIZE, b"\0"), 0)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    BYTES_WRITTEN.inc("btree", amount=written + PAGE_SIZE)
+    os.replace(tmp_path, path)
+
+
+class BTreeStore:
+    """Disk-resident B+tree of car sales keyed by license plate (out-of-core engine)
+
+    Only a bounded LRU cache of decoded pages lives in memory, so the dataset
+    can grow past RAM. Pages modified by writes stay pinned in the cache until
+    a checkpoint writes them through a redo journal (a crash never leaves a
+    half-written tree). Deletion is lazy: pages are never merged, ``compact``
+    rebuilds the file packed. Offers the interface of ``BinarySearchTree``;
+    queries about binary-tree shape (paths, pre/post-order) raise
+    ``UnsupportedOperation``. Traversals read one leaf at a time under the
+    lock, so a long scan sees writes that land after it started.
+    """
+
+    def __init__(self, csv_file: str = "car_sales.csv", persistence: Optional[str] = None,
+                 snapshot_format: Optional[str] = None, durability: Optional[str] = None,
+                 cache_pages: Optional[int] = None, progress: Optional[Callable[[str, int], None]] = None):
+        if (persistence or os.getenv("CAR_SALES_PERSISTENCE", "csv")) == "shared":
+            raise ValueError("El motor btree usa un solo proceso: no soporta CAR_SALES_PERSISTENCE=shared")
+        self.csv_file = csv_file
+        self.path = os.path.splitext(csv_file)[0] + ".btree"
+        self.journal_file = self.path + ".journal"
+        self.snapshot_format = snapshot_format or os.getenv("CAR_SALES_SNAPSHOT_FORMAT", "csv")
+        self.durability = durability or os.getenv("CAR_SALES_DURABILITY", "group")
+        if self.durability not in DURABILITY_MODES:
+            raise ValueError(f"Modo de durabilidad no soportado: {self.durability}")
+        self.cache_pages = cache_pages or int(os.getenv("CAR_SALES_BTREE_CACHE_PAGES", DEFAULT_CACHE_PAGES))
+        self.instance_id = uuid.uuid4().hex[:12]
+        self._lock = threading.RLock()
+        # Un checkpoint a la vez (se toma antes que self._lock, nunca después)
+        self._io_lock = threading.Lock()
+        self._cache: "OrderedDict[int, Page]" = OrderedDict()
+        # Páginas modificadas desde el último checkpoint (no se desalojan)
+        self._dirty: Dict[int, Page] = {}
+        # Páginas que un checkpoint está escribiendo: se leen de aquí, no del archivo
+        self._in_flight: Dict[int, bytes] = {}
+        self._header_dirty = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._stats_cache: Optional[Tuple[int, TreeStats]] = None
+        self._durability_ticket = threading.local()
+        self._persister: Optional[BackgroundPersister] = None
+
+        if not os.path.exists(self.path):
+            self._import_snapshot(progress)
+        self._fd = os.open(self.path, os.O_RDWR)
+        if progress is not None:
+            progress("opening b-tree", 0)
+        self._recover_journal()
+        self._read_header()
+        if self.durability != "fsync":
+            self._persister = persister_from_env(lambda entries: self._checkpoint(), self.durability)
+
+    # --- Archivo, caché de páginas y checkpoints ---
+
+    def _import_snapshot(self, progress: Optional[Callable[[str, int], None]] = None):
+        """Build the B-tree file once from the existing snapshot (or CSV)"""
+        if progress is not None:
+            progress("reading snapshot", 0)
+        snapshot = open_snapshot(self.snapshot_format, self.csv_file)
+        records = snapshot.read() if snapshot.exists() else CsvSnapshot(self.csv_file).read()
+        if progress is not None:
+            progress("building b-tree", len(records))
+        # Orden estable: ante placas repetidas gana la última fila
+        records.sort(key=lambda record: record.license_plate)
+        unique: Dict[str, CarRecord] = {}
+        for record in records:
+            unique[record.license_plate] = record
+        next_id = max((record.id for record in records), default=0) + 1
+        bulk_load(self.path, ((record, 0) for record in unique.values()), next_id, 0)
+
+    def _read_header(self):
+        (magic, format_version, page_size, self._root, self._height, self._page_count,
+         self._leaf_pages, self._records, self._next_id, self.version) = HEADER.unpack_from(
+            os.pread(self._fd, HEADER.size, 0))
+        if magic != MAGIC or format_version != FORMAT_VERSION or page_size != PAGE_SIZE:
+            raise ValueError(f"{self.path} no es un archivo B-tree compatible")
+
+    def _encode_header(self) -> bytes:
+        return HEADER.pack(MAGIC, FORMAT_VERSION, PAGE_SIZE, self._root, self._height, self._page_count,
+                           self._leaf_pages, self._records, self._next_id, self.version).ljust(PAGE_SIZE, b"\0")
+
+    def _recover_journal(self):
+        """Redo a checkpoint interrupted by a crash (an incomplete journal is discarded)"""
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, "rb") as f:
+            data = f.read()
+        entry_size = JOURNAL_ENTRY.size + PAGE_SIZE
+        if len(data) >= JOURNAL_TRAILER.size:
+            magic, count = JOURNAL_TRAILER.unpack_from(data, len(data) - JOURNAL_TRAILER.size)
+            if magic == JOURNAL_MAGIC and len(data) == count * entry_size + JOURNAL_TRAILER.size:
+                for i in range(count):
+                    position = i * entry_size
+                    (page_id,) = JOURNAL_ENTRY.unpack_from(data, position)
+                    os.pwrite(self._fd, data[position + JOURNAL_ENTRY.size:position + entry_size],
+                              page_id * PAGE_SIZE)
+                os.fsync(self._fd)
+        os.remove(self.journal_file)
+
+    def _page(self, page_id: int) -> Page:
+        """Page from the LRU cache, or read and decoded from disk (call under the lock)"""
+        page = self._cache.get(page_id)
+        if page is not None:
+            self.cache_hits += 1
+            self._cache.move_to_end(page_id)
+            return page
+        self.cache_misses += 1
+        data = self._in_flight.get(page_id)
+        if data is None:
+            data = os.pread(self._fd, PAGE_SIZE, page_id * PAGE_SIZE)
+        page = Page.decode(page_id, data)
+        self._cache[page_id] = page
+        self._evict()
+        return page
+
+    def _evict(self):
+        while len(self._cache) > self.cache_pages:
+            # La menos usada que no tenga cambios sin escribir
+            victim = next((page_id for page_id in self._cache if page_id not in self._dirty), None)
+            if victim is None:
+                return
+            del self._cache[victim]
+
+    def _touch(self, page: Page):
+        """Mark a page as modified: it stays in memory until the next checkpoint"""
+        self._dirty[page.page_id] = page
+        self._cache[page.page_id] = page
+        self._cache.move_to_end(page.page_id)
+        self._header_dirty = True
+        self._evict()
+
+    def _allocate(self) -> int:
+        page_id = self._page_count
+        self._page_count += 1
+        return page_id
+
+    def _checkpoint(self):
+        """Write the modified pages atomically: journal + fsync, then in place + fsync"""
+        with self._io_lock:
+            with self._lock:
+                if not self._dirty and not self._header_dirty:
+                    return
+                pages = {page_id: page.encode() for page_id, page in self._dirty.items()}
+                pages[0] = self._encode_header()
+                self._dirty.clear()
+                self._header_dirty = False
+                self._in_flight = pages
+            try:
+                with PERSISTENCE_SECONDS.time("checkpoint"):
+                    self._write_journal(pages)
+                    for page_id, data in pages.items():
+                        os.pwrite(self._fd, data, page_id * PAGE_SIZE)
+                    os.fsync(self._fd)
+                    os.remove(self.journal_file)
+            except BaseException:
+                with self._lock:
+                    # Las páginas vuelven a quedar pendientes para el próximo intento
+                    for page_id, data in pages.items():
+                        if page_id == 0:
+                            self._header_dirty = True
+                        elif page_id not in self._dirty:
+                            page = self._cache.get(page_id) or Page.decode(page_id, data)
+                            self._dirty[page_id] = page
+                            self._cache[page_id] = page
+                    self._in_flight = {}
+                raise
+            BYTES_WRITTEN.inc("btree", amount=2 * len(pages) * PAGE_SIZE)
+            with self._lock:
+                self._in_flight = {}
+                # Las páginas ya escritas se pueden desalojar
+                self._evict()
+
+    def _write_journal(self, pages: Dict[int, bytes]):
+        with open(self.journal_file, "wb") as f:
+            for page_id, data in pages.items():
+                f.write(JOURNAL_ENTRY.pack(page_id))
+                f.write(data)
+            f.write(JOURNAL_TRAILER.pack(JOURNAL_MAGIC, len(pages)))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @contextmanager
+    def _writing(self):
+        """Serialize a write, then make it durable according to the durability mode"""
+        with self._lock:
+            yield
+        # Fuera del lock: el checkpoint toma self._io_lock y luego self._lock
+        if self._persister is None:
+            self._checkpoint()
+            return
+        if len(self._dirty) > self.cache_pages:
+            # Demasiadas páginas retenidas en memoria: escribirlas sin esperar al persistidor
+            self._persister.flush()
+        ticket = getattr(self._durability_ticket, 'value', None)
+        self._durability_ticket.value = None
+        if ticket is not None and self.durability == "group":
+            self._persister.wait(ticket)
+
+    def _submit(self):
+        if self._persister is not None:
+            self._durability_ticket.value = self._persister.submit([])
+
+    # --- Escrituras ---
+
+    def _descend(self, license_plate: str) -> Tuple[List[Tuple[Page, int]], Page]:
+        """Leaf where the plate belongs, with the (page, child index) path to it"""
+        path = []
+        page = self._page(self._root)
+        while not page.leaf:
+            i = bisect_right(page.keys, license_plate)
+            path.append((page, i))
+            page = self._page(page.children[i])
+        return path, page
+
+    def _insert_record(self, record: CarRecord) -> bool:
+        """Insert or replace a record; True if it was new (call under the lock)"""
+        size = record_size(record)
+        if size > MAX_ENTRY_BYTES:
+            raise ValueError("Registro demasiado grande para una página del B-tree")
+        plate = record.license_plate
+        path, leaf = self._descend(plate)
+        self.version += 1
+        self._next_id = max(self._next_id, record.id + 1)
+        i = bisect_left(leaf.keys, plate)
+        if i < len(leaf.keys) and leaf.keys[i] == plate:
+            leaf.nbytes += size - record_size(leaf.records[i])
+            leaf.records[i] = record
+            leaf.versions[i] = self.version
+            created = False
+        else:
+            leaf.keys.insert(i, plate)
+            leaf.records.insert(i, record)
+            leaf.versions.insert(i, self.version)
+            leaf.nbytes += size
+            self._records += 1
+            for page, index in path:
+                page.counts[index] += 1
+                self._touch(page)
+            created = True
+        self._touch(leaf)
+        if leaf.nbytes > PAGE_SIZE:
+            self._split(path, leaf)
+        return created
+
+    def _split(self, path: List[Tuple[Page, int]], page: Page):
+        """Split an overflowing page, and its ancestors while they overflow"""
+        while page.nbytes > PAGE_SIZE:
+            right, separator = page.split(self._allocate())
+            self._touch(page)
+            self._touch(right)
+            if page.leaf:
+                self._leaf_pages += 1
+            if not path:
+                root = Page(self._allocate(), False)
+                root.append_child(None, page.page_id, page.total())
+                root.append_child(separator, right.page_id, right.total())
+                self._touch(root)
+                self._root = root.page_id
+                self._height += 1
+                return
+            parent, index = path.pop()
+            parent.insert_child(index, separator, right.page_id, page.total(), right.total())
+            self._touch(parent)
+            page = parent
+
+    def _delete(self, license_plate: str) -> bool:
+        path, leaf = self._descend(license_plate)
+        i = bisect_left(leaf.keys, license_plate)
+        if i == len(leaf.keys) or leaf.keys[i] != license_plate:
+            return False
+        self.version += 1
+        leaf.nbytes -= record_size(leaf.records[i])
+        del leaf.keys[i]
+        del leaf.records[i]
+        del leaf.versions[i]
+        self._records -= 1
+        # Borrado perezoso: una hoja vacía se queda en el árbol hasta compactar
+        for page, index in path:
+            page.counts[index] -= 1
+            self._touch(page)
+        self._touch(leaf)
+        return True
+
+    def insert(self, data) -> CarSale:
+        """Insert a new car sale (or replace the one with the same plate)"""
+        with self._writing():
+            if hasattr(data, 'dict'):
+                data_dict = data.dict()
+                if not data_dict.get('id'):
+                    data_dict['id'] = self._next_id
+                    self._next_id += 1
+                data = CarRecord.from_values(**data_dict)
+            self._insert_record(data)
+            self._submit()
+        return data.to_model()
+
+    def bulk_insert(self, items: List[Any], upsert: bool = True) -> List[Tuple[str, CarRecord]]:
+        """Insert many car sales with a single checkpoint
+
+        Returns ("created" | "updated" | "conflict", record) per item, in order.
+        """
+        with self._writing():
+            results = []
+            for item in items:
+                existing = self._find_record(item.license_plate)
+                if existing is not None and not upsert:
+                    results.append(("conflict", existing[0]))
+                    continue
+                if existing is not None:
+                    record_id = existing[0].id
+                else:
+                    record_id = self._next_id
+                    self._next_id += 1
+                record = CarRecord.from_values(
+                    record_id, item.license_plate, item.brand, item.color, item.price, item.sale_date
+                )
+                self._insert_record(record)
+                results.append(("updated" if existing is not None else "created", record))
+            if results:
+                self._submit()
+            return results
+
+    def delete(self, license_plate: str) -> bool:
+        """Delete a car sale by license plate"""
+        with self._writing():
+            deleted = self._delete(license_plate)
+            if deleted:
+                self._submit()
+            return deleted
+
+    def update(self, license_plate: str, update_data: dict) -> Optional[CarSale]:
+        """Update a car sale's data"""
+        with self._writing():
+            found = self._find_record(license_plate)
+            if found is None:
+                return None
+            record = found[0].with_changes(update_data)
+            self._insert_record(record)
+            self._submit()
+            return record.to_model()
+
+    # --- Persistencia ---
+
+    @property
+    def pending_writes(self) -> int:
+        """Writes applied in memory but not yet persisted"""
+        return self._persister.pending if self._persister is not None else 0
+
+    def flush(self):
+        """Persist the modified pages now"""
+        if self._persister is not None:
+            self._persister.flush()
+
+    def save_tree(self):
+        """Write every modified page to the B-tree file"""
+        if self._persister is not None:
+            self._persister.flush(force=True)
+        else:
+            self._checkpoint()
+
+    def sync(self):
+        """Single-process engine: nothing to catch up with"""
+
+    def compact(self):
+        """Rewrite the file packed, reclaiming pages emptied by lazy deletion"""
+        self.save_tree()
+        with self._io_lock, self._lock:
+            bulk_load(self.path, self._iter_entries(), self._next_id, self.version)
+            os.close(self._fd)
+            self._fd = os.open(self.path, os.O_RDWR)
+            # El archivo nuevo ya incluye todo lo que estaba en memoria
+            self._cache.clear()
+            self._dirty.clear()
+            self._header_dirty = False
+            self._stats_cache = None
+            self._read_header()
+
+    def export_csv(self, path: str):
+        """Export the current contents as CSV (interchange format)"""
+        write_csv_rows(path, (car_to_row(record) for record in self._iter_from(0)))
+
+    def close(self):
+        """Persist pending writes and release the file"""
+        if self._persister is not None:
+            self._persister.close()
+        self._checkpoint()
+        with self._lock:
+            os.close(self._fd)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Page cache hits and misses since startup, and its current occupancy"""
+        with self._lock:
+            return {
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'cached_pages': len(self._cache),
+                'dirty_pages': len(self._dirty),
+                'capacity': self.cache_pages,
+            }
+
+    # --- Lecturas ---
+
+    def _find_record(self, license_plate: str) -> Optional[Tuple[CarRecord, int]]:
+        with self._lock:
+            _, leaf = self._descend(license_plate)
+            i = bisect_left(leaf.keys, license_plate)
+            if i < len(leaf.keys) and leaf.keys[i] == license_plate:
+                return leaf.records[i], leaf.versions[i]
+            return None
+
+    def __contains__(self, license_plate: str) -> bool:
+        return self._find_record(license_plate) is not None
+
+    def __len__(self) -> int:
+        return self._records
+
+    @property
+    def height(self) -> int:
+        return self._height
+
+    def find(self, license_plate: str) -> Optional[CarSale]:
+        """Find a car sale by license plate"""
+        found = self._find_record(license_plate)
+        return found[0].to_model() if found else None
+
+    def find_versioned(self, license_plate: str) -> Optional[Tuple[CarSale, int]]:
+        """Find a car sale together with the version of the write that stored it"""
+        found = self._find_record(license_plate)
+        return (found[0].to_model(), found[1]) if found else None
+
+    @property
+    def etag_scope(self) -> str:
+        """What ETag versions are counted in (one process: this instance)"""
+        return self.instance_id
+
+    @property
+    def etag_version(self) -> int:
+        return self.version
+
+    def _rest_of_leaf(self, path: List[Tuple[Page, int]], leaf: Page, index: int) -> List[CarRecord]:
+        """Records of leaf from index on; if none, those of the next non-empty leaf"""
+        while index >= len(leaf.keys):
+            # Subir hasta un ancestro con un hijo siguiente y bajar por su extremo izquierdo
+            while path and path[-1][1] + 1 >= len(path[-1][0].children):
+                path.pop()
+            if not path:
+                return []
+            parent, i = path.pop()
+            path.append((parent, i + 1))
+            page = self._page(parent.children[i + 1])
+            while not page.leaf:
+                path.append((page, 0))
+                page = self._page(page.children[0])
+            leaf, index = page, 0
+        return leaf.records[index:]
+
+    def _chunk_at(self, offset: int) -> List[CarRecord]:
+        """Records from the offset-th one (in plate order) to the end of its leaf"""
+        path = []
+        page = self._page(self._root)
+        while not page.leaf:
+            i = 0
+            while i < len(page.counts) - 1 and offset >= page.counts[i]:
+                offset -= page.counts[i]
+                i += 1
+            path.append((page, i))
+            page = self._page(page.children[i])
+        return self._rest_of_leaf(path, page, offset)
+
+    def _chunk_from(self, license_plate: str, inclusive: bool) -> List[CarRecord]:
+        """Records from the first plate >= (or >) the given one to the end of its leaf"""
+        path, leaf = self._descend(license_plate)
+        index = (bisect_left if inclusive else bisect_right)(leaf.keys, license_plate)
+        return self._rest_of_leaf(path, leaf, index)
+
+    def _scan(self, chunk: List[CarRecord]) -> Iterator[CarRecord]:
+        """Continue a scan one leaf at a time, resuming after the last plate seen"""
+        while chunk:
+            yield from chunk
+            with self._lock:
+                chunk = self._chunk_from(chunk[-1].license_plate, inclusive=False)
+
+    def _iter_from(self, offset: int = 0, after: Optional[str] = None) -> Iterator[CarRecord]:
+        with self._lock:
+            if after is not None:
+                offset += self._rank(after, inclusive=True)
+            chunk = self._chunk_at(offset)
+        return self._scan(chunk)
+
+    def _iter_entries(self) -> Iterator[Tuple[CarRecord, int]]:
+        """(record, version) pairs in plate order (call under the lock)"""
+        stack = [self._root]
+        while stack:
+            page = self._page(stack.pop())
+            if page.leaf:
+                yield from zip(page.records, page.versions)
+            else:
+                stack.extend(reversed(page.children))
+
+    def rank(self, license_plate: str, inclusive: bool = False) -> int:
+        """Number of plates lower than (or equal to, if inclusive) the given one"""
+        with self._lock:
+            return self._rank(license_plate, inclusive)
+
+    def _rank(self, license_plate: str, inclusive: bool) -> int:
+        count = 0
+        page = self._page(self._root)
+        while not page.leaf:
+            i = bisect_right(page.keys, license_plate)
+            count += sum(page.counts[:i])
+            page = self._page(page.children[i])
+        return count + (bisect_right if inclusive else bisect_left)(page.keys, license_plate)
+
+    def select(self, index: int) -> Optional[CarSale]:
+        """Return the car sale at the given in-order position (0-based)"""
+        if not 0 <= index < self._records:
+            return None
+        with self._lock:
+            chunk = self._chunk_at(index)
+        return chunk[0].to_model() if chunk else None
+
+    def iter_records_from(self, offset: int = 0, after: Optional[str] = None) -> Iterator[CarRecord]:
+        """Stored records in plate order from the given position, seeking with the page counts"""
+        return self._iter_from(offset, after)
+
+    def iter_in_order_from(self, offset: int = 0, after: Optional[str] = None) -> Iterator[CarSale]:
+        return (record.to_model() for record in self._iter_from(offset, after))
+
+    def iter_in_order(self) -> Iterator[CarSale]:
+        return self.iter_in_order_from()
+
+    def iter_pre_order(self) -> Iterator[CarSale]:
+        raise UnsupportedOperation("The btree engine only supports the inorder traversal")
+
+    def iter_post_order(self) -> Iterator[CarSale]:
+        raise UnsupportedOperation("The btree engine only supports the inorder traversal")
+
+    def iter_traversal(self, order: str) -> Iterator[CarSale]:
+        return (record.to_model() for record in self.iter_traversal_records(order))
+
+    def iter_traversal_records(self, order: str) -> Iterator[CarRecord]:
+        if order == "inorder":
+            return self._iter_from(0)
+        if order in ("preorder", "postorder"):
+            raise UnsupportedOperation("The btree engine only supports the inorder traversal")
+        raise ValueError(f"Invalid traversal order: {order}")
+
+    def in_order_traversal(self) -> List[CarSale]:
+        return list(self.iter_in_order())
+
+    def pre_order_traversal(self) -> List[CarSale]:
+        return list(self.iter_pre_order())
+
+    def post_order_traversal(self) -> List[CarSale]:
+        return list(self.iter_post_order())
+
+    def iter_range(self, start: Optional[str] = None, end: Optional[str] = None,
+                   prefix: Optional[str] = None) -> Iterator[CarSale]:
+        """Lazily yield plates in [start, end] that begin with prefix"""
+        if prefix and (start is None or start < prefix):
+            start = prefix
+        with self._lock:
+            chunk = self._chunk_at(0) if start is None else self._chunk_from(start, inclusive=True)
+        for record in self._scan(chunk):
+            plate = record.license_plate
+            if end is not None and plate > end:
+                return
+            if prefix and not plate.startswith(prefix):
+                return
+            yield record.to_model()
+
+    def filter(self, brand: Optional[str] = None, color=None,
+               min_price: Optional[float] = None, max_price: Optional[float] = None,
+               start_date: Optional[datetime] = None,
+               end_date: Optional[datetime] = None) -> List[CarSale]:
+        """Car sales matching every given criterion, by a full scan (no in-memory indexes)"""
+        brand = brand_key(brand) if brand is not None else None
+        color = color_code(color) if color is not None else None
+        low = sale_micros(start_date) if start_date is not None else None
+        high = sale_micros(end_date) if end_date is not None else None
+        FULL_SCANS.inc("filter")
+        result = []
+        for record in self._iter_from(0):
+            if brand is not None and brand_key(record.brand) != brand:
+                continue
+            if color is not None and record.color_code != color:
+                continue
+            if min_price is not None and record.price < min_price:
+                continue
+            if max_price is not None and record.price > max_price:
+                continue
+            if low is not None and record.sale_us < low:
+                continue
+            if high is not None and record.sale_us > high:
+                continue
+            result.append(record.to_model())
+        return result
+
+    def _iter_sales_between(self, start_date: Optional[datetime],
+                            end_date: Optional[datetime]) -> Iterator[CarRecord]:
+        low = sale_micros(start_date) if start_date is not None else None
+        high = sale_micros(end_date) if end_date is not None else None
+        for record in self._iter_from(0):
+            if (low is None or record.sale_us >= low) and (high is None or record.sale_us <= high):
+                yield record
+
+    def sales_by_date(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                      offset: int = 0, limit: int = 100) -> List[CarSale]:
+        """Car sales in [start_date, end_date] by sale time (then plate), by a full scan"""
+        FULL_SCANS.inc("sales_by_date")
+        # Solo se conservan offset + limit registros mientras se recorre
+        matches = heapq.nsmallest(offset + limit, self._iter_sales_between(start_date, end_date),
+                                  key=lambda record: (record.sale_us, record.license_plate))
+        return [record.to_model() for record in matches[offset:]]
+
+    def sales_histogram(self, start_date: Optional[datetime] = None,
+                        end_date: Optional[datetime] = None) -> List[Tuple[date, int]]:
+        """Sales per UTC day in [start_date, end_date], by a full scan"""
+        FULL_SCANS.inc("sales_histogram")
+        days = Counter(sale_day(record.sale_us) for record in self._iter_sales_between(start_date, end_date))
+        return [(day_date(day), count) for day, count in sorted(days.items())]
+
+    def get_aggregates(self, group_by: Optional[str] = None) -> Dict[str, Any]:
+        """Price aggregates by brand, color and sale month, computed by a full scan"""
+        FULL_SCANS.inc("aggregates")
+        return summarize_records(self._iter_from(0), group_by)
+
+    def get_tree_stats(self, levels: bool = False) -> TreeStats:
+        """B-tree shape from the header: levels, records and leaf pages
+
+        With ``levels`` also the pages per level, reading every internal page
+        (never the leaves) once per version.
+        """
+        with self._lock:
+            pages_per_level = None
+            if levels:
+                cache = self._stats_cache
+                if cache is None or cache[0] != self.version:
+                    pages_per_level = {}
+                    level = [self._root]
+                    for depth in range(self._height):
+                        pages_per_level[depth] = len(level)
+                        if depth < self._height - 1:
+                            level = [child for page_id in level for child in self._page(page_id).children]
+                    cache = self._stats_cache = (self.version, pages_per_level)
+                pages_per_level = dict(cache[1])
+            return TreeStats(
+                height=self._height,
+                total_nodes=self._records,
+                leaf_count=self._leaf_pages,
+                nodes_per_level=pages_per_level
+            )
+
+    def verify_tree_stats(self) -> TreeStats:
+        """Walk every page, checking (and repairing) the subtree counts and totals"""
+        with self._writing():
+            levels: Dict[int, int] = {}
+            total = self._verify_page(self._root, 0, levels)
+            cached = self.get_tree_stats(levels=True)
+            verified = (cached.total_nodes, cached.leaf_count, cached.nodes_per_level) == (
+                total, levels.get(self._height - 1, 0), levels)
+            if not verified:
+                self._records = total
+                self._leaf_pages = levels.get(self._height - 1, 0)
+                self._header_dirty = True
+                # Las estadísticas cambiaron: invalidar las respuestas cacheadas
+                self.version += 1
+                self._submit()
+            return TreeStats(
+                height=self._height,
+                total_nodes=total,
+                leaf_count=self._leaf_pages,
+                nodes_per_level=levels,
+                verified=verified
+            )
+
+    def _verify_page(self, page_id: int, depth: int, levels: Dict[int, int]) -> int:
+        levels[depth] = levels.get(depth, 0) + 1
+        page = self._page(page_id)
+        if page.leaf:
+            return len(page.keys)
+        children = list(page.children)
+        counts = [self._verify_page(child, depth + 1, levels) for child in children]
+        # La página pudo salir de la caché mientras se recorrían sus hijos
+        page = self._page(page_id)
+        if counts != page.counts:
+            page.counts = counts
+            self._touch(page)
+        return sum(counts)
+
+    def find_path(self, start_plate: str, end_plate: str) -> Optional[List[CarSale]]:
+        raise UnsupportedOperation("Paths between nodes are only defined for the binary tree engines")
+
+    def find_path_records(self, start_plate: str, end_plate: str) -> Optional[List[CarRecord]]:
+        raise UnsupportedOperation("Paths between nodes are only defined for the binary tree engines")
+
+    def find_longest_path(self) -> List[CarSale]:
+        raise UnsupportedOperation("The longest path is only defined for the binary tree engines")
+
+    def find_longest_path_records(self) -> List[CarRecord]:
+        raise UnsupportedOperation("The longest path is only defined for the binary tree engines")
@@ -0,0 +1,21 @@
+from typing import Optional
+from .binary_tree import BinarySearchTree
+from .avl_tree import AVLTree
+from .btree_store import BTreeStore
+import os
+
+# Motores disponibles, seleccionables con CAR_SALES_TREE_ENGINE
+ENGINES = {
+    "bst": BinarySearchTree,
+    "avl": AVLTree,
+    # B+tree en disco con caché de páginas: el conjunto de datos no tiene que caber en memoria
+    "btree": BTreeStore,
+}
+
+
+def create_tree(engine: Optional[str] = None, **kwargs) -> BinarySearchTree:
+    """Create the configured tree engine"""
+    name = engine or os.getenv("CAR_SALES_TREE_ENGINE", "avl")
+    if name not in ENGINES:
+        raise ValueError(f"Unknown tree engine: {name}")
+    return ENGINES[name](**kwargs)
@@ -0,0 +1,314 @@
+from typing import Optional, List, Dict, Set, Tuple, Any, Iterable, Iterator
+from datetime import datetime, date, timedelta
+from bisect import bisect_left, bisect_right, insort
+from .records import CarRecord, EPOCH, COLORS, color_code, sale_micros
+from .snapshot import SnapshotColumns
+
+# Microsegundos de un día: las ventas se agrupan por día UTC
+DAY_US = 86_400_000_000
+
+# Entradas por bucket de SortedIndex al cargarlo; un bucket se parte al pasar del doble
+SORTED_BUCKET_SIZE = 1000
+
+
+def brand_key(brand: str) -> str:
+    """Normalized brand used as index key (case-insensitive)"""
+    return brand.casefold()
+
+
+def group_by_code(values: Iterable[Any], codes: Iterable[int], code_count: int) -> List[List[Any]]:
+    """Split a column into one list per small-int code (brand or color position)"""
+    groups: List[List[Any]] = [[] for _ in range(code_count)]
+    for value, code in zip(values, codes):
+        groups[code].append(value)
+    return groups
+
+
+class HashIndex:
+    """Equality index: key -> set of license plates"""
+
+    def __init__(self):
+        self._buckets: Dict[Any, Set[str]] = {}
+
+    def add(self, key, license_plate: str):
+        self._buckets.setdefault(key, set()).add(license_plate)
+
+    def remove(self, key, license_plate: str):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return
+        bucket.discard(license_plate)
+        if not bucket:
+            del self._buckets[key]
+
+    def count(self, key) -> int:
+        return len(self._buckets.get(key, ()))
+
+    def lookup(self, key) -> Set[str]:
+        return self._buckets.get(key, set())
+
+    def load(self, groups: Iterable[Tuple[Any, List[str]]]):
+        """Replace the contents with (key, plates) groups (a key may come in several)"""
+        self._buckets = {}
+        for key, plates in groups:
+            if plates:
+                self._buckets.setdefault(key, set()).update(plates)
+
+    def clear(self):
+        self._buckets.clear()
+
+
+class SortedIndex:
+    """Ordered index of (key, license plate) pairs for range lookups
+
+    The entries are kept in sorted buckets of up to 2 * SORTED_BUCKET_SIZE (a
+    bucket that grows past it is split in two), with the last entry of each in
+    ``_maxes``. Adding or removing bisects to one bucket and shifts entries
+    only inside it: O(log n + bucket size) instead of O(n) for a flat list.
+    A range bisects its first and last bucket: O(buckets + results).
+    """
+
+    def __init__(self):
+        self._buckets: List[List[Tuple[Any, str]]] = []
+        # Última entrada de cada bucket, para encontrar el suyo con bisect
+        self._maxes: List[Tuple[Any, str]] = []
+
+    def add(self, key, license_plate: str):
+        entry = (key, license_plate)
+        if not self._buckets:
+            self._buckets.append([entry])
+            self._maxes.append(entry)
+            return
+        i = bisect_left(self._maxes, entry)
+        if i == len(self._maxes):
+            # Mayor que todas: va al final del último bucket
+            i -= 1
+            self._buckets[i].append(entry)
+            self._maxes[i] = entry
+        else:
+            insort(self._buckets[i], entry)
+        bucket = self._buckets[i]
+        if len(bucket) > 2 * SORTED_BUCKET_SIZE:
+            self._buckets[i:i + 1] = [bucket[:SORTED_BUCKET_SIZE], bucket[SORTED_BUCKET_SIZE:]]
+            self._maxes[i:i + 1] = [bucket[SORTED_BUCKET_SIZE - 1], bucket[-1]]
+
+    def remove(self, key, license_plate: str):
+        entry = (key, license_plate)
+        i = bisect_left(self._maxes, entry)
+        if i == len(self._maxes):
+            return
+        bucket = self._buckets[i]
+        j = bisect_left(bucket, entry)
+        if bucket[j] != entry:
+            return
+        del bucket[j]
+        if not bucket:
+            del self._buckets[i]
+            del self._maxes[i]
+        elif j == len(bucket):
+            self._maxes[i] = bucket[-1]
+
+    def _bucket_range(self, low, high) -> Tuple[int, int]:
+        """First and past-the-last bucket that may hold entries in [low, high]"""
+        # Las placas son cadenas no vacías: "" queda antes y "\uffff" después de todas
+        first = 0 if low is None else bisect_left(self._maxes, (low, ""))
+        last = len(self._maxes)
+        if high is not None:
+            last = min(last, bisect_right(self._maxes, (high, "\uffff")) + 1)
+        return first, last
+
+    def _spans(self, low, high) -> Iterator[Tuple[List[Tuple[Any, str]], int, int]]:
+        """(bucket, lo, hi) for every bucket with entries in [low, high]"""
+        first, last = self._bucket_range(low, high)
+        for i in range(first, last):
+            bucket = self._buckets[i]
+            # Solo el primer y el último bucket pueden estar cortados
+            lo = bisect_left(bucket, (low, "")) if low is not None and i == first else 0
+            hi = (bisect_right(bucket, (high, "\uffff")) if high is not None and i == last - 1
+                  else len(bucket))
+            if hi > lo:
+                yield bucket, lo, hi
+
+    def count_range(self, low=None, high=None) -> int:
+        first, last = self._bucket_range(low, high)
+        if first >= last:
+            return 0
+        # Los buckets enteros se cuentan por su largo; solo se bisecan los dos extremos
+        count = sum(map(len, self._buckets[first:last]))
+        if low is not None:
+            count -= bisect_left(self._buckets[first], (low, ""))
+        if high is not None:
+            bucket = self._buckets[last - 1]
+            count -= len(bucket) - bisect_right(bucket, (high, "\uffff"))
+        return max(count, 0)
+
+    def range(self, low=None, high=None) -> Iterator[str]:
+        for bucket, lo, hi in self._spans(low, high):
+            for i in range(lo, hi):
+                yield bucket[i][1]
+
+    def load(self, entries: Iterable[Tuple[Any, str]]):
+        entries = sorted(entries)
+        self._buckets = [entries[i:i + SORTED_BUCKET_SIZE] for i in range(0, len(entries), SORTED_BUCKET_SIZE)]
+        self._maxes = [bucket[-1] for bucket in self._buckets]
+
+
+def sale_day(sale_us: int) -> int:
+    """UTC day number (days since the epoch) of a sale time in microseconds"""
+    return sale_us // DAY_US
+
+
+def day_date(day: int) -> date:
+    """Calendar date of a UTC day number"""
+    return (EPOCH + timedelta(days=day)).date()
+
+
+class DayBucketIndex:
+    """Sale-time index partitioned by UTC day, each day a sorted list of (time, plate)
+
+    Keys are microseconds since the epoch in UTC (``sale_micros``): aware dates
+    are converted and naive ones taken as UTC, so both kinds share buckets.
+    A range query touches only the days that have sales, and bisects only
+    the first and last of them: O(days + results).
+    """
+
+    def __init__(self):
+        self._buckets: Dict[int, List[Tuple[int, str]]] = {}
+        # Días con ventas, ordenados
+        self._days: List[int] = []
+
+    def add(self, key: int, license_plate: str):
+        day = sale_day(key)
+        bucket = self._buckets.get(day)
+        if bucket is None:
+            bucket = self._buckets[day] = []
+            insort(self._days, day)
+        insort(bucket, (key, license_plate))
+
+    def remove(self, key: int, license_plate: str):
+        day = sale_day(key)
+        bucket = self._buckets.get(day)
+        if bucket is None:
+            return
+        i = bisect_left(bucket, (key, license_plate))
+        if i < len(bucket) and bucket[i] == (key, license_plate):
+            del bucket[i]
+        if not bucket:
+            del self._buckets[day]
+            del self._days[bisect_left(self._days, day)]
+
+    def _spans(self, low: Optional[int], high: Optional[int]) -> Iterator[Tuple[int, List[Tuple[int, str]], int, int]]:
+        """(day, bucket, lo, hi) for every day with sales in [low, high]"""
+        first = 0 if low is None else bisect_left(self._days, sale_day(low))
+        last = len(self._days) if high is None else bisect_right(self._days, sale_day(high))
+        for i in range(first, last):
+            day = self._days[i]
+            bucket = self._buckets[day]
+            # Solo el primer y el último día pueden estar cortados
+            lo = bisect_left(bucket, (low, "")) if low is not None and i == first else 0
+            hi = (bisect_right(bucket, (high, "\uffff")) if high is not None and i == last - 1
+                  else len(bucket))
+            if hi > lo:
+                yield day, bucket, lo, hi
+
+    def count_range(self, low: Optional[int] = None, high: Optional[int] = None) -> int:
+        return sum(hi - lo for _, _, lo, hi in self._spans(low, high))
+
+    def range(self, low: Optional[int] = None, high: Optional[int] = None) -> Iterator[str]:
+        for _, license_plate in self.entries(low, high):
+            yield license_plate
+
+    def entries(self, low: Optional[int] = None, high: Optional[int] = None,
+                offset: int = 0) -> Iterator[Tuple[int, str]]:
+        """(time, plate) in time order from the offset-th match, skipping whole days"""
+        for _, bucket, lo, hi in self._spans(low, high):
+            if offset >= hi - lo:
+                offset -= hi - lo
+                continue
+            yield from bucket[lo + offset:hi]
+            offset = 0
+
+    def histogram(self, low: Optional[int] = None, high: Optional[int] = None) -> List[Tuple[int, int]]:
+        """(UTC day, sales) for every day with sales in the range"""
+        return [(day, hi - lo) for day, _, lo, hi in self._spans(low, high)]
+
+    def load(self, entries: Iterable[Tuple[int, str]]):
+        self._buckets = {}
+        for key, license_plate in entries:
+            self._buckets.setdefault(sale_day(key), []).append((key, license_plate))
+        for bucket in self._buckets.values():
+            bucket.sort()
+        self._days = sorted(self._buckets)
+
+
+class SecondaryIndexes:
+    """Brand/color hash indexes, a price sorted index and a day-bucketed sale_date index"""
+
+    def __init__(self):
+        self.brand = HashIndex()
+        self.color = HashIndex()
+        self.price = SortedIndex()
+        self.sale_date = DayBucketIndex()
+
+    def add(self, car: CarRecord):
+        plate = car.license_plate
+        self.brand.add(brand_key(car.brand), plate)
+        self.color.add(car.color_code, plate)
+        self.price.add(car.price, plate)
+        self.sale_date.add(car.sale_us, plate)
+
+    def remove(self, car: CarRecord):
+        plate = car.license_plate
+        self.brand.remove(brand_key(car.brand), plate)
+        self.color.remove(car.color_code, plate)
+        self.price.remove(car.price, plate)
+        self.sale_date.remove(car.sale_us, plate)
+
+    def rebuild(self, cars: Iterable[CarRecord]):
+        """Rebuild every index from scratch (sorted indexes in one sort)"""
+        self.brand.clear()
+        self.color.clear()
+        prices = []
+        dates = []
+        for car in cars:
+            plate = car.license_plate
+            self.brand.add(brand_key(car.brand), plate)
+            self.color.add(car.color_code, plate)
+            prices.append((car.price, plate))
+            dates.append((car.sale_us, plate))
+        self.price.load(prices)
+        self.sale_date.load(dates)
+
+    def rebuild_columns(self, columns: SnapshotColumns):
+        """Same as rebuild, from the columns of a binary snapshot"""
+        plates = columns.plates
+        brand_plates = group_by_code(plates, columns.brand_ids, len(columns.brands))
+        self.brand.load(zip(map(brand_key, columns.brands), brand_plates))
+        self.color.load(enumerate(group_by_code(plates, columns.colors, len(COLORS))))
+        self.price.load(zip(columns.prices, plates))
+        self.sale_date.load(zip(columns.sale_us, plates))
+
+    def candidates(self, brand: Optional[str] = None, color=None,
+                   min_price: Optional[float] = None, max_price: Optional[float] = None,
+                   start_date: Optional[datetime] = None,
+                   end_date: Optional[datetime] = None) -> Optional[Iterable[str]]:
+        """Plates from the most selective index, or None if no filter was given"""
+        options = []
+        if brand is not None:
+            key = brand_key(brand)
+            options.append((self.brand.count(key), lambda: self.brand.lookup(key)))
+        if color is not None:
+            key_color = color_code(color)
+            options.append((self.color.count(key_color), lambda: self.color.lookup(key_color)))
+        if min_price is not None or max_price is not None:
+            options.append((self.price.count_range(min_price, max_price),
+                            lambda: self.price.range(min_price, max_price)))
+        if start_date is not None or end_date is not None:
+            low = sale_micros(start_date) if start_date is not None else None
+            high = sale_micros(end_date) if end_date is not None else None
+            options.append((self.sale_date.count_range(low, high),
+                            lambda: self.sale_date.range(low, high)))
+        if not options:
+            return None
+        _, lookup = min(options, key=lambda option: option[0])
+        return list(lookup())
@@ -0,0 +1,123 @@
+from typing import Optional, Dict, Any, Callable
+import os
+import threading
+import time
+
+# Segundos que una petición espera a que termine la carga antes de recibir 503
+DEFAULT_READY_TIMEOUT = 5.0
+
+
+class TreeNotReady(RuntimeError):
+    """The tree is still loading (or failed to load): the API answers 503"""
+
+
+class TreeLoader:
+    """Creates the tree on a background thread and hands it out once loaded
+
+    Importing the app no longer reads the snapshot: the lifespan hook calls
+    ``start`` and the server accepts connections right away. Attribute access
+    is forwarded to the loaded tree, waiting up to ``timeout`` seconds for it
+    (``TreeNotReady`` after that). The first access starts the load if nobody
+    did, so tools and tests that skip the lifespan keep working.
+    """
+
+    def __init__(self, factory: Callable[..., Any], timeout: Optional[float] = None):
+        self._factory = factory
+        if timeout is None:
+            timeout = float(os.getenv("CAR_SALES_READY_TIMEOUT", DEFAULT_READY_TIMEOUT))
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._tree = None
+        self._error: Optional[BaseException] = None
+        # Fase actual y registros cargados, según los informa el motor
+        self._phase = "idle"
+        self._records = 0
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def start(self):
+        """Start loading on a background thread (only the first call does anything)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._started_at = time.monotonic()
+            self._phase = "starting"
+            self._thread = threading.Thread(target=self._load, name="car-sales-loader", daemon=True)
+            self._thread.start()
+
+    def _report(self, phase: str, records: int):
+        self._phase = phase
+        self._records = records
+
+    def _load(self):
+        try:
+            tree = self._factory(progress=self._report)
+        except BaseException as error:
+            self._error = error
+            self._phase = "failed"
+        else:
+            self._tree = tree
+            self._report("ready", len(tree))
+        finally:
+            self._finished_at = time.monotonic()
+            self._loaded.set()
+
+    @property
+    def loaded(self):
+        """The tree if it has finished loading, else None (never waits)"""
+        return self._tree
+
+    @property
+    def ready(self) -> bool:
+        return self._tree is not None
+
+    def wait(self, timeout: Optional[float] = None):
+        """The loaded tree, waiting up to ``timeout`` seconds (forever if None)"""
+        tree = self._tree
+        if tree is not None:
+            return tree
+        self.start()
+        if not self._loaded.wait(timeout):
+            raise TreeNotReady(f"Car sales are still loading ({self._phase})")
+        if self._error is not None:
+            raise TreeNotReady(f"Car sales failed to load: {self._error}")
+        return self._tree
+
+    def status(self) -> Dict[str, Any]:
+        """Loading state for the readiness probe"""
+        started, finished = self._started_at, self._finished_at
+        if started is None:
+            elapsed = 0.0
+        else:
+            elapsed = (finished if finished is not None else time.monotonic()) - started
+        return {
+            "ready": self.ready,
+            "phase": self._phase,
+            "records": self._records,
+            "elapsed_seconds": round(elapsed, 3),
+            "error": str(self._error) if self._error is not None else None,
+        }
+
+    def __getattr__(self, name: str):
+        # Solo se reenvían los atributos públicos: los privados faltan de verdad
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.wait(self.timeout), name)
+
+    def __len__(self) -> int:
+        return len(self.wait(self.timeout))
+
+    def __contains__(self, license_plate: str) -> bool:
+        return license_plate in self.wait(self.timeout)
+
+    def close(self):
+        """Wait for a load in progress, then close the tree (persists pending writes)"""
+        with self._lock:
+            thread = self._thread
+        if thread is None:
+            return
+        thread.join()
+        if self._tree is not None:
+            self._tree.close()
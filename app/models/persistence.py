@@ -0,0 +1,423 @@
+from typing import Optional, List, Dict, Iterator, Iterable, Union
+from contextlib import contextmanager, suppress
+from datetime import datetime
+from .schemas import CarSale
+from .records import CarRecord
+from .snapshot import BinarySnapshot, BYTES_WRITTEN
+import csv
+import json
+import os
+import struct
+import threading
+
+FIELDNAMES = ['id', 'license_plate', 'brand', 'color', 'price', 'sale_date']
+
+# Tamaño del log (en bytes) a partir del cual se compacta en un snapshot nuevo
+DEFAULT_COMPACTION_THRESHOLD = 1024 * 1024
+
+# Cabecera del archivo de lock del log compartido: id del log y bytes escritos en logs ya rotados
+LOCK_HEADER = struct.Struct("<8sQ")
+
+
+def car_to_row(car: Union[CarSale, CarRecord]) -> Dict[str, str]:
+    """Convert a CarSale or CarRecord into a CSV/log row"""
+    color = car.color.value if hasattr(car.color, 'value') else car.color
+    return {
+        'id': str(car.id),
+        'license_plate': car.license_plate,
+        'brand': car.brand,
+        'color': color,
+        'price': str(car.price),
+        'sale_date': car.sale_date.isoformat()
+    }
+
+
+def row_to_record(row: Dict[str, str]) -> CarRecord:
+    """Build a compact record from a trusted CSV/log row (no model validation)"""
+    return CarRecord.from_values(
+        row['id'], row['license_plate'], row['brand'], row['color'],
+        row['price'], datetime.fromisoformat(row['sale_date'])
+    )
+
+
+def read_csv_rows(path: str) -> Iterator[Dict[str, str]]:
+    """Yield the non-empty rows of a CSV snapshot"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            if not row['id']:  # Skip empty rows
+                continue
+            yield row
+
+
+def write_csv_rows(path: str, rows: Iterable[Dict[str, str]]):
+    """Atomically replace a CSV snapshot with the given rows"""
+    # Un temporal por proceso: varios workers pueden compactar a la vez
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CsvSnapshot:
+    """Snapshot stored as CSV (also the interchange format)"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def read(self) -> List[CarRecord]:
+        return [row_to_record(row) for row in read_csv_rows(self.path)]
+
+    def write(self, records: Iterable[CarRecord]):
+        write_csv_rows(self.path, (car_to_row(record) for record in records))
+        BYTES_WRITTEN.inc("snapshot", amount=os.path.getsize(self.path))
+
+
+def open_snapshot(snapshot_format: str, csv_file: str):
+    """Snapshot store for the configured format ("csv" or "binary")"""
+    if snapshot_format == "csv":
+        return CsvSnapshot(csv_file)
+    if snapshot_format == "binary":
+        return BinarySnapshot(os.path.splitext(csv_file)[0] + ".snap")
+    raise ValueError(f"Unknown snapshot format: {snapshot_format}")
+
+
+class WriteAheadLog:
+    """Append-only mutation log with background compaction into the snapshot"""
+
+    def __init__(self, log_file: str, snapshot,
+                 compaction_threshold: int = DEFAULT_COMPACTION_THRESHOLD, fsync: bool = False):
+        self.log_file = log_file
+        self.snapshot = snapshot
+        self.pending_file = log_file + '.compacting'
+        self.compaction_threshold = compaction_threshold
+        # Sincronizar con el disco tras cada escritura (sobrevive a un corte de luz, no solo a una caída)
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._compactor: Optional[threading.Thread] = None
+        self._handle = open(self.log_file, 'a')
+
+    def replay(self) -> Iterator[dict]:
+        """Yield the logged operations in order (pending compaction first)"""
+        for path in (self.pending_file, self.log_file):
+            yield from self._read_log(path)
+
+    @staticmethod
+    def _read_log(path: str) -> Iterator[dict]:
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            yield from WriteAheadLog._parse_lines(f)
+
+    @staticmethod
+    def _parse_lines(lines: Iterable[str]) -> Iterator[dict]:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # Última línea incompleta por una caída: se descarta
+                break
+
+    @staticmethod
+    def upsert_entry(car: CarRecord) -> dict:
+        return {'op': 'upsert', 'data': car_to_row(car)}
+
+    @staticmethod
+    def delete_entry(license_plate: str) -> dict:
+        return {'op': 'delete', 'license_plate': license_plate}
+
+    def append_upsert(self, car: CarRecord):
+        """Log the current state of a record"""
+        self._append(self.upsert_entry(car))
+
+    def append_upserts(self, cars: Iterable[CarRecord]):
+        """Log many records with a single write and flush"""
+        self._append_many([self.upsert_entry(car) for car in cars])
+
+    def append_delete(self, license_plate: str):
+        """Log the removal of a record"""
+        self._append(self.delete_entry(license_plate))
+
+    def append_entries(self, entries: List[dict]):
+        """Log already built entries (a batch of several writes) with a single write and flush"""
+        if entries:
+            self._append_many(entries)
+
+    def _append(self, entry: dict):
+        self._append_many([entry])
+
+    def _write_payload(self, entries: List[dict]) -> int:
+        """Write, flush and optionally fsync entries; returns the log size (call under the lock)"""
+        # json.dumps escapa lo que no es ASCII: caracteres == bytes
+        payload = ''.join(json.dumps(entry) + '\n' for entry in entries)
+        self._handle.write(payload)
+        self._handle.flush()
+        if self.fsync:
+            os.fsync(self._handle.fileno())
+        BYTES_WRITTEN.inc("wal", amount=len(payload))
+        return self._handle.tell()
+
+    def _append_many(self, entries: List[dict]):
+        with self._lock:
+            size = self._write_payload(entries)
+        if size >= self.compaction_threshold:
+            self.start_compaction()
+
+    def start_compaction(self):
+        """Rotate the log and fold it into the snapshot on a background thread"""
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            if not os.path.exists(self.pending_file):
+                if self._handle.tell() == 0:
+                    return
+                self._handle.close()
+                os.replace(self.log_file, self.pending_file)
+                self._handle = open(self.log_file, 'a')
+            self._compactor = threading.Thread(target=self._compact, daemon=True)
+            self._compactor.start()
+
+    def _compact(self):
+        """Merge snapshot + rotated log into a fresh snapshot"""
+        records = {}
+        if self.snapshot.exists():
+            records = {record.license_plate: record for record in self.snapshot.read()}
+        for entry in self._read_log(self.pending_file):
+            if entry['op'] == 'upsert':
+                records[entry['data']['license_plate']] = row_to_record(entry['data'])
+            elif entry['op'] == 'delete':
+                records.pop(entry['license_plate'], None)
+        self.snapshot.write(records[plate] for plate in sorted(records))
+        # Un checkpoint pudo haberlo borrado ya
+        with suppress(FileNotFoundError):
+            os.remove(self.pending_file)
+
+    def recover(self):
+        """Finish a compaction that was interrupted by a crash (call after replay)"""
+        if os.path.exists(self.pending_file):
+            self.start_compaction()
+
+    def wait_for_compaction(self):
+        """Block until a running compaction has finished"""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+    def checkpoint(self, records: List[CarRecord]):
+        """Write a full snapshot from the in-memory tree and reset the log"""
+        # La espera va dentro del lock: si no, una escritura (p. ej. del persistidor) podría
+        # arrancar otra compactación en medio, que terminaría después y pisaría este snapshot
+        with self._lock:
+            self.wait_for_compaction()
+            self.snapshot.write(records)
+            self._handle.seek(0)
+            self._handle.truncate()
+            if os.path.exists(self.pending_file):
+                os.remove(self.pending_file)
+
+    def size(self) -> int:
+        """Current size of the active log in bytes"""
+        with self._lock:
+            return self._handle.tell()
+
+    def close(self):
+        """Flush and close the active log"""
+        self.wait_for_compaction()
+        with self._lock:
+            self._handle.close()
+
+
+class SharedWriteAheadLog(WriteAheadLog):
+    """Write-ahead log shared by several worker processes
+
+    Writers serialize on an exclusive ``flock`` of ``<log>.lock``, first catch up
+    with the entries other workers appended and only then apply and log their
+    own change, so no update is lost. Readers stay on their in-memory tree and
+    tail the log periodically (bounded staleness). POSIX only.
+
+    The lock file also keeps a random id of the log and the bytes appended to
+    logs already rotated away, so ``position`` (bytes ever appended up to what
+    this process applied) names the same state in every worker.
+    """
+
+    def __init__(self, log_file: str, snapshot,
+                 compaction_threshold: int = DEFAULT_COMPACTION_THRESHOLD, fsync: bool = False):
+        import fcntl  # Solo existe en POSIX
+        self._fcntl = fcntl
+        self.lock_file = log_file + '.lock'
+        self._lock_fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        # flock es por descriptor: los hilos del proceso se turnan con un RLock
+        self._process_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_mode: Optional[int] = None
+        super().__init__(log_file, snapshot, compaction_threshold, fsync)
+        with self.exclusive():
+            if os.fstat(self._lock_fd).st_size < LOCK_HEADER.size:
+                os.pwrite(self._lock_fd, LOCK_HEADER.pack(os.urandom(8), 0), 0)
+            self.log_id = self._read_header()[0].hex()
+        # Posición (inodo, offset) hasta la que este proceso ya aplicó el log
+        self._tail_inode: Optional[int] = None
+        self._tail_offset = 0
+        # Bytes escritos en el log compartido desde su creación hasta esa posición
+        self.position = 0
+
+    def _read_header(self):
+        return LOCK_HEADER.unpack(os.pread(self._lock_fd, LOCK_HEADER.size, 0))
+
+    def _retire_log(self):
+        """Count the current log as rotated away (under the exclusive lock, before replacing it)"""
+        log_id, rotated = self._read_header()
+        # Antes de reemplazarlo: tras una caída en medio la posición sigue creciendo, nunca se repite
+        os.pwrite(self._lock_fd, LOCK_HEADER.pack(log_id, rotated + os.path.getsize(self.log_file)), 0)
+
+    @contextmanager
+    def _locked(self, mode: int):
+        with self._process_lock:
+            if self._lock_depth == 0:
+                self._fcntl.flock(self._lock_fd, mode)
+                self._lock_mode = mode
+            elif mode == self._fcntl.LOCK_EX and self._lock_mode != mode:
+                # Pasar de LOCK_SH a LOCK_EX con flock no es atómico: otro proceso podría
+                # escribir en medio. Quien necesite escribir debe tomar el exclusivo desde el inicio
+                raise RuntimeError("No se puede tomar el lock exclusivo del log dentro de uno compartido")
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    self._lock_mode = None
+                    self._fcntl.flock(self._lock_fd, self._fcntl.LOCK_UN)
+
+    def exclusive(self):
+        """Hold the cross-process writer lock (reentrant; not from inside ``shared``)"""
+        return self._locked(self._fcntl.LOCK_EX)
+
+    def shared(self):
+        """Hold the lock against compaction and checkpoints while reading files"""
+        return self._locked(self._fcntl.LOCK_SH)
+
+    def mark_synced(self):
+        """Record that everything currently in the log has been applied (call under a lock)"""
+        status = os.stat(self.log_file)
+        self._tail_inode = status.st_ino
+        self._tail_offset = status.st_size
+        self.position = self._read_header()[1] + status.st_size
+
+    def catch_up(self) -> Optional[List[dict]]:
+        """Entries appended by other workers since the last sync (call under a lock)
+
+        Returns None when the log was rotated and compacted away in between:
+        the caller must then reload from the snapshot.
+        """
+        status = os.stat(self.log_file)
+        if status.st_ino == self._tail_inode:
+            if status.st_size < self._tail_offset:
+                return None
+            entries = self._read_from(self.log_file, self._tail_offset)
+        else:
+            # Log rotado: terminar el archivo que se está compactando y seguir con el nuevo
+            try:
+                pending_inode = os.stat(self.pending_file).st_ino
+            except FileNotFoundError:
+                return None
+            if pending_inode != self._tail_inode:
+                return None
+            entries = self._read_from(self.pending_file, self._tail_offset)
+            entries.extend(self._read_from(self.log_file, 0))
+        self.mark_synced()
+        return entries
+
+    def _read_from(self, path: str, offset: int) -> List[dict]:
+        with open(path, 'r') as f:
+            f.seek(offset)
+            return list(self._parse_lines(f))
+
+    def _reopen_if_rotated(self):
+        """Another worker may have rotated or reset the log: append to the current file"""
+        if os.fstat(self._handle.fileno()).st_ino != os.stat(self.log_file).st_ino:
+            self._handle.close()
+            self._handle = open(self.log_file, 'a')
+
+    def _append_many(self, entries: List[dict]):
+        with self.exclusive():
+            self._reopen_if_rotated()
+            size = self._write_payload(entries)
+            self.mark_synced()
+            if size >= self.compaction_threshold:
+                self.start_compaction()
+
+    def start_compaction(self):
+        with self.exclusive():
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            if not os.path.exists(self.pending_file):
+                # Otro worker pudo haber compactado ya: se mira el tamaño real del log
+                if os.path.getsize(self.log_file) == 0:
+                    return
+                self._retire_log()
+                self._handle.close()
+                os.replace(self.log_file, self.pending_file)
+                self._handle = open(self.log_file, 'a')
+            self._compactor = threading.Thread(target=self._compact, daemon=True)
+            self._compactor.start()
+
+    def _compact(self):
+        records = {}
+        with self.shared():
+            try:
+                pending_inode = os.stat(self.pending_file).st_ino
+            except FileNotFoundError:
+                return  # Otro worker terminó la misma compactación
+            if self.snapshot.exists():
+                records = {record.license_plate: record for record in self.snapshot.read()}
+            entries = list(self._read_log(self.pending_file))
+        for entry in entries:
+            if entry['op'] == 'upsert':
+                records[entry['data']['license_plate']] = row_to_record(entry['data'])
+            elif entry['op'] == 'delete':
+                records.pop(entry['license_plate'], None)
+        # Reemplazar el snapshot antes de borrar el log rotado: quien lea en medio
+        # reaplica operaciones ya incluidas, lo que es idempotente
+        with self.exclusive():
+            try:
+                if os.stat(self.pending_file).st_ino != pending_inode:
+                    return  # Ya compactado, y otro worker rotó un log nuevo
+            except FileNotFoundError:
+                return
+            self.snapshot.write(records[plate] for plate in sorted(records))
+            os.remove(self.pending_file)
+
+    def checkpoint(self, records: List[CarRecord]):
+        # Sin esperar al compactador: quien llama ya tiene el lock exclusivo y el compactador
+        # lo necesita para terminar. Al borrar el log rotado, la compactación en curso ve que
+        # ya no existe y termina sin tocar el snapshot
+        with self.exclusive():
+            self.snapshot.write(records)
+            self._retire_log()
+            # Log vacío con un inodo nuevo: los demás workers detectan el cambio y recargan
+            tmp_path = f'{self.log_file}.{os.getpid()}.tmp'
+            open(tmp_path, 'w').close()
+            os.replace(tmp_path, self.log_file)
+            self._reopen_if_rotated()
+            if os.path.exists(self.pending_file):
+                os.remove(self.pending_file)
+            self.mark_synced()
+
+    def size(self) -> int:
+        return os.path.getsize(self.log_file)
+
+    def close(self):
+        super().close()
+        os.close(self._lock_fd)
@@ -0,0 +1,134 @@
+from typing import Optional, List, Callable, Any, Tuple
+import os
+import threading
+import time
+
+# "fsync": cada escritura se persiste (y sincroniza) antes de responder;
+# "group": un hilo persiste por lotes y cada escritura espera al lote que la incluye;
+# "periodic": el hilo persiste cada cierto tiempo y las escrituras no esperan
+DURABILITY_MODES = ('fsync', 'group', 'periodic')
+
+# Segundos de espera para juntar escrituras antes de persistir, por modo
+DEFAULT_FLUSH_INTERVALS = {'group': 0.0, 'periodic': 1.0}
+# Escrituras pendientes que fuerzan a persistir sin esperar al intervalo
+DEFAULT_FLUSH_BATCH_SIZE = 1000
+# Pausa tras un error de E/S antes de reintentar
+RETRY_DELAY = 0.1
+
+
+class BackgroundPersister:
+    """Coalesces writes and persists them in batches on a background thread
+
+    Writers ``submit`` their log entries (possibly none: the CSV snapshot is
+    rewritten from the current tree, whatever changed) and get a ticket.
+    The thread calls ``flush_fn`` once per batch, after waiting up to
+    ``interval`` seconds for more writes or until ``batch_size`` are pending.
+    In group mode the caller then ``wait``s for its ticket outside the tree
+    lock, so concurrent writers share one write + fsync.
+    """
+
+    def __init__(self, flush_fn: Callable[[List[Any]], None], mode: str = 'group',
+                 interval: Optional[float] = None, batch_size: int = DEFAULT_FLUSH_BATCH_SIZE):
+        if mode not in DEFAULT_FLUSH_INTERVALS:
+            raise ValueError(f"Modo de persistencia en segundo plano no soportado: {mode}")
+        self._flush_fn = flush_fn
+        self.mode = mode
+        self.interval = DEFAULT_FLUSH_INTERVALS[mode] if interval is None else interval
+        self.batch_size = batch_size
+        self._cond = threading.Condition()
+        # Serializa los volcados del hilo con los explícitos (save_tree, close)
+        self._flush_lock = threading.Lock()
+        self._entries: List[Any] = []
+        self._submitted = 0
+        self._flushed = 0
+        # (último ticket del lote que falló, excepción)
+        self._error: Optional[Tuple[int, BaseException]] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Writes submitted but not yet persisted"""
+        with self._cond:
+            return self._submitted - self._flushed
+
+    def submit(self, entries: List[Any]) -> int:
+        """Queue a write; returns the ticket to wait for"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("El persistidor ya está cerrado")
+            self._entries.extend(entries)
+            self._submitted += 1
+            self._cond.notify_all()
+            return self._submitted
+
+    def wait(self, ticket: int):
+        """Block until the batch containing ``ticket`` is durable (raises its error if it failed)"""
+        with self._cond:
+            while self._flushed < ticket:
+                if self._error is not None and self._error[0] >= ticket:
+                    raise self._error[1]
+                self._cond.wait()
+
+    def flush(self, force: bool = False):
+        """Persist everything submitted so far on the calling thread
+
+        With ``force`` the flush function runs even if nothing is pending.
+        """
+        with self._flush_lock:
+            with self._cond:
+                entries, self._entries = self._entries, []
+                upto = self._submitted
+            if upto == self._flushed and not force:
+                return
+            try:
+                self._flush_fn(entries)
+            except BaseException as error:
+                with self._cond:
+                    # Las entradas vuelven a la cola (delante de las nuevas) para reintentar
+                    self._entries[:0] = entries
+                    self._error = (upto, error)
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self._flushed = upto
+                self._error = None
+                self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._submitted == self._flushed and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                if self.interval:
+                    deadline = time.monotonic() + self.interval
+                    while (self._submitted - self._flushed < self.batch_size and not self._closed
+                           and self._cond.wait(max(0.0, deadline - time.monotonic()))):
+                        pass
+            try:
+                self.flush()
+            except Exception:
+                # El error ya se entregó a quienes esperaban: se reintenta tras una pausa
+                time.sleep(RETRY_DELAY)
+
+    def close(self):
+        """Stop the thread and persist whatever is still pending"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+
+
+def persister_from_env(flush_fn: Callable[[List[Any]], None], mode: str) -> BackgroundPersister:
+    """Background persister configured by CAR_SALES_FLUSH_INTERVAL and CAR_SALES_FLUSH_BATCH_SIZE"""
+    interval = os.getenv("CAR_SALES_FLUSH_INTERVAL")
+    batch_size = int(os.getenv("CAR_SALES_FLUSH_BATCH_SIZE", DEFAULT_FLUSH_BATCH_SIZE))
+    return BackgroundPersister(
+        flush_fn, mode, interval=float(interval) if interval is not None else None, batch_size=batch_size
+    )
@@ -0,0 +1,94 @@
+from typing import Optional, Dict, Any
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from .schemas import CarSale, Color
+import sys
+
+# El color se guarda como un entero pequeño: su posición en la enumeración
+COLORS = list(Color)
+COLOR_CODES = {color.value: code for code, color in enumerate(COLORS)}
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def color_code(color) -> int:
+    """Small-int code of a Color (accepts the enum or its value)"""
+    return COLOR_CODES[color.value if hasattr(color, 'value') else color]
+
+
+def sale_micros(sale_date: datetime) -> int:
+    """Microseconds since the epoch (naive dates are taken as UTC)"""
+    if sale_date.tzinfo is not None:
+        sale_date = sale_date.astimezone(timezone.utc).replace(tzinfo=None)
+    return (sale_date - EPOCH) // ONE_MICROSECOND
+
+
+@lru_cache(maxsize=None)
+def _fixed_timezone(offset_seconds: int) -> timezone:
+    return timezone(timedelta(seconds=offset_seconds))
+
+
+class CarRecord:
+    """Compact, immutable storage for one car sale (no per-instance __dict__)"""
+    __slots__ = ('id', 'license_plate', 'brand', 'color_code', 'price', 'sale_us', 'tz_offset', 'json')
+
+    def __init__(self, id: int, license_plate: str, brand: str, color_code: int,
+                 price: float, sale_us: int, tz_offset: Optional[int]):
+        self.id = id
+        self.license_plate = license_plate
+        self.brand = sys.intern(brand)
+        self.color_code = color_code
+        self.price = price
+        self.sale_us = sale_us
+        # Desfase UTC en segundos, o None si la fecha original no tenía zona horaria
+        self.tz_offset = tz_offset
+        # JSON ya codificado del registro (opcional); un cambio crea un registro nuevo, sin caché
+        self.json: Optional[bytes] = None
+
+    @classmethod
+    def from_values(cls, id: int, license_plate: str, brand: str, color,
+                    price: float, sale_date: datetime) -> 'CarRecord':
+        offset = sale_date.utcoffset()
+        return cls(
+            int(id), license_plate, brand, color_code(color), float(price),
+            sale_micros(sale_date), None if offset is None else int(offset.total_seconds())
+        )
+
+    @classmethod
+    def from_model(cls, car) -> 'CarRecord':
+        return cls.from_values(car.id, car.license_plate, car.brand, car.color, car.price, car.sale_date)
+
+    @property
+    def color(self) -> Color:
+        return COLORS[self.color_code]
+
+    @property
+    def sale_date(self) -> datetime:
+        instant = EPOCH + timedelta(microseconds=self.sale_us)
+        if self.tz_offset is None:
+            return instant
+        return (instant + timedelta(seconds=self.tz_offset)).replace(tzinfo=_fixed_timezone(self.tz_offset))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'license_plate': self.license_plate,
+            'brand': self.brand,
+            'color': self.color,
+            'price': self.price,
+            'sale_date': self.sale_date,
+        }
+
+    def with_changes(self, changes: Dict[str, Any]) -> 'CarRecord':
+        """Copy of the record with some fields replaced (None values are ignored)"""
+        values = self.to_dict()
+        for key, value in changes.items():
+            # La placa es la clave del árbol: no se puede cambiar en sitio
+            if value is not None and key in values and key != 'license_plate':
+                values[key] = value
+        return CarRecord.from_values(**values)
+
+    def to_model(self) -> CarSale:
+        """Build the Pydantic model only when a response needs it"""
+        return CarSale.construct(**self.to_dict())
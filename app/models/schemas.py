@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional
-from datetime import datetime
+from typing import Optional, List
+from datetime import datetime, date
 from enum import Enum
 
 class Color(str, Enum):
@@ -38,4 +38,55 @@ class TreeStats(BaseModel):
     height: int
     total_nodes: int
     leaf_count: int
-    nodes_per_level: dict[int, int]
+    nodes_per_level: Optional[dict[int, int]] = Field(None, description="Only when requested with levels=true")
+    verified: Optional[bool] = None
+
+class RankResult(BaseModel):
+    license_plate: str
+    rank: int
+    total: int
+
+class PathQuery(BaseModel):
+    start_plate: str = Field(..., min_length=6, max_length=10)
+    end_plate: str = Field(..., min_length=6, max_length=10)
+
+class PathResult(BaseModel):
+    start_plate: str
+    end_plate: str
+    found: bool
+    path: List[CarSale] = []
+
+class BulkItemResult(BaseModel):
+    index: int
+    license_plate: Optional[str] = None
+    status: str = Field(..., description="created, updated, conflict or invalid")
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class BulkInsertResult(BaseModel):
+    created: int
+    updated: int
+    failed: int
+    results: List[BulkItemResult]
+
+class AggregateGroup(BaseModel):
+    key: str
+    count: int
+    sum: float
+    min: float
+    max: float
+    average: float
+
+class AggregatesResult(BaseModel):
+    total: Optional[AggregateGroup] = None
+    brand: Optional[List[AggregateGroup]] = None
+    color: Optional[List[AggregateGroup]] = None
+    month: Optional[List[AggregateGroup]] = Field(None, description="Groups by UTC sale month (YYYY-MM)")
+
+class DayCount(BaseModel):
+    day: date = Field(..., description="UTC sale day")
+    count: int
+
+class SalesHistogram(BaseModel):
+    total: int
+    days: List[DayCount] = Field(..., description="Days with sales, in order")
@@ -0,0 +1,189 @@
+from typing import List, Iterable
+from array import array
+import mmap
+import os
+import struct
+import sys
+
+from .records import CarRecord
+from ..utils.metrics import REGISTRY
+
+# Formato binario del snapshot (little-endian):
+#   cabecera | ids q | precios d | fechas q | offsets de placas I | ids de marca I
+#   | desfases horarios i | offsets de marcas I | colores B | tabla de cadenas (UTF-8)
+# Los registros se escriben ordenados por placa, listos para construir el árbol balanceado.
+MAGIC = b"CSBTSNAP"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQQ")  # magic, version, reservado, registros, marcas, bytes de cadenas
+NAIVE_OFFSET = -2 ** 31  # Desfase que marca una fecha sin zona horaria
+
+BYTES_WRITTEN = REGISTRY.counter(
+    "car_sales_persistence_bytes_written_total", "Bytes written to the log and the snapshot", labels=("target",)
+)
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+class SnapshotColumns:
+    """A decoded binary snapshot: its records and the columns they were built from
+
+    The records are sorted by plate and unique (every writer stores them that
+    way), so the tree, its indexes and its aggregates can be built straight
+    from the columns without reading each attribute back from the records.
+    """
+    __slots__ = ('records', 'plates', 'ids', 'prices', 'sale_us', 'brands', 'brand_ids', 'colors')
+
+    def __init__(self, records: List[CarRecord], plates: List[str], ids: array, prices: array,
+                 sale_us: array, brands: List[str], brand_ids: array, colors: array):
+        self.records = records
+        self.plates = plates
+        self.ids = ids
+        self.prices = prices
+        self.sale_us = sale_us
+        # Marcas distintas; brand_ids[i] es la posición de la marca del registro i
+        self.brands = brands
+        self.brand_ids = brand_ids
+        self.colors = colors
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _layout(count: int, brand_count: int, strings_size: int):
+    """Byte offsets of every section (8-byte columns first to keep them aligned)"""
+    sections = [
+        ("ids", "q", count), ("prices", "d", count), ("sale_us", "q", count),
+        ("plate_offsets", "I", count + 1), ("brand_ids", "I", count),
+        ("tz_offsets", "i", count), ("brand_offsets", "I", brand_count + 1),
+        ("colors", "B", count),
+    ]
+    offsets = {}
+    position = HEADER.size
+    for name, typecode, length in sections:
+        offsets[name] = (position, typecode, length)
+        position += array(typecode).itemsize * length
+    offsets["strings"] = (position, "B", strings_size)
+    return offsets, position + strings_size
+
+
+def write_snapshot(path: str, records: Iterable[CarRecord]):
+    """Atomically write records (sorted by plate) as a binary snapshot"""
+    records = list(records)
+    brands = {}
+    strings = bytearray()
+    plate_offsets = array("I", [0])
+    for record in records:
+        strings += record.license_plate.encode()
+        plate_offsets.append(len(strings))
+        brands.setdefault(record.brand, len(brands))
+    brand_offsets = array("I", [len(strings)])
+    for brand in brands:
+        strings += brand.encode()
+        brand_offsets.append(len(strings))
+
+    columns = {
+        "ids": array("q", (r.id for r in records)),
+        "prices": array("d", (r.price for r in records)),
+        "sale_us": array("q", (r.sale_us for r in records)),
+        "plate_offsets": plate_offsets,
+        "brand_ids": array("I", (brands[r.brand] for r in records)),
+        "tz_offsets": array("i", (NAIVE_OFFSET if r.tz_offset is None else r.tz_offset for r in records)),
+        "brand_offsets": brand_offsets,
+        "colors": array("B", (r.color_code for r in records)),
+    }
+
+    layout, _ = _layout(len(records), len(brands), len(strings))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(records), len(brands), len(strings)))
+        for name in layout:
+            f.write(strings if name == "strings" else _little_endian(columns[name]))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> List[CarRecord]:
+    """Map a binary snapshot and decode it into records (sorted by plate)"""
+    return read_snapshot_columns(path).records
+
+
+def read_snapshot_columns(path: str) -> SnapshotColumns:
+    """Map a binary snapshot and decode it into records, keeping its columns"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < HEADER.size:
+            raise SnapshotError(f"{path}: truncated header")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            magic, version, _, count, brand_count, strings_size = HEADER.unpack_from(mapped, 0)
+            if magic != MAGIC or version != VERSION:
+                raise SnapshotError(f"{path}: not a version {VERSION} car sales snapshot")
+            layout, total_size = _layout(count, brand_count, strings_size)
+            if len(mapped) != total_size:
+                raise SnapshotError(f"{path}: expected {total_size} bytes, found {len(mapped)}")
+
+            columns = {}
+            with memoryview(mapped) as view:
+                for name, (offset, typecode, length) in layout.items():
+                    size = array(typecode).itemsize * length
+                    if name == "strings":
+                        columns[name] = bytes(view[offset:offset + size])
+                        continue
+                    column = array(typecode)
+                    column.frombytes(view[offset:offset + size])
+                    if sys.byteorder != "little":
+                        column.byteswap()
+                    columns[name] = column
+
+    return _decode(count, brand_count, columns)
+
+
+def _decode(count: int, brand_count: int, columns) -> SnapshotColumns:
+    blob = columns["strings"]
+    # Con texto ASCII los offsets en bytes coinciden con los de caracteres: se decodifica una vez
+    text = blob.decode("ascii") if blob.isascii() else None
+
+    def string_at(start: int, end: int) -> str:
+        return text[start:end] if text is not None else blob[start:end].decode()
+
+    brand_offsets = columns["brand_offsets"]
+    brands = [string_at(brand_offsets[i], brand_offsets[i + 1]) for i in range(brand_count)]
+
+    plate_offsets = columns["plate_offsets"]
+    plates = [string_at(plate_offsets[i], plate_offsets[i + 1]) for i in range(count)]
+    ids = columns["ids"]
+    prices = columns["prices"]
+    sale_us = columns["sale_us"]
+    brand_ids = columns["brand_ids"]
+    colors = columns["colors"]
+    records = [
+        CarRecord(id, plate, brands[brand_id], color, price, micros, None if tz == NAIVE_OFFSET else tz)
+        for id, plate, brand_id, color, price, micros, tz
+        in zip(ids, plates, brand_ids, colors, prices, sale_us, columns["tz_offsets"])
+    ]
+    return SnapshotColumns(records, plates, ids, prices, sale_us, brands, brand_ids, colors)
+
+
+class BinarySnapshot:
+    """Snapshot stored in the binary columnar format"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def read(self) -> List[CarRecord]:
+        return read_snapshot(self.path)
+
+    def read_columns(self) -> SnapshotColumns:
+        return read_snapshot_columns(self.path)
+
+    def write(self, records: Iterable[CarRecord]):
+        write_snapshot(self.path, records)
+        BYTES_WRITTEN.inc("snapshot", amount=os.path.getsize(self.path))
@@ -1,8 +1,16 @@
-from fastapi import APIRouter, HTTPException, Query, Path
-from typing import List, Optional
-from ..models.schemas import CarSale, CarSaleCreate, CarSaleUpdate, TreeStats
+from fastapi import APIRouter, HTTPException, Query, Path, Body, File, UploadFile, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+from ..models.schemas import (
+    CarSale, CarSaleCreate, CarSaleUpdate, TreeStats, RankResult, Color,
+    PathQuery, PathResult, BulkInsertResult, AggregatesResult, SalesHistogram,
+)
 from ..controllers.car_sales_controller import CarSalesController
 
+# Las rutas son síncronas a propósito: FastAPI las ejecuta en su pool de hilos, así
+# el recorrido del árbol y la escritura del CSV no bloquean el event loop.
 router = APIRouter(
     prefix="/api/car-sales",
     tags=["car-sales"],
@@ -10,17 +18,32 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=CarSale, status_code=201)
-async def create_car_sale(car_sale: CarSaleCreate):
+def create_car_sale(car_sale: CarSaleCreate):
     """Create a new car sale"""
     return CarSalesController.create_car_sale(car_sale)
 
-@router.get("/{license_plate}", response_model=CarSale)
-async def get_car_sale(license_plate: str = Path(..., min_length=6, max_length=10)):
-    """Get a car sale by license plate"""
-    return CarSalesController.get_car_sale(license_plate)
+@router.post("/bulk/", response_model=BulkInsertResult)
+def bulk_create_car_sales(
+    items: List[Dict[str, Any]] = Body(..., description="JSON array of car sales (CarSaleCreate)"),
+    upsert: bool = Query(True, description="Replace existing plates instead of reporting a conflict")
+):
+    """
+    Create or update many car sales with a single save
+    - Each item is validated on its own and gets its own result
+    """
+    return CarSalesController.bulk_create_car_sales(items, upsert)
+
+@router.post("/bulk/ndjson/", response_model=BulkInsertResult)
+async def bulk_create_car_sales_ndjson(
+    file: UploadFile = File(..., description="NDJSON file, one car sale per line"),
+    upsert: bool = Query(True, description="Replace existing plates instead of reporting a conflict")
+):
+    """Create or update many car sales from an NDJSON upload with a single save"""
+    content = await file.read()
+    return await run_in_threadpool(CarSalesController.bulk_create_car_sales_ndjson, content, upsert)
 
 @router.put("/{license_plate}", response_model=CarSale)
-async def update_car_sale(
+def update_car_sale(
     license_plate: str = Path(..., min_length=6, max_length=10),
     update_data: CarSaleUpdate = ...
 ):
@@ -28,39 +51,202 @@ async def update_car_sale(
     return CarSalesController.update_car_sale(license_plate, update_data)
 
 @router.delete("/{license_plate}", status_code=204)
-async def delete_car_sale(license_plate: str = Path(..., min_length=6, max_length=10)):
+def delete_car_sale(license_plate: str = Path(..., min_length=6, max_length=10)):
     """Delete a car sale"""
     CarSalesController.delete_car_sale(license_plate)
     return None
 
-@router.get("/traversal/{order}", response_model=List[CarSale])
-async def get_tree_traversal(
-    order: str = Path(..., regex="^(inorder|preorder|postorder)$")
+@router.get("/traversal/{order}", response_model=List[CarSale], responses={304: {"description": "Not modified"}})
+def get_tree_traversal(
+    order: str = Path(..., regex="^(inorder|preorder|postorder)$"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    after: Optional[str] = Query(None, min_length=1, max_length=10),
+    fast: bool = Query(False, description="Encode the stored records directly with the fast JSON encoder"),
+    if_none_match: Optional[str] = Header(None)
 ):
     """
     Get tree traversal
     - **order**: Traversal order (inorder, preorder, postorder)
+    - **offset**: Number of nodes to skip
+    - **limit**: Maximum number of nodes to return
+    - **after**: Cursor, only plates after this one (inorder only)
+    - **fast**: Skip building and re-encoding a CarSale per node (same JSON shape)
+    - The ETag is the tree version; send it back in If-None-Match to get a 304
+    """
+    if fast:
+        return CarSalesController.get_tree_traversal_fast(order, offset, limit, after, if_none_match)
+    return CarSalesController.get_tree_traversal_response(order, offset, limit, after, if_none_match)
+
+@router.get("/traversal/{order}/stream", response_class=StreamingResponse)
+def stream_tree_traversal(
+    order: str = Path(..., regex="^(inorder|preorder|postorder)$"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    after: Optional[str] = Query(None, min_length=1, max_length=10)
+):
+    """
+    Stream the tree traversal as NDJSON (one car sale per line)
+    - **order**: Traversal order (inorder, preorder, postorder)
+    """
+    return StreamingResponse(
+        CarSalesController.stream_tree_traversal(order, offset, limit, after),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/range/", response_model=List[CarSale])
+@router.get("/range", response_model=List[CarSale], include_in_schema=False)
+def get_range(
+    start: Optional[str] = Query(None, min_length=1, max_length=10),
+    end: Optional[str] = Query(None, min_length=1, max_length=10),
+    prefix: Optional[str] = Query(None, min_length=1, max_length=10),
+    limit: int = Query(100, ge=1, le=10000)
+):
+    """
+    Get car sales by license plate range and/or prefix, in plate order
+    - **start**: Lowest plate (inclusive)
+    - **end**: Highest plate (inclusive)
+    - **prefix**: Only plates starting with this text
+    - **limit**: Maximum number of results
+    """
+    return CarSalesController.get_range(start, end, prefix, limit)
+
+@router.get("/filter/", response_model=List[CarSale])
+@router.get("/filter", response_model=List[CarSale], include_in_schema=False)
+def filter_car_sales(
+    brand: Optional[str] = Query(None, min_length=2, max_length=50),
+    color: Optional[Color] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=10000)
+):
+    """
+    Filter car sales using the secondary indexes, sorted by license plate
+    - **brand**: Brand (case-insensitive)
+    - **color**: Color
+    - **min_price** / **max_price**: Price range (inclusive)
+    - **start_date** / **end_date**: Sale date range (inclusive)
+    - With CAR_SALES_TREE_ENGINE=btree there are no in-memory indexes: O(n), a full scan of the file
+    """
+    return CarSalesController.filter_car_sales(
+        brand, color, min_price, max_price, start_date, end_date, limit
+    )
+
+@router.get("/by-date/", response_model=List[CarSale])
+@router.get("/by-date", response_model=List[CarSale], include_in_schema=False)
+def get_sales_by_date(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=10000)
+):
+    """
+    List car sales in a sale date range, ordered by sale date (then license plate)
+    - **start_date** / **end_date**: Sale date range (inclusive); dates without a timezone are taken as UTC
+    - **offset** / **limit**: Page of the results
+    - Served by the per-day sale date index: the cost depends on the days in range and the page size
+    - With CAR_SALES_TREE_ENGINE=btree there are no in-memory indexes: O(n), a full scan of the file
     """
-    return CarSalesController.get_tree_traversal(order)
+    return CarSalesController.get_sales_by_date(start_date, end_date, offset, limit)
 
-@router.get("/stats/", response_model=TreeStats)
-async def get_tree_statistics():
-    """Get tree statistics"""
-    return CarSalesController.get_tree_statistics()
+@router.get("/by-date/histogram/", response_model=SalesHistogram, responses={304: {"description": "Not modified"}})
+def get_sales_histogram(
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Count car sales per UTC day in a sale date range (days without sales are omitted)
+    - **start_date** / **end_date**: Sale date range (inclusive); dates without a timezone are taken as UTC
+    - With CAR_SALES_TREE_ENGINE=btree there are no in-memory indexes: O(n), a full scan of the file
+    """
+    return CarSalesController.get_sales_histogram_response(start_date, end_date, if_none_match)
+
+@router.get("/rank/{license_plate}", response_model=RankResult)
+def get_rank(license_plate: str = Path(..., min_length=6, max_length=10)):
+    """Get the in-order position (0-based) of a license plate"""
+    return CarSalesController.get_rank(license_plate)
+
+@router.get("/aggregates/", response_model=AggregatesResult, responses={304: {"description": "Not modified"}})
+@router.get("/aggregates", response_model=AggregatesResult, include_in_schema=False)
+def get_aggregates(
+    group_by: Optional[str] = Query(None, regex="^(brand|color|month)$"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Get count, sum, min, max and average price by brand, color and sale month
+    - **group_by**: Only this dimension (brand, color or month); all of them by default
+    - Maintained on every write, so the cost depends on the number of groups, not of sales
+    - With CAR_SALES_TREE_ENGINE=btree there are no in-memory indexes: O(n), a full scan of the file
+    """
+    return CarSalesController.get_aggregates_response(group_by, if_none_match)
+
+@router.get("/stats/", response_model=TreeStats, responses={304: {"description": "Not modified"}})
+@router.get("/stats", response_model=TreeStats, include_in_schema=False)
+def get_tree_statistics(
+    verify: bool = Query(False),
+    levels: bool = Query(False),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Get tree statistics
+    - Height, node count and leaf count are kept on the tree: O(1)
+    - **levels**: Also count the nodes per level, a full pass over the tree (cached until the next write)
+    - **verify**: Recompute the statistics in a full pass and check the cached values
+    - Without verify, If-None-Match with the last ETag gets a 304 while the tree is unchanged
+    """
+    if verify:
+        return CarSalesController.get_tree_statistics(verify)
+    return CarSalesController.get_tree_statistics_response(levels, if_none_match)
 
 @router.get("/path/{start_plate}/{end_plate}", response_model=List[CarSale])
-async def get_path_between_nodes(
+def get_path_between_nodes(
     start_plate: str = Path(..., min_length=6, max_length=10),
-    end_plate: str = Path(..., min_length=6, max_length=10)
+    end_plate: str = Path(..., min_length=6, max_length=10),
+    fast: bool = Query(False, description="Encode the stored records directly with the fast JSON encoder")
 ):
     """
     Get the path between two nodes
     - **start_plate**: Starting node license plate
     - **end_plate**: Ending node license plate
     """
+    if fast:
+        return CarSalesController.get_path_between_nodes_fast(start_plate, end_plate)
     return CarSalesController.get_path_between_nodes(start_plate, end_plate)
 
-@router.get("/longest-path/", response_model=List[CarSale])
-async def get_longest_path():
-    """Get the longest path in the tree"""
-    return CarSalesController.get_longest_path()
+@router.post("/path/batch/", response_model=List[PathResult])
+def get_paths_between_nodes(queries: List[PathQuery]):
+    """
+    Get the paths for several pairs of nodes in one request
+    - Each result reports whether both plates were found
+    """
+    return CarSalesController.get_paths_between_nodes(queries)
+
+@router.get("/longest-path/", response_model=List[CarSale], responses={304: {"description": "Not modified"}})
+@router.get("/longest-path", response_model=List[CarSale], include_in_schema=False)
+def get_longest_path(
+    fast: bool = Query(False, description="Encode the stored records directly with the fast JSON encoder"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Get the longest path in the tree
+    - If-None-Match with the last ETag gets a 304 while the tree is unchanged
+    """
+    if fast:
+        return CarSalesController.get_longest_path_fast(if_none_match)
+    return CarSalesController.get_longest_path_response(if_none_match)
+
+# Debe registrarse después de las rutas fijas: si no, "/aggregates" (sin barra final) y las demás
+# se tomarían como una placa. Las rutas fijas de un segmento también se sirven sin la barra
+@router.get("/{license_plate}", response_model=CarSale, responses={304: {"description": "Not modified"}})
+def get_car_sale(
+    license_plate: str = Path(..., min_length=6, max_length=10),
+    if_none_match: Optional[str] = Header(None)
+):
+    """
+    Get a car sale by license plate
+    - The ETag changes only when this plate is written; send it back in If-None-Match to get a 304
+    """
+    return CarSalesController.get_car_sale_response(license_plate, if_none_match)
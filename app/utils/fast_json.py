@@ -0,0 +1,50 @@
+from typing import Any, Iterable
+import json
+import os
+
+from ..models.records import CarRecord
+from .metrics import profile_span
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa json de la biblioteca estándar
+    orjson = None
+
+# Guardar en cada registro su JSON ya codificado: los recorridos siguientes solo concatenan
+# bytes, a cambio de ~150 bytes por registro servido al menos una vez
+CACHE_FRAGMENTS = os.getenv("CAR_SALES_JSON_FRAGMENT_CACHE", "0") == "1"
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON, same output as FastAPI's JSONResponse for plain data"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def record_payload(record: CarRecord) -> dict:
+    """The CarSale JSON object of a record, fields in model order, without building the model"""
+    return {
+        "license_plate": record.license_plate,
+        "brand": record.brand,
+        "color": record.color.value,
+        "price": record.price,
+        "sale_date": record.sale_date.isoformat(),
+        "id": record.id,
+    }
+
+
+def record_json(record: CarRecord) -> bytes:
+    """Encoded CarSale JSON of a record (reused from the record when fragment caching is on)"""
+    fragment = record.json
+    if fragment is None:
+        fragment = dumps(record_payload(record))
+        if CACHE_FRAGMENTS:
+            record.json = fragment
+    return fragment
+
+
+def records_json(records: Iterable[CarRecord]) -> bytes:
+    """JSON array of CarSale objects from stored records (already validated on write)"""
+    with profile_span("serialize"):
+        return b"[" + b",".join(record_json(record) for record in records) + b"]"
@@ -0,0 +1,114 @@
+from typing import Optional, Any, Callable, Hashable, Tuple
+from collections import OrderedDict
+import threading
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from .metrics import profile_span
+
+# Límites del caché de respuestas: pocas entradas y un tope de bytes (los recorridos son grandes)
+DEFAULT_MAX_ENTRIES = 32
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def make_etag(instance_id: str, version: int) -> str:
+    """Strong ETag for a tree (or key) version of one tree instance"""
+    return f'"{instance_id}-{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches the current ETag"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        # If-None-Match usa comparación débil: se ignora el prefijo W/
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def render_json(content: Any) -> bytes:
+    """Serialize a response body exactly like FastAPI's default JSON response"""
+    with profile_span("serialize"):
+        return JSONResponse(content=jsonable_encoder(content)).body
+
+
+class ResponseCache:
+    """Serialized response bodies, each valid only for the tree version it was built from"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[int, bytes]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: int) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, version: int, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (version, body)
+            self._size += len(body)
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+
+    def _discard(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def json_with_etag(body: bytes, etag: str) -> Response:
+    # no-cache: el cliente puede guardar la respuesta pero debe revalidarla con If-None-Match
+    return Response(content=body, media_type="application/json",
+                    headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def versioned_response(cache: ResponseCache, key: Hashable, instance_id: str, version: int,
+                       if_none_match: Optional[str], build: Callable[[], Any],
+                       render: Callable[[Any], bytes] = render_json,
+                       cache_version: Optional[int] = None) -> Response:
+    """304 if the client already has this version, else the (cached) serialized body
+
+    ``cache_version`` is the in-process version the cached body is valid for, when
+    it is not the ETag version (shared mode: the ETag follows the shared log).
+    """
+    etag = make_etag(instance_id, version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    if cache_version is None:
+        cache_version = version
+    body = cache.get(key, cache_version)
+    if body is None:
+        body = render(build())
+        cache.put(key, cache_version, body)
+    return json_with_etag(body, etag)
@@ -0,0 +1,289 @@
+from typing import Optional, List, Dict, Tuple, Callable, Iterator, Sequence
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import time
+
+# Límites (en segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in sorted(values):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Gauge:
+    """Value read when the metrics are scraped (no cost on the hot path)
+
+    With ``kind="counter"`` it exposes a monotonic count kept by someone else.
+    """
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float], kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+        self.kind = kind
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name} {_format_value(self.read())}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Por combinación de etiquetas: [conteo por bucket (el último es +Inf), suma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            series = [(labels, list(counts), total, count)
+                      for labels, (counts, total, count) in self._series.items()]
+        for label_values, counts, total, count in sorted(series):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class CountHistogram:
+    """Histogram of small non-negative integers for hot paths (no lock per observation)
+
+    Each thread increments its own array of exact counts; the arrays are added
+    up when the metrics are scraped. Values above ``max_value`` are counted as
+    ``max_value``.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[int], max_value: int = 1024):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.max_value = max_value
+        self._local = threading.local()
+        self._arrays: List[List[int]] = []
+        self._lock = threading.Lock()
+
+    def _thread_counts(self) -> List[int]:
+        counts = [0] * (self.max_value + 1)
+        self._local.counts = counts
+        with self._lock:
+            self._arrays.append(counts)
+        return counts
+
+    def observe(self, value: int):
+        try:
+            counts = self._local.counts
+        except AttributeError:
+            counts = self._thread_counts()
+        counts[value if value < self.max_value else self.max_value] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            arrays = list(self._arrays)
+        totals = [sum(column) for column in zip(*arrays)] if arrays else [0] * (self.max_value + 1)
+        cumulative = 0
+        value = 0
+        for bound in self.buckets + (float("inf"),):
+            while value < len(totals) and value <= bound:
+                cumulative += totals[value]
+                value += 1
+            yield f'{self.name}_bucket{{le="{_format_value(bound)}"}} {cumulative}'
+        yield f"{self.name}_sum {sum(v * count for v, count in enumerate(totals))}"
+        yield f"{self.name}_count {cumulative}"
+
+
+class MetricsRegistry:
+    """Metrics of this process, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Registrar dos veces (p. ej. al recargar un módulo) reutiliza la métrica existente
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def count_histogram(self, name: str, documentation: str, buckets: Sequence[int],
+                        max_value: int = 1024) -> CountHistogram:
+        return self._register(CountHistogram(name, documentation, buckets, max_value))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], float], kind: str = "gauge") -> Gauge:
+        gauge = Gauge(name, documentation, read, kind)
+        with self._lock:
+            # El valor se lee del objeto actual (p. ej. el árbol recién creado)
+            self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_COUNT = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by method, route and status", labels=("method", "route", "status")
+)
+REQUEST_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route", labels=("method", "route")
+)
+
+# Perfilado por petición: lista de (tramo, segundos) si la petición lo pidió, si no None
+_profile: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("car_sales_profile", default=None)
+
+# Cabecera que activa el perfilado de una petición (la respuesta trae Server-Timing)
+PROFILE_HEADER = b"x-profile"
+
+
+@contextmanager
+def profile_span(name: str):
+    """Time a block when the current request is being profiled (a context lookup otherwise)"""
+    spans = _profile.get()
+    if spans is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans.append((name, time.perf_counter() - started))
+
+
+def server_timing(spans: List[Tuple[str, float]], total: float) -> str:
+    """Server-Timing header value: spans with the same name are added up"""
+    durations: Dict[str, float] = {}
+    counts: Dict[str, int] = {}
+    for name, seconds in spans:
+        durations[name] = durations.get(name, 0.0) + seconds
+        counts[name] = counts.get(name, 0) + 1
+    parts = [
+        f'{name};dur={seconds * 1000:.3f};desc="x{counts[name]}"'
+        for name, seconds in durations.items()
+    ]
+    parts.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request count and latency per route, plus opt-in profiling
+
+    Routes are labelled with their template (``/api/car-sales/{license_plate}``),
+    never the raw path, to keep the number of series bounded. A request with an
+    ``X-Profile`` header gets a ``Server-Timing`` header with the time spent in
+    each instrumented span.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profiling = any(name == PROFILE_HEADER for name, _ in scope.get("headers", ()))
+        spans: Optional[List[Tuple[str, float]]] = [] if profiling else None
+        # Las rutas síncronas corren en el pool de hilos con una copia de este contexto
+        token = _profile.set(spans)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if spans is not None:
+                    timing = server_timing(spans, time.perf_counter() - started)
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"server-timing", timing.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _profile.reset(token)
+            elapsed = time.perf_counter() - started
+            # FastAPI deja en el scope la ruta que atendió la petición
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_COUNT.inc(scope["method"], route, str(status))
+            REQUEST_LATENCY.observe(elapsed, scope["method"], route)
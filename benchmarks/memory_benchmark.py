@@ -0,0 +1,66 @@
+"""Bytes per stored car sale: Pydantic model per node vs compact slotted records.
+
+Usage: python -m benchmarks.memory_benchmark [rows]
+"""
+from datetime import datetime, timedelta
+import json
+import random
+import sys
+import tracemalloc
+
+from app.models.schemas import CarSale
+from app.models.records import CarRecord
+from app.models.binary_tree import TreeNode
+
+BRANDS = ["Toyota", "Honda", "Ford", "Chevrolet", "Nissan",
+          "Volkswagen", "Hyundai", "Kia", "Mazda", "Subaru"]
+COLORS = ["red", "blue", "green", "black", "white", "silver", "gray"]
+
+
+class LegacyTreeNode:
+    """Node layout before compact storage: a __dict__ per node holding a CarSale"""
+    def __init__(self, data: CarSale):
+        self.data = data
+        self.left = None
+        self.right = None
+
+
+def generate_rows(count: int):
+    random.seed(42)
+    start = datetime(2025, 1, 1)
+    for i in range(count):
+        yield {
+            "id": i + 1,
+            "license_plate": f"P{i:08d}",
+            # Las marcas se leen del CSV: cada fila trae su propia cadena
+            "brand": "".join(random.choice(BRANDS)),
+            "color": random.choice(COLORS),
+            "price": round(random.uniform(10000, 50000), 2),
+            "sale_date": start + timedelta(seconds=random.randint(0, 365 * 86400)),
+        }
+
+
+def measure(build, rows):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    nodes = [build(row) for row in rows]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # La lista que retiene los nodos no forma parte del costo por registro
+    return (after - before - sys.getsizeof(nodes)) / len(nodes)
+
+
+def main(count: int = 100_000):
+    rows = list(generate_rows(count))
+    legacy = measure(lambda row: LegacyTreeNode(CarSale(**row)), rows)
+    compact = measure(lambda row: TreeNode(CarRecord.from_values(**row)), rows)
+    print(json.dumps({
+        "rows": count,
+        "legacy_bytes_per_record": round(legacy, 1),
+        "compact_bytes_per_record": round(compact, 1),
+        "reduction": round(1 - compact / legacy, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,322 @@
+"""Reproducible benchmarks for tree operations and HTTP endpoints.
+
+Usage: python -m benchmarks.run_benchmarks [--sizes 10000,100000,1000000]
+           [--distributions random,sorted,skewed] [--engines avl,bst,btree]
+           [--durability group] [--http-rows 10000] [--http-requests 500] [--no-http]
+           [--startup-rows 1000000] [--no-startup]
+           [--output results.json] [--baseline previous.json]
+
+Prints (or writes) JSON. With --baseline every timing also gets the ratio
+against the same entry of a previous run, to spot regressions between commits.
+"""
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.models.records import CarRecord
+from app.models.engines import create_tree
+from app.models.btree_store import UnsupportedOperation
+from app.models.persister import DURABILITY_MODES
+from app.models.persistence import open_snapshot
+from seed_data import DISTRIBUTIONS, iter_sample_cars
+
+# Operaciones por medición (sobre una muestra: recorrer 1M de placas no aporta)
+SAMPLE_OPS = 10_000
+# Un BST sin balanceo con placas ordenadas es una lista: más allá de esto tarda horas
+MAX_DEGENERATE_ROWS = 20_000
+# Peticiones concurrentes al medir el throughput HTTP
+HTTP_CONCURRENCY = 16
+SEED = 42
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(durations_ns):
+    """Latency percentiles (microseconds) and throughput of individually timed operations"""
+    durations_ns = sorted(durations_ns)
+    total_s = sum(durations_ns) / 1e9
+    return {
+        "ops": len(durations_ns),
+        "total_s": round(total_s, 4),
+        "ops_per_s": round(len(durations_ns) / total_s, 1) if total_s else None,
+        "p50_us": round(percentile(durations_ns, 0.50) / 1e3, 2),
+        "p95_us": round(percentile(durations_ns, 0.95) / 1e3, 2),
+        "p99_us": round(percentile(durations_ns, 0.99) / 1e3, 2),
+        "max_us": round(durations_ns[-1] / 1e3, 2),
+    }
+
+
+def time_each(fn, args_list):
+    clock = time.perf_counter_ns
+    durations = []
+    for args in args_list:
+        started = clock()
+        fn(*args)
+        durations.append(clock() - started)
+    return summarize(durations)
+
+
+def time_once(fn):
+    started = time.perf_counter()
+    fn()
+    return {"total_s": round(time.perf_counter() - started, 4)}
+
+
+def unless_unsupported(measure):
+    """Run a measurement, or report the operation as unsupported by the engine"""
+    try:
+        return measure()
+    except UnsupportedOperation:
+        return {"unsupported": True}
+
+
+def build_records(count: int, distribution: str):
+    return [
+        CarRecord.from_values(i, **car)
+        for i, car in enumerate(iter_sample_cars(count, distribution, seed=SEED), 1)
+    ]
+
+
+def bench_tree(engine: str, count: int, distribution: str, durability: str):
+    """Insert, find, traversal, stats, path and delete timings for one configuration"""
+    result = {"engine": engine, "rows": count, "distribution": distribution, "durability": durability}
+    if engine == "bst" and distribution == "sorted" and count > MAX_DEGENERATE_ROWS:
+        result["skipped"] = f"degenerate unbalanced tree above {MAX_DEGENERATE_ROWS} rows"
+        return result
+
+    records = build_records(count, distribution)
+    rng = random.Random(SEED)
+    workdir = tempfile.mkdtemp()
+    # El log (sin compactaciones durante la medición) es la persistencia más barata por escritura
+    os.environ.setdefault("CAR_SALES_WAL_COMPACTION_BYTES", str(1 << 40))
+    tree = create_tree(engine, csv_file=os.path.join(workdir, "car_sales.csv"), persistence="wal",
+                       durability=durability)
+
+    operations = {}
+    operations["insert"] = time_each(tree.insert, [(record,) for record in records])
+    result["height"] = tree.get_tree_stats().height
+    plates = [record.license_plate for record in records]
+    sample = rng.sample(plates, min(SAMPLE_OPS, count))
+    operations["find"] = time_each(tree.find, [(plate,) for plate in sample])
+    operations["find_missing"] = time_each(tree.find, [(plate + "X",) for plate in sample])
+    operations["traversal_inorder"] = time_once(lambda: sum(1 for _ in tree.iter_in_order()))
+    operations["traversal_postorder"] = unless_unsupported(
+        lambda: time_once(lambda: sum(1 for _ in tree.iter_post_order())))
+    operations["stats"] = time_each(tree.get_tree_stats, [()] * 100)
+    operations["stats_verify"] = time_once(tree.verify_tree_stats)
+    pairs = [(rng.choice(plates), rng.choice(plates)) for _ in range(min(SAMPLE_OPS, count))]
+    operations["path"] = unless_unsupported(lambda: time_each(tree.find_path, pairs))
+    operations["longest_path"] = unless_unsupported(lambda: time_once(tree.find_longest_path))
+    operations["delete"] = time_each(tree.delete, [(plate,) for plate in sample])
+    result["operations"] = operations
+    tree.close()
+    return result
+
+
+def bench_startup(engine: str, count: int, snapshot_format: str, durability: str):
+    """Cold start: time to open a tree over an existing snapshot of ``count`` rows"""
+    records = sorted(build_records(count, "random"), key=lambda record: record.license_plate)
+    csv_file = os.path.join(tempfile.mkdtemp(), "car_sales.csv")
+    open_snapshot(snapshot_format, csv_file).write(records)
+    del records
+    # Segundo en que empieza cada fase, según el aviso de progreso del motor
+    phases = {}
+    started = time.perf_counter()
+    tree = create_tree(engine, csv_file=csv_file, persistence="wal", snapshot_format=snapshot_format,
+                       durability=durability,
+                       progress=lambda phase, _: phases.setdefault(phase, time.perf_counter() - started))
+    total_s = time.perf_counter() - started
+    rows = len(tree)
+    tree.close()
+    return {
+        "engine": engine,
+        "rows": rows,
+        "snapshot_format": snapshot_format,
+        "total_s": round(total_s, 4),
+        "phases_started_s": {phase: round(at, 4) for phase, at in phases.items()},
+    }
+
+
+async def _http_requests(client, method: str, urls, concurrency: int):
+    """Latencies of every request, and the wall time of the whole batch"""
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+    clock = time.perf_counter_ns
+
+    async def one(url, body):
+        async with semaphore:
+            started = clock()
+            response = await client.request(method, url, json=body)
+            durations.append(clock() - started)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {url}: HTTP {response.status_code}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(url, body) for url, body in urls))
+    wall_s = time.perf_counter() - started
+    result = summarize(durations)
+    result["throughput_rps"] = round(len(urls) / wall_s, 1)
+    return result
+
+
+async def _bench_http(app, tree, rows: int, requests: int):
+    import httpx
+
+    records = build_records(rows, "random")
+    tree.bulk_insert([record.to_model() for record in records])
+    rng = random.Random(SEED)
+    plates = [record.license_plate for record in records]
+    new_cars = [
+        {**car, "sale_date": car["sale_date"].isoformat()}
+        for car in iter_sample_cars(requests, "random", seed=SEED + 1)
+        if car["license_plate"] not in tree
+    ]
+
+    prefix = "/api/car-sales"
+    endpoints = {
+        "get_car_sale": ("GET", [(f"{prefix}/{rng.choice(plates)}", None) for _ in range(requests)]),
+        "traversal_page": ("GET", [(f"{prefix}/traversal/inorder?offset={rng.randrange(rows)}&limit=100", None)
+                                   for _ in range(requests)]),
+        "stats": ("GET", [(f"{prefix}/stats/", None)] * requests),
+        "aggregates": ("GET", [(f"{prefix}/aggregates/", None)] * requests),
+        "path": ("GET", [(f"{prefix}/path/{rng.choice(plates)}/{rng.choice(plates)}", None)
+                         for _ in range(requests)]),
+        "longest_path": ("GET", [(f"{prefix}/longest-path/", None)] * requests),
+        "create_car_sale": ("POST", [(f"{prefix}/", car) for car in new_cars]),
+    }
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for name, (method, urls) in endpoints.items():
+            results[name] = {
+                "sequential": await _http_requests(client, method, urls, 1),
+            }
+            if method == "GET":
+                results[name]["concurrent"] = await _http_requests(client, method, urls, HTTP_CONCURRENCY)
+    return results
+
+
+def bench_http(rows: int, requests: int, durability: str):
+    """Endpoint latency and throughput in-process through httpx's ASGI transport"""
+    # El árbol usa el directorio actual: la app se importa dentro de uno temporal
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    os.chdir(tempfile.mkdtemp())
+    os.environ["CAR_SALES_PERSISTENCE"] = "wal"
+    os.environ["CAR_SALES_DURABILITY"] = durability
+    os.environ.setdefault("CAR_SALES_WAL_COMPACTION_BYTES", str(1 << 40))
+    from main import app
+    from app.controllers.car_sales_controller import car_sales_tree
+
+    return {
+        "rows": rows,
+        "requests_per_endpoint": requests,
+        "durability": durability,
+        "concurrency": HTTP_CONCURRENCY,
+        # El transporte ASGI no ejecuta el lifespan: se espera la carga antes de medir
+        "endpoints": asyncio.run(_bench_http(app, car_sales_tree.wait(), rows, requests)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """Add "<field>_ratio" (current / baseline) next to every timing found in both runs"""
+    if isinstance(current, dict) and isinstance(baseline, dict):
+        for key, value in list(current.items()):
+            if key not in baseline:
+                continue
+            if isinstance(value, (int, float)) and (key.endswith("_s") or key.endswith("_us")):
+                if baseline[key]:
+                    current[f"{key}_ratio"] = round(value / baseline[key], 3)
+            else:
+                compare(value, baseline[key])
+    elif isinstance(current, list) and isinstance(baseline, list):
+        # Las corridas del árbol se emparejan por configuración, no por posición
+        previous = {configuration(item): item for item in baseline}
+        for item in current:
+            if configuration(item) in previous:
+                compare(item, previous[configuration(item)])
+
+
+def configuration(entry):
+    return tuple(entry.get(key) for key in ("engine", "rows", "distribution", "snapshot_format"))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--distributions", default=",".join(DISTRIBUTIONS))
+    parser.add_argument("--engines", default="avl")
+    parser.add_argument("--durability", default="group", choices=DURABILITY_MODES)
+    parser.add_argument("--http-rows", type=int, default=10_000)
+    parser.add_argument("--http-requests", type=int, default=500)
+    parser.add_argument("--no-http", action="store_true")
+    parser.add_argument("--startup-rows", type=int, default=1_000_000)
+    parser.add_argument("--no-startup", action="store_true")
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": SEED,
+        },
+        "tree": [
+            bench_tree(engine, int(size), distribution, args.durability)
+            for engine in args.engines.split(",")
+            for size in args.sizes.split(",")
+            for distribution in args.distributions.split(",")
+        ],
+    }
+    if not args.no_startup:
+        results["startup"] = [
+            bench_startup(engine, args.startup_rows, snapshot_format, args.durability)
+            for engine in args.engines.split(",")
+            for snapshot_format in ("csv", "binary")
+        ]
+    if not args.no_http:
+        results["http"] = bench_http(args.http_rows, args.http_requests, args.durability)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
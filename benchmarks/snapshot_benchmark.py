@@ -0,0 +1,83 @@
+"""Startup and snapshot-write times: CSV loader vs binary mmap snapshot.
+
+Usage: python -m benchmarks.snapshot_benchmark [rows]
+"""
+from datetime import datetime, timedelta
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from app.models.schemas import CarSale
+from app.models.records import CarRecord
+from app.models.persistence import CsvSnapshot
+from app.models.snapshot import BinarySnapshot
+from app.models.engines import create_tree
+
+BRANDS = ["Toyota", "Honda", "Ford", "Chevrolet", "Nissan",
+          "Volkswagen", "Hyundai", "Kia", "Mazda", "Subaru"]
+COLORS = ["red", "blue", "green", "black", "white", "silver", "gray"]
+
+
+def generate_records(count: int):
+    random.seed(42)
+    start = datetime(2025, 1, 1)
+    return [
+        CarRecord.from_values(
+            i + 1, f"P{i:08d}", random.choice(BRANDS), random.choice(COLORS),
+            round(random.uniform(10000, 50000), 2),
+            start + timedelta(seconds=random.randint(0, 365 * 86400))
+        )
+        for i in range(count)
+    ]
+
+
+def timed(fn):
+    started = time.perf_counter()
+    fn()
+    return round(time.perf_counter() - started, 4)
+
+
+def legacy_csv_load(path: str):
+    """The original loader: DictReader + fromisoformat + a Pydantic model per row"""
+    with open(path, 'r') as f:
+        for row in csv.DictReader(f):
+            CarSale(
+                id=int(row['id']),
+                license_plate=row['license_plate'],
+                brand=row['brand'],
+                color=row['color'],
+                price=float(row['price']),
+                sale_date=datetime.fromisoformat(row['sale_date'])
+            )
+
+
+def main(count: int = 100_000):
+    records = generate_records(count)
+    workdir = tempfile.mkdtemp()
+    csv_path = os.path.join(workdir, "car_sales.csv")
+    csv_snapshot = CsvSnapshot(csv_path)
+    binary_snapshot = BinarySnapshot(os.path.join(workdir, "car_sales.snap"))
+
+    results = {
+        "rows": count,
+        "write_csv_s": timed(lambda: csv_snapshot.write(records)),
+        "write_binary_s": timed(lambda: binary_snapshot.write(records)),
+        "read_csv_legacy_models_s": timed(lambda: legacy_csv_load(csv_path)),
+        "read_csv_records_s": timed(csv_snapshot.read),
+        "read_binary_records_s": timed(binary_snapshot.read),
+        "startup_tree_csv_s": timed(lambda: create_tree(
+            csv_file=csv_path, persistence="csv", snapshot_format="csv")),
+        "startup_tree_binary_s": timed(lambda: create_tree(
+            csv_file=csv_path, persistence="csv", snapshot_format="binary")),
+        "csv_bytes": os.path.getsize(csv_path),
+        "binary_bytes": os.path.getsize(binary_snapshot.path),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -1,6 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, JSONResponse
 from app.routers import car_sales
+from app.controllers.car_sales_controller import car_sales_tree
+from app.models.btree_store import UnsupportedOperation
+from app.models.loader import TreeNotReady
+from app.utils.metrics import REGISTRY, MetricsMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # La carga corre en segundo plano: el servidor atiende enseguida y /ready informa el avance
+    car_sales_tree.start()
+    yield
+    # Al apagar: persistir las escrituras que el hilo de fondo aún no volcó
+    await run_in_threadpool(car_sales_tree.close)
+
 
 app = FastAPI(
     title="Car Sales Binary Tree API",
@@ -13,6 +30,7 @@ app = FastAPI(
     license_info={
         "name": "MIT",
     },
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -24,9 +42,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Latencia y conteo de peticiones por ruta (X-Profile: 1 agrega Server-Timing a la respuesta)
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(car_sales.router)
 
+@app.exception_handler(UnsupportedOperation)
+async def unsupported_operation(request, exc: UnsupportedOperation):
+    # Consultas que el motor configurado no puede responder (p. ej. caminos en el B-tree)
+    return JSONResponse(status_code=501, content={"detail": str(exc)})
+
+@app.exception_handler(TreeNotReady)
+async def tree_not_ready(request, exc: TreeNotReady):
+    # El árbol no terminó de cargar dentro de CAR_SALES_READY_TIMEOUT
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 @app.get("/", tags=["Root"])
 async def root():
     return {
@@ -34,3 +65,14 @@ async def root():
         "docs": "/docs",
         "redoc": "/redoc"
     }
+
+@app.get("/ready", tags=["Root"], responses={503: {"description": "Still loading"}})
+async def ready():
+    """Readiness probe: 200 once the car sales are loaded, 503 with the loading progress before"""
+    status = car_sales_tree.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/metrics", tags=["Root"], response_class=PlainTextResponse)
+def metrics():
+    """Metrics of this process in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
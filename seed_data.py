@@ -1,42 +1,77 @@
 from app.models.schemas import CarSale, CarSaleCreate
-from app.models.binary_tree import BinarySearchTree
+from app.models.engines import create_tree
 from datetime import datetime, timedelta
+from typing import List, Dict, Any, Iterator, Optional
 import random
 
-def generate_sample_cars():
-    """Genera 10 autos de ejemplo para la venta"""
-    # Lista de marcas y colores disponibles
-    brands = ["Toyota", "Honda", "Ford", "Chevrolet", "Nissan", 
-              "Volkswagen", "Hyundai", "Kia", "Mazda", "Subaru"]
-    
-    colors = ["red", "blue", "green", "black", "white", "silver", "gray"]
-    
-    # Generar 10 autos de ejemplo
-    sample_cars = []
-    for i in range(1, 11):
-        # Generar placa aleatoria (ejemplo: ABC123, XYZ789)
-        letters = ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ', k=3))
-        numbers = ''.join(random.choices('0123456789', k=3))
-        license_plate = f"{letters}{numbers}"
-        
-        # Crear datos del auto
-        car_data = {
+# Marcas y colores disponibles
+BRANDS = ["Toyota", "Honda", "Ford", "Chevrolet", "Nissan",
+          "Volkswagen", "Hyundai", "Kia", "Mazda", "Subaru"]
+
+COLORS = ["red", "blue", "green", "black", "white", "silver", "gray"]
+
+# Distribuciones de placas: "random" (orden aleatorio), "sorted" (orden creciente, el peor
+# caso de un BST sin balanceo) y "skewed" (la mayoría concentradas en un rango pequeño)
+DISTRIBUTIONS = ("random", "sorted", "skewed")
+
+# Placas de 3 letras y 4 dígitos: 26**3 * 10**4 placas distintas
+PLATE_SPACE = 26 ** 3 * 10 ** 4
+
+
+def plate_for(number: int) -> str:
+    """License plate for a number in [0, PLATE_SPACE), e.g. 0 -> AAA0000"""
+    prefix, digits = divmod(number, 10 ** 4)
+    letters = ""
+    for _ in range(3):
+        prefix, letter = divmod(prefix, 26)
+        letters = chr(ord("A") + letter) + letters
+    return f"{letters}{digits:04d}"
+
+
+def sample_plates(count: int, distribution: str = "random", rng: random.Random = random) -> List[str]:
+    """Unique license plates in insertion order for the given distribution"""
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution: {distribution}")
+    if distribution == "skewed":
+        # 80% de las placas en una ventana de 2*count números, el resto en todo el espacio
+        hot = rng.sample(range(2 * count), count * 8 // 10)
+        numbers = set(hot)
+        while len(numbers) < count:
+            numbers.add(rng.randrange(PLATE_SPACE))
+        numbers = list(numbers)
+        rng.shuffle(numbers)
+    else:
+        numbers = rng.sample(range(PLATE_SPACE), count)
+        if distribution == "sorted":
+            numbers.sort()
+    return [plate_for(number) for number in numbers]
+
+
+def iter_sample_cars(count: int = 10, distribution: str = "random",
+                     seed: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Genera los datos de `count` autos (reproducibles si se indica `seed`)"""
+    rng = random.Random(seed)
+    # Con semilla las fechas parten de un día fijo para que los datos sean idénticos entre corridas
+    today = datetime(2025, 1, 1) if seed is not None else datetime.now()
+    for license_plate in sample_plates(count, distribution, rng):
+        yield {
             "license_plate": license_plate,
-            "brand": random.choice(brands),
-            "color": random.choice(colors),
-            "price": round(random.uniform(10000, 50000), 2),
-            "sale_date": datetime.now() - timedelta(days=random.randint(0, 365))
+            "brand": rng.choice(BRANDS),
+            "color": rng.choice(COLORS),
+            "price": round(rng.uniform(10000, 50000), 2),
+            "sale_date": today - timedelta(days=rng.randint(0, 365))
         }
-        
-        # Crear instancia de CarSaleCreate (sin ID)
-        car = CarSaleCreate(**car_data)
-        sample_cars.append(car)
-    
-    return sample_cars
+
+
+def generate_sample_cars(count: int = 10, distribution: str = "random",
+                         seed: Optional[int] = None) -> List[CarSaleCreate]:
+    """Genera autos de ejemplo para la venta (10 por defecto)"""
+    # Crear instancias de CarSaleCreate (sin ID)
+    return [CarSaleCreate(**car_data) for car_data in iter_sample_cars(count, distribution, seed)]
 
 def seed_database():
     """Agrega los autos de ejemplo al árbol"""
-    tree = BinarySearchTree()
+    tree = create_tree()
     sample_cars = generate_sample_cars()
     
     print("Agregando autos de ejemplo...")
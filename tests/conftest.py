@@ -0,0 +1,26 @@
+import os
+import sys
+from typing import List
+
+import pytest
+
+# Los tests importan `app` y `seed_data` desde la raíz del proyecto
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.records import CarRecord  # noqa: E402
+from seed_data import iter_sample_cars  # noqa: E402
+
+
+def make_records(count: int, seed: int = 1) -> List[CarRecord]:
+    """Deterministic sample records with unique plates, ids starting at 1"""
+    return [CarRecord.from_values(i, **car) for i, car in enumerate(iter_sample_cars(count, seed=seed), 1)]
+
+
+@pytest.fixture
+def records() -> List[CarRecord]:
+    return make_records(300)
+
+
+@pytest.fixture
+def csv_file(tmp_path) -> str:
+    return str(tmp_path / "car_sales.csv")
@@ -0,0 +1,45 @@
+import math
+import random
+
+from app.models.aggregates import SalesAggregates, summarize_records
+
+
+def groups(summary):
+    """(dimension, key, count, min, max, sum) per group, brands compared without case"""
+    rows = []
+    for dimension, value in summary.items():
+        for group in (value if isinstance(value, list) else [value]):
+            rows.append((dimension, group['key'].lower(), group['count'], group['min'], group['max'], group['sum']))
+    return sorted(rows)
+
+
+def test_incremental_matches_one_pass(records):
+    rng = random.Random(7)
+    aggregates = SalesAggregates()
+    live = {}
+    for _ in range(3000):
+        record = rng.choice(records)
+        plate = record.license_plate
+        if plate in live:
+            aggregates.remove(live.pop(plate))
+        else:
+            record = record.with_changes({'price': float(rng.randrange(1000, 50000))})
+            live[plate] = record
+            aggregates.add(record)
+
+    expected = groups(summarize_records(live.values()))
+    actual = groups(aggregates.summary())
+    assert [row[:5] for row in actual] == [row[:5] for row in expected]
+    for got, want in zip(actual, expected):
+        assert math.isclose(got[5], want[5], abs_tol=0.05)
+
+
+def test_brand_label_follows_remaining_rows(records):
+    first = records[0]
+    other = next(r for r in records[1:] if r.brand == first.brand).with_changes({'brand': first.brand.upper()})
+    aggregates = SalesAggregates()
+    aggregates.add(first)
+    aggregates.add(other)
+    assert aggregates.summary('brand')['brand'][0]['key'] == first.brand
+    aggregates.remove(first)
+    assert aggregates.summary('brand')['brand'][0]['key'] == first.brand.upper()
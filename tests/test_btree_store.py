@@ -0,0 +1,82 @@
+import os
+import random
+
+from app.models.btree_store import BTreeStore
+from app.models.records import CarRecord
+from tests.conftest import make_records
+
+
+def check_contents(store, expected):
+    """Plate order, lookups, ranks and page counts against a dict of plate -> record"""
+    plates = sorted(expected)
+    assert len(store) == len(plates)
+    assert [record.license_plate for record in store.iter_records_from(0)] == plates
+    for plate in random.Random(0).sample(plates, min(50, len(plates))):
+        assert store.find(plate).price == expected[plate].price
+        assert store.rank(plate) == plates.index(plate)
+    assert store.verify_tree_stats().verified
+
+
+def test_splits_deletes_reopen_and_compact(csv_file):
+    records = make_records(5000)
+    rng = random.Random(3)
+    rng.shuffle(records)
+    # Caché de pocas páginas: las divisiones y lecturas pasan por disco
+    store = BTreeStore(csv_file=csv_file, durability="periodic", cache_pages=8)
+    expected = {}
+    for record in records:
+        store.insert(record)
+        expected[record.license_plate] = record
+    assert store.height >= 2
+    leaves_before = store.get_tree_stats().leaf_count
+    assert leaves_before > 1
+
+    for record in records[::3]:
+        assert store.delete(record.license_plate)
+        del expected[record.license_plate]
+    for record in records[1::7]:
+        if record.license_plate in expected:
+            store.update(record.license_plate, {"price": 99.5})
+            expected[record.license_plate] = record.with_changes({"price": 99.5})
+    check_contents(store, expected)
+    store.close()
+
+    reopened = BTreeStore(csv_file=csv_file, cache_pages=8)
+    check_contents(reopened, expected)
+    # El borrado es perezoso: compact() reescribe el archivo con menos hojas
+    reopened.compact()
+    assert reopened.get_tree_stats().leaf_count < leaves_before
+    check_contents(reopened, expected)
+    reopened.close()
+
+    compacted = BTreeStore(csv_file=csv_file, cache_pages=8)
+    try:
+        check_contents(compacted, expected)
+    finally:
+        compacted.close()
+
+
+def test_interrupted_checkpoint_is_replayed_from_the_journal(csv_file):
+    records = make_records(500)
+    store = BTreeStore(csv_file=csv_file, durability="fsync")
+    for record in records:
+        store.insert(record)
+    extra = CarRecord.from_values(len(records) + 1, "ZZZ9999", "Kia", "red", 1.0, records[0].sale_date)
+
+    # Caída después de escribir el journal y antes de escribir las páginas en su lugar
+    with store._lock:
+        store._insert_record(extra)
+    with store._io_lock, store._lock:
+        pages = {page_id: page.encode() for page_id, page in store._dirty.items()}
+        pages[0] = store._encode_header()
+        store._write_journal(pages)
+    os.close(store._fd)
+
+    recovered = BTreeStore(csv_file=csv_file)
+    try:
+        assert "ZZZ9999" in recovered
+        assert len(recovered) == len(records) + 1
+        assert recovered.verify_tree_stats().verified
+        assert not os.path.exists(recovered.journal_file)
+    finally:
+        recovered.close()
@@ -0,0 +1,32 @@
+import random
+from bisect import insort
+
+from app.models import indexes
+from app.models.indexes import SortedIndex
+
+
+def test_sorted_index_matches_a_sorted_list(monkeypatch):
+    # Buckets diminutos: las divisiones y los buckets vaciados ocurren a menudo
+    monkeypatch.setattr(indexes, "SORTED_BUCKET_SIZE", 4)
+    rng = random.Random(7)
+    index = SortedIndex()
+    index.load((float(rng.randrange(100)), f"P{i:04d}") for i in range(50))
+    expected = sorted((key, plate) for bucket in index._buckets for key, plate in bucket)
+
+    for step in range(3000):
+        if expected and rng.random() < 0.45:
+            key, plate = expected.pop(rng.randrange(len(expected)))
+            index.remove(key, plate)
+        else:
+            entry = (float(rng.randrange(100)), f"Q{step:05d}")
+            insort(expected, entry)
+            index.add(*entry)
+        # Quitar algo que no está no cambia nada
+        index.remove(100.0, "missing")
+
+        low = rng.choice([None, float(rng.randrange(-5, 105))])
+        high = rng.choice([None, float(rng.randrange(-5, 105))])
+        matches = [plate for key, plate in expected
+                   if (low is None or key >= low) and (high is None or key <= high)]
+        assert list(index.range(low, high)) == matches
+        assert index.count_range(low, high) == len(matches)
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+
+import pytest
+
+from app.models.engines import create_tree
+from app.models.persistence import CsvSnapshot, WriteAheadLog
+from app.models.persister import BackgroundPersister
+from tests.conftest import make_records
+
+
+def plates(tree):
+    return [sale.license_plate for sale in tree.iter_in_order()]
+
+
+def test_wal_replay_after_reopen(csv_file, records):
+    tree = create_tree("avl", csv_file=csv_file, persistence="wal", durability="fsync")
+    for record in records:
+        tree.insert(record.to_model())
+    tree.update(records[0].license_plate, {"price": 1234.5})
+    tree.delete(records[1].license_plate)
+    # Sin close ni save_tree (como tras una caída): todo está solo en el log
+    assert os.path.getsize(os.path.splitext(csv_file)[0] + ".log") > 0
+
+    reopened = create_tree("avl", csv_file=csv_file, persistence="wal", durability="fsync")
+    try:
+        expected = sorted(record.license_plate for record in records[2:]) + [records[0].license_plate]
+        assert plates(reopened) == sorted(expected)
+        assert reopened.find(records[0].license_plate).price == 1234.5
+        assert reopened.find(records[1].license_plate) is None
+    finally:
+        reopened.close()
+        tree.close()
+
+
+def test_compaction_racing_with_writes(csv_file, monkeypatch):
+    # Umbral pequeño: el log rota y se compacta muchas veces mientras los hilos escriben
+    monkeypatch.setenv("CAR_SALES_WAL_COMPACTION_BYTES", "4096")
+    records = make_records(2000)
+    tree = create_tree("avl", csv_file=csv_file, persistence="wal", durability="group")
+
+    def write(chunk):
+        for record in chunk:
+            tree.insert(record.to_model())
+        for record in chunk[::3]:
+            tree.delete(record.license_plate)
+
+    threads = [threading.Thread(target=write, args=(records[i::4],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    expected = sorted(plates(tree))
+    tree.close()
+
+    deleted = {record.license_plate for i in range(4) for record in records[i::4][::3]}
+    assert expected == sorted(record.license_plate for record in records if record.license_plate not in deleted)
+    reopened = create_tree("avl", csv_file=csv_file, persistence="wal", durability="group")
+    try:
+        assert plates(reopened) == expected
+    finally:
+        reopened.close()
+
+
+class SlowSnapshot(CsvSnapshot):
+    """CSV snapshot whose writes from the compactor thread take a while"""
+
+    def write(self, records):
+        records = list(records)
+        if threading.current_thread() is not threading.main_thread():
+            time.sleep(0.2)
+        super().write(records)
+
+
+def test_checkpoint_during_compaction(tmp_path):
+    snapshot = SlowSnapshot(str(tmp_path / "car_sales.csv"))
+    wal = WriteAheadLog(str(tmp_path / "car_sales.log"), snapshot, compaction_threshold=1)
+    first, second, third = make_records(3)
+    # Umbral de 1 byte: cada escritura rota el log y arranca una compactación lenta
+    wal.append_upsert(first)
+    appenders = []
+    wait_for_compaction = wal.wait_for_compaction
+
+    def wait_then_append():
+        wait_for_compaction()
+        # Como el hilo del persistidor: una escritura ya aplicada al árbol llega al log justo ahora
+        appender = threading.Thread(target=wal.append_upsert, args=(second,))
+        appender.start()
+        appender.join(0.5)
+        appenders.append(appender)
+
+    wal.wait_for_compaction = wait_then_append
+    wal.checkpoint([first, second, third])
+    wal.wait_for_compaction = wait_for_compaction
+    appenders[0].join()
+    wal.close()
+
+    # Ninguna compactación vieja puede pisar el snapshot del checkpoint
+    saved = {record.license_plate for record in snapshot.read()}
+    saved.update(entry["data"]["license_plate"] for entry in wal.replay() if entry["op"] == "upsert")
+    assert saved == {first.license_plate, second.license_plate, third.license_plate}
+
+
+@pytest.mark.parametrize("persistence", ["csv", "wal"])
+@pytest.mark.parametrize("durability", ["group", "periodic"])
+def test_pending_writes_flushed_on_close(csv_file, records, monkeypatch, persistence, durability):
+    if durability == "periodic":
+        # Nada se persiste solo durante el test: lo pendiente tiene que salir en close()
+        monkeypatch.setenv("CAR_SALES_FLUSH_INTERVAL", "60")
+        monkeypatch.setenv("CAR_SALES_FLUSH_BATCH_SIZE", "100000")
+    tree = create_tree("avl", csv_file=csv_file, persistence=persistence, durability=durability)
+    for record in records:
+        tree.insert(record.to_model())
+    if durability == "periodic":
+        assert tree.pending_writes > 0
+    tree.close()
+    assert tree.pending_writes == 0
+
+    reopened = create_tree("avl", csv_file=csv_file, persistence=persistence, durability="fsync")
+    try:
+        assert plates(reopened) == sorted(record.license_plate for record in records)
+    finally:
+        reopened.close()
+
+
+def test_failed_flush_reaches_waiters_and_is_retried():
+    flushed = []
+    disk_ok = threading.Event()
+
+    def flush(entries):
+        if not disk_ok.is_set():
+            raise OSError("disk full")
+        flushed.extend(entries)
+
+    persister = BackgroundPersister(flush, "group")
+    try:
+        ticket = persister.submit(["a"])
+        with pytest.raises(OSError):
+            persister.wait(ticket)
+        disk_ok.set()
+        # Las entradas del lote fallido vuelven a la cola y salen en el siguiente
+        persister.wait(persister.submit(["b"]))
+        assert flushed == ["a", "b"]
+        assert persister.pending == 0
+    finally:
+        persister.close()
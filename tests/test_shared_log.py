@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from app.models.engines import create_tree
+from app.models.persistence import SharedWriteAheadLog, CsvSnapshot
+
+# Segundos antes de dar por bloqueada una operación
+DEADLOCK_TIMEOUT = 30
+
+
+def run_with_timeout(target):
+    """Run target on a thread; fail instead of hanging the suite if it deadlocks"""
+    errors = []
+
+    def run():
+        try:
+            target()
+        except BaseException as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(DEADLOCK_TIMEOUT)
+    assert not thread.is_alive(), "deadlock"
+    if errors:
+        raise errors[0]
+
+
+def test_checkpoint_during_compaction(csv_file, records, monkeypatch):
+    # Con un umbral de 1 byte cada escritura rota el log y arranca una compactación
+    monkeypatch.setenv("CAR_SALES_WAL_COMPACTION_BYTES", "1")
+    tree = create_tree("avl", csv_file=csv_file, persistence="shared", durability="fsync")
+
+    def insert_and_save():
+        for record in records[:100]:
+            tree.insert(record.to_model())
+            tree.save_tree()
+
+    run_with_timeout(insert_and_save)
+    run_with_timeout(tree.close)
+
+    reopened = create_tree("avl", csv_file=csv_file, persistence="shared", durability="fsync")
+    try:
+        assert [sale.license_plate for sale in reopened.iter_in_order()] == sorted(
+            record.license_plate for record in records[:100])
+    finally:
+        reopened.close()
+
+
+def test_exclusive_inside_shared_is_rejected(tmp_path):
+    log = SharedWriteAheadLog(str(tmp_path / "car_sales.log"), CsvSnapshot(str(tmp_path / "car_sales.csv")))
+    try:
+        with log.shared():
+            with pytest.raises(RuntimeError):
+                with log.exclusive():
+                    pass
+        # Compartido dentro de exclusivo sigue permitido
+        with log.exclusive():
+            with log.shared():
+                pass
+    finally:
+        log.close()
+
+
+def test_workers_agree_on_etag_versions(csv_file, records):
+    # Dos árboles sobre los mismos archivos hacen de dos workers
+    first = create_tree("avl", csv_file=csv_file, persistence="shared", durability="fsync")
+    second = create_tree("avl", csv_file=csv_file, persistence="shared", durability="fsync")
+    try:
+        assert first.etag_scope == second.etag_scope
+        first.bulk_insert([record.to_model() for record in records[:50]])
+        second.insert(records[50].to_model())
+        first.sync()
+        assert first.etag_version == second.etag_version
+        assert first.version != second.version
+
+        # Un checkpoint reinicia el log pero no el contenido: la posición se mantiene
+        before = first.etag_version
+        first.save_tree()
+        second.sync()
+        assert first.etag_version == second.etag_version == before
+        first.delete(records[0].license_plate)
+        second.sync()
+        assert first.etag_version == second.etag_version > before
+        plate = records[1].license_plate
+        assert first.find_versioned(plate)[1] == second.find_versioned(plate)[1]
+    finally:
+        first.close()
+        second.close()
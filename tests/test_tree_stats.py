@@ -0,0 +1,63 @@
+from app.models.binary_tree import FIND_NODES_VISITED
+from app.models.engines import create_tree
+
+
+def cached_fields(root, tree):
+    return {id(node): (node.height, node.size, node.leaves, node.diameter)
+            for node in tree._iter_post_order_nodes(root)}
+
+
+def test_verify_repairs_drift_without_touching_published_nodes(csv_file, records):
+    tree = create_tree("avl", csv_file=csv_file, durability="fsync")
+    try:
+        tree.bulk_insert([record.to_model() for record in records])
+        old_root = tree.root
+        old_root.size += 5
+        old_root.left.size += 5
+        before = cached_fields(old_root, tree)
+
+        stats = tree.verify_tree_stats()
+
+        assert stats.verified is False
+        assert stats.total_nodes == len(records)
+        # Los lectores que aún tienen la raíz anterior no ven ningún cambio
+        assert cached_fields(old_root, tree) == before
+        assert tree.root is not old_root
+        assert tree.root.size == len(records)
+        # Los subárboles sin errores se comparten
+        assert tree.root.right is old_root.right
+        assert tree.verify_tree_stats().verified is True
+    finally:
+        tree.close()
+
+
+def test_stats_levels_only_on_request(csv_file, records):
+    tree = create_tree("avl", csv_file=csv_file, durability="fsync")
+    try:
+        tree.bulk_insert([record.to_model() for record in records])
+        assert tree.get_tree_stats().nodes_per_level is None
+        assert sum(tree.get_tree_stats(levels=True).nodes_per_level.values()) == len(records)
+    finally:
+        tree.close()
+
+
+def lookups_observed():
+    count = [line for line in FIND_NODES_VISITED.samples() if line.startswith(f"{FIND_NODES_VISITED.name}_count")]
+    return int(count[0].split()[-1])
+
+
+def test_only_lookups_feed_the_find_histogram(csv_file, records):
+    tree = create_tree("avl", csv_file=csv_file, durability="fsync")
+    try:
+        tree.bulk_insert([record.to_model() for record in records])
+        before = lookups_observed()
+        # Las búsquedas internas de las escrituras y de "in" no cuentan
+        assert records[0].license_plate in tree
+        tree.update(records[0].license_plate, {"price": 1.0})
+        tree.delete(records[1].license_plate)
+        assert lookups_observed() == before
+        tree.find(records[0].license_plate)
+        tree.find_versioned(records[1].license_plate)
+        assert lookups_observed() == before + 2
+    finally:
+        tree.close()